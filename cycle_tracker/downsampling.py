@@ -0,0 +1,135 @@
+import numpy as np
+
+
+# Bounds for the `max_points` query parameter on trend endpoints
+MIN_POINTS = 3
+MAX_POINTS = 1000
+
+DOWNSAMPLE_METHODS = ('lttb', 'average')
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last points and, for each bucket in between, the
+    point forming the largest triangle with the previously kept point and
+    the average of the next bucket. Peaks and dips survive, unlike plain
+    averaging. Returns the indices of the kept points.
+    """
+    n = len(x)
+    if threshold >= n or threshold < MIN_POINTS:
+        return np.arange(n)
+
+    every = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    a = 0
+
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third vertex of the triangle
+        avg_start = int(np.floor((i + 1) * every)) + 1
+        avg_end = min(int(np.floor((i + 2) * every)) + 1, n)
+        avg_x = x[avg_start:avg_end].mean()
+        avg_y = y[avg_start:avg_end].mean()
+
+        # Candidates in the current bucket
+        start = int(np.floor(i * every)) + 1
+        end = int(np.floor((i + 1) * every)) + 1
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) -
+            (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+
+    selected[-1] = n - 1
+    return selected
+
+
+def bucket_average(x, y, buckets):
+    """Split the series into equal-count buckets and return the mean x and y of each."""
+    n = len(x)
+    if buckets >= n:
+        return x.astype(float), y.astype(float)
+
+    starts = np.linspace(0, n, buckets, endpoint=False).astype(np.int64)
+    counts = np.diff(np.append(starts, n))
+    return (
+        np.add.reduceat(x, starts) / counts,
+        np.add.reduceat(y, starts) / counts,
+    )
+
+
+def downsample_series(dates, values, max_points=None, method='lttb'):
+    """
+    Turn parallel sequences of dates and values into [{'date', 'value'}, ...]
+    with at most `max_points` points. With no `max_points` every point is kept.
+    """
+    if len(dates) == 0:
+        return []
+
+    if not max_points or len(dates) <= max_points:
+        return [
+            {'date': d, 'value': v}
+            for d, v in zip(dates, values)
+        ]
+
+    # Work on day numbers so both methods can do plain float math on x
+    x = np.asarray(dates, dtype='datetime64[D]').astype(np.int64)
+    y = np.asarray(values, dtype=float)
+
+    if method == 'average':
+        x, y = bucket_average(x, y, max_points)
+        x = np.rint(x).astype(np.int64)
+    else:
+        keep = lttb(x, y, max_points)
+        x, y = x[keep], y[keep]
+
+    out_dates = x.astype('datetime64[D]').tolist()
+    out_values = np.round(y, 2).tolist()
+    return [
+        {'date': d, 'value': v}
+        for d, v in zip(out_dates, out_values)
+    ]
+
+
+def downsample_columns(rows, fields, max_points=None, method='lttb'):
+    """
+    Downsample several metrics fetched with values_list('date', *fields).
+    Returns {field: [{'date', 'value'}, ...]}.
+    """
+    if not rows:
+        return {field: [] for field in fields}
+
+    columns = list(zip(*rows))
+    dates = columns[0]
+    return {
+        field: downsample_series(dates, columns[i + 1], max_points, method)
+        for i, field in enumerate(fields)
+    }
+
+
+def parse_downsample_params(query_params):
+    """
+    Read `max_points` and `downsample` from request query params.
+    Returns (max_points, method); raises ValueError with a user-facing message.
+    """
+    max_points = query_params.get('max_points')
+    method = query_params.get('downsample', 'lttb')
+
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"downsample must be one of: {', '.join(DOWNSAMPLE_METHODS)}")
+
+    if max_points in (None, ''):
+        return None, method
+
+    try:
+        max_points = int(max_points)
+    except (TypeError, ValueError):
+        raise ValueError("max_points must be an integer")
+
+    if max_points < MIN_POINTS or max_points > MAX_POINTS:
+        raise ValueError(f"max_points must be between {MIN_POINTS} and {MAX_POINTS}")
+
+    return max_points, method
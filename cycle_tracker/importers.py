@@ -0,0 +1,225 @@
+import csv
+import re
+from datetime import datetime
+from .models import Period, WellnessLog
+from .serializers import WellnessLogBulkEntrySerializer
+
+
+# Rows written per bulk statement
+IMPORT_BATCH_SIZE = 1000
+
+# Errors kept in the report; the rest are only counted
+MAX_REPORTED_ERRORS = 500
+
+IMPORT_KINDS = ('periods', 'wellness')
+
+DATE_FORMATS = ('%Y-%m-%d', '%Y/%m/%d', '%m/%d/%Y', '%d.%m.%Y')
+
+
+def normalize_header(header):
+    """'Sleep (hours)' -> 'sleephours', 'start_date' -> 'startdate'."""
+    return re.sub(r'[^a-z0-9]', '', (header or '').lower())
+
+
+# Header spellings used by tracker exports -> Period field
+PERIOD_HEADER_ALIASES = {
+    'startdate': 'start_date',
+    'start': 'start_date',
+    'periodstart': 'start_date',
+    'periodstartdate': 'start_date',
+    'firstday': 'start_date',
+    'enddate': 'end_date',
+    'end': 'end_date',
+    'periodend': 'end_date',
+    'periodenddate': 'end_date',
+    'lastday': 'end_date',
+    'symptoms': 'symptoms',
+    'medication': 'medication',
+    'medications': 'medication',
+}
+
+# Header spellings used by tracker/wearable exports -> WellnessLog field.
+# Every WellnessLog input field is also accepted under its own name.
+WELLNESS_HEADER_ALIASES = {
+    **{
+        normalize_header(f.name): f.name
+        for f in WellnessLog._meta.concrete_fields
+        if f.name not in WellnessLogBulkEntrySerializer.Meta.exclude
+    },
+    'day': 'date',
+    'stepcount': 'steps',
+    'sleep': 'sleep_hours',
+    'sleepduration': 'sleep_hours',
+    'hoursofsleep': 'sleep_hours',
+    'mood': 'mood_level',
+    'energy': 'energy_level',
+    'stress': 'stress_level',
+    'anxiety': 'anxiety_level',
+    'pain': 'pain_level',
+    'focus': 'focus_level',
+    'exercise': 'exercise_minutes',
+    'workoutminutes': 'exercise_minutes',
+    'activeminutes': 'exercise_minutes',
+    'activecalories': 'calories_burned',
+    'caloriesout': 'calories_burned',
+    'caloriesin': 'calories_intake',
+    'water': 'water_intake_ml',
+    'waterml': 'water_intake_ml',
+    'caffeine': 'caffeine_intake',
+    'alcohol': 'alcohol_intake',
+    'nutrition': 'nutrition_quality',
+}
+
+
+def parse_date(value):
+    """Parse the date formats trackers commonly export; ISO datetimes keep only the date."""
+    value = value.strip()
+    if len(value) > 10 and value[4] == '-' and value[10] in 'T ':
+        value = value[:10]
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognized date '{value}'")
+
+
+class TrackerCSVImporter:
+    """
+    Import a CSV export from another period/wellness tracker.
+
+    Rows are read one at a time and written in batches of `batch_size`, so
+    memory does not grow with the file. Derived data (cycle chain, user
+    profile averages) is recalculated once at the end instead of per row.
+    Bad rows are skipped and reported with their line number.
+    """
+
+    def __init__(self, user, kind, batch_size=IMPORT_BATCH_SIZE):
+        if kind not in IMPORT_KINDS:
+            raise ValueError(f"kind must be one of: {', '.join(IMPORT_KINDS)}")
+        self.user = user
+        self.kind = kind
+        self.batch_size = batch_size
+        self.rows = 0
+        self.imported = 0
+        self.skipped = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def run(self, lines):
+        """`lines` is any iterable of text lines, e.g. an open file."""
+        if self.kind == 'periods':
+            try:
+                gender = self.user.userprofile.sex or 'none'
+            except Exception:
+                gender = 'none'
+            if gender != 'female':
+                raise ValueError("Period tracking is only available for female users.")
+            # Start dates already stored, used to skip duplicates on re-import
+            self.seen_starts = set(
+                Period.objects.filter(user=self.user).values_list('start_date', flat=True)
+            )
+
+        reader = csv.reader(lines)
+        header = next(reader, None)
+        if not header:
+            raise ValueError("The file is empty")
+
+        aliases = PERIOD_HEADER_ALIASES if self.kind == 'periods' else WELLNESS_HEADER_ALIASES
+        columns = [aliases.get(normalize_header(h)) for h in header]
+        required = 'start_date' if self.kind == 'periods' else 'date'
+        if required not in columns:
+            raise ValueError(f"No {required} column found in header: {', '.join(header)}")
+
+        batch = []
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            self.rows += 1
+
+            values = {
+                field: cell.strip()
+                for field, cell in zip(columns, row)
+                if field and cell.strip()
+            }
+            try:
+                item = self.parse_period(values) if self.kind == 'periods' else self.parse_wellness(values)
+            except ValueError as e:
+                self.add_error(reader.line_num, str(e))
+                continue
+
+            if item is None:
+                self.skipped += 1
+                continue
+
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+
+        self.flush(batch)
+        self.finish()
+        return self.summary()
+
+    def parse_period(self, values):
+        if 'start_date' not in values:
+            raise ValueError("Missing start date")
+        start_date = parse_date(values['start_date'])
+        end_date = parse_date(values['end_date']) if 'end_date' in values else None
+        if end_date and end_date <= start_date:
+            raise ValueError("End date must be after start date")
+
+        if start_date in self.seen_starts:
+            return None
+        self.seen_starts.add(start_date)
+
+        return Period(
+            user=self.user,
+            start_date=start_date,
+            end_date=end_date,
+            symptoms=values.get('symptoms', ''),
+            medication=values.get('medication', '')
+        )
+
+    def parse_wellness(self, values):
+        if 'date' not in values:
+            raise ValueError("Missing date")
+        values['date'] = parse_date(values['date'])
+
+        serializer = WellnessLogBulkEntrySerializer(data=values)
+        if not serializer.is_valid():
+            raise ValueError('; '.join(
+                f"{field}: {' '.join(str(m) for m in messages)}"
+                for field, messages in serializer.errors.items()
+            ))
+        return serializer.validated_data
+
+    def flush(self, batch):
+        if not batch:
+            return
+        if self.kind == 'periods':
+            # Derived fields are filled in by Period.recalculate_chain in finish()
+            Period.objects.bulk_create(batch)
+        else:
+            # Scores are computed for the whole batch in one vectorized pass
+            WellnessLog.bulk_upsert(self.user, batch)
+        self.imported += len(batch)
+
+    def finish(self):
+        if self.kind == 'periods' and self.imported:
+            Period.recalculate_chain(self.user)
+
+    def summary(self):
+        return {
+            'kind': self.kind,
+            'rows': self.rows,
+            'imported': self.imported,
+            'skipped': self.skipped,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
@@ -0,0 +1,68 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from cycle_tracker.importers import IMPORT_BATCH_SIZE, IMPORT_KINDS, TrackerCSVImporter
+
+
+class Command(BaseCommand):
+    help = 'Import periods or wellness logs for one user from another tracker\'s CSV export'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the CSV file')
+        parser.add_argument(
+            '--kind',
+            choices=IMPORT_KINDS,
+            required=True,
+            help='What the file contains: periods or wellness',
+        )
+        user_group = parser.add_mutually_exclusive_group(required=True)
+        user_group.add_argument(
+            '--user-id',
+            type=int,
+            help='ID of the user to import into',
+        )
+        user_group.add_argument(
+            '--username',
+            help='Username of the user to import into',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=IMPORT_BATCH_SIZE,
+            help=f'Rows per bulk insert (default: {IMPORT_BATCH_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            if options['user_id']:
+                user = User.objects.get(id=options['user_id'])
+            else:
+                user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError('User not found')
+
+        importer = TrackerCSVImporter(user, options['kind'], options['batch_size'])
+        started = time.monotonic()
+
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as f:
+                summary = importer.run(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        elapsed = time.monotonic() - started
+
+        for error in summary['errors']:
+            self.stdout.write(self.style.WARNING(f"  line {error['line']}: {error['error']}"))
+        if summary['error_count'] > len(summary['errors']):
+            self.stdout.write(self.style.WARNING(
+                f"  ... and {summary['error_count'] - len(summary['errors'])} more errors"
+            ))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✓ Imported {summary['imported']} of {summary['rows']} rows for {user.username} "
+                f"({summary['skipped']} duplicates skipped, {summary['error_count']} errors) "
+                f"in {elapsed:.1f}s ({summary['rows'] / elapsed if elapsed else summary['rows']:.0f} rows/sec)"
+            )
+        )
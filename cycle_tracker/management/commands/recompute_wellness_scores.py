@@ -0,0 +1,123 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from cycle_tracker.models import WellnessLog
+from cycle_tracker.scoring import SCORE_FIELDS, SCORE_INPUT_FIELDS, SCORE_VERSION, apply_scores
+
+
+def _init_worker():
+    """Each worker process needs Django set up and its own DB connections."""
+    django.setup()
+    connections.close_all()
+
+
+def recompute_chunk(first_id, last_id, force=False):
+    """Rescore the logs with ids in [first_id, last_id] using one bulk UPDATE."""
+    logs = WellnessLog.objects.filter(id__gte=first_id, id__lte=last_id)
+    if not force:
+        logs = logs.exclude(score_version=SCORE_VERSION)
+    logs = list(logs.only('id', *SCORE_INPUT_FIELDS))
+
+    apply_scores(logs)
+    WellnessLog.objects.bulk_update(logs, SCORE_FIELDS + ['score_version'])
+    return len(logs)
+
+
+class Command(BaseCommand):
+    help = 'Recompute wellness scores for logs not yet scored with the current scoring version'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Number of logs updated per bulk_update (default: 2000)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of worker processes (default: CPU count, 1 = run in this process)',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Rescore every log, even those already on the current version',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        workers = max(1, options['workers'])
+        force = options['force']
+
+        pending = WellnessLog.objects.all()
+        if not force:
+            # Logs already on SCORE_VERSION were done by an earlier (possibly interrupted) run
+            pending = pending.exclude(score_version=SCORE_VERSION)
+
+        chunks = self.build_chunks(pending, chunk_size)
+        total = sum(size for _, _, size in chunks)
+
+        if not chunks:
+            self.stdout.write(self.style.SUCCESS(f'All wellness logs are on score version {SCORE_VERSION}'))
+            return
+
+        self.stdout.write(
+            f'Rescoring {total} wellness logs to version {SCORE_VERSION} '
+            f'in {len(chunks)} chunks with {workers} worker(s)'
+        )
+
+        started = time.monotonic()
+        done = 0
+
+        if workers == 1:
+            for first_id, last_id, _ in chunks:
+                done += recompute_chunk(first_id, last_id, force)
+                self.report_progress(done, total, started)
+        else:
+            # Forked workers must not share the parent's open DB connection
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+                futures = [
+                    executor.submit(recompute_chunk, first_id, last_id, force)
+                    for first_id, last_id, _ in chunks
+                ]
+                for future in as_completed(futures):
+                    done += future.result()
+                    self.report_progress(done, total, started)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✓ Rescored {done} wellness logs in {elapsed:.1f}s '
+                f'({done / elapsed if elapsed else done:.0f} rows/sec)'
+            )
+        )
+
+    def build_chunks(self, queryset, chunk_size):
+        """Split the pending ids into (first_id, last_id, size) ranges."""
+        chunks = []
+        first_id = last_id = None
+        size = 0
+
+        for log_id in queryset.order_by('id').values_list('id', flat=True).iterator(chunk_size=chunk_size):
+            if first_id is None:
+                first_id = log_id
+            last_id = log_id
+            size += 1
+            if size == chunk_size:
+                chunks.append((first_id, last_id, size))
+                first_id, size = None, 0
+
+        if size:
+            chunks.append((first_id, last_id, size))
+        return chunks
+
+    def report_progress(self, done, total, started):
+        elapsed = time.monotonic() - started
+        rate = done / elapsed if elapsed else done
+        self.stdout.write(f'  {done}/{total} logs ({rate:.0f} rows/sec)')
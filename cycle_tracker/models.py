@@ -1,9 +1,40 @@
 from datetime import timedelta, time as datetime_time
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
 from rest_framework import serializers
 from statistics import stdev
 from user_profile.models import UserProfile
+from .scoring import apply_scores
+
+
+def predict_next_period_start(start_date, recent_starts, cycle_length):
+    """
+    Predict the next period start from `start_date`.
+    `recent_starts` are the start dates of up to 6 earlier periods, newest first.
+    With 3+ of them the average of the reasonable (21-45 day) gaps is used,
+    otherwise `cycle_length` (or 28 days when that is out of range).
+    """
+    # If user has 3+ periods, use average cycle length
+    if len(recent_starts) >= 3:
+        cycle_lengths = []
+        for i in range(len(recent_starts) - 1):
+            cycle_length_i = (recent_starts[i] - recent_starts[i + 1]).days
+            # Only include reasonable cycle lengths (21-45 days)
+            if 21 <= cycle_length_i <= 45:
+                cycle_lengths.append(cycle_length_i)
+
+        if cycle_lengths:
+            # Use average of recent cycles, rounded to nearest day
+            smart_cycle = round(sum(cycle_lengths) / len(cycle_lengths))
+            return start_date + timedelta(days=smart_cycle)
+
+    # Fallback to individual cycle length or profile default
+    if cycle_length and 21 <= cycle_length <= 45:
+        return start_date + timedelta(days=cycle_length)
+    # Use default 28 days if cycle length is unreasonable
+    return start_date + timedelta(days=28)
+
 
 class Period(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='periods')
@@ -49,6 +80,45 @@ class Period(models.Model):
 
 
 
+    @classmethod
+    def recalculate_chain(cls, user):
+        """
+        Recompute the derived fields of all of a user's periods in one pass.
+
+        Does what save() does per row (duration, cycle length from the
+        previous period, predicted end, next start) but for the whole
+        history at once, with a single bulk_update. Used after bulk imports.
+        """
+        profile = user.userprofile
+        periods = list(cls.objects.filter(user=user).order_by('start_date'))
+
+        for i, period in enumerate(periods):
+            if period.end_date:
+                period.period_duration = (period.end_date - period.start_date).days
+            if i > 0:
+                period.cycle_length = (period.start_date - periods[i - 1].start_date).days
+
+            duration = period.period_duration or profile.period_duration
+            if duration:
+                period.predicted_end_date = period.start_date + timedelta(days=duration)
+
+            recent_starts = [p.start_date for p in reversed(periods[max(0, i - 6):i])]
+            period.next_period_start_date = predict_next_period_start(
+                period.start_date,
+                recent_starts,
+                period.cycle_length or profile.cycle_length
+            )
+
+        cls.objects.bulk_update(
+            periods,
+            ['period_duration', 'cycle_length', 'predicted_end_date', 'next_period_start_date'],
+            batch_size=1000
+        )
+
+        if periods:
+            periods[-1].update_user_profile()
+        return periods
+
     def save(self, *args, **kwargs):
         # Check if user is female before allowing period creation
         try:
@@ -103,34 +173,16 @@ class Period(models.Model):
             return None
             
         # Get user's recent periods (excluding current one being saved)
-        recent_periods = Period.objects.filter(user=self.user).exclude(id=self.id).order_by('-start_date')[:6]
-        
-        # If user has 3+ periods, use average cycle length
-        if recent_periods.count() >= 3:
-            cycle_lengths = []
-            for i, period in enumerate(recent_periods):
-                if i < recent_periods.count() - 1:
-                    next_period = recent_periods[i + 1]
-                    cycle_length = (period.start_date - next_period.start_date).days
-                    # Only include reasonable cycle lengths (21-45 days)
-                    if 21 <= cycle_length <= 45:
-                        cycle_lengths.append(cycle_length)
-            
-            if cycle_lengths:
-                # Use average of recent cycles
-                avg_cycle = sum(cycle_lengths) / len(cycle_lengths)
-                # Round to nearest day
-                smart_cycle = round(avg_cycle)
-                return self.start_date + timedelta(days=smart_cycle)
-        
-        # Fallback to individual cycle length or profile default
-        cycle = self.cycle_length or self.user.userprofile.cycle_length
-        # Ensure cycle length is reasonable
-        if cycle and 21 <= cycle <= 45:
-            return self.start_date + timedelta(days=cycle)
-        else:
-            # Use default 28 days if cycle length is unreasonable
-            return self.start_date + timedelta(days=28)
+        recent_starts = list(
+            Period.objects.filter(user=self.user).exclude(id=self.id)
+            .order_by('-start_date').values_list('start_date', flat=True)[:6]
+        )
+
+        return predict_next_period_start(
+            self.start_date,
+            recent_starts,
+            self.cycle_length or self.user.userprofile.cycle_length
+        )
 
     def calculate_next_period(self):
         """
@@ -280,17 +332,28 @@ class Reminder(models.Model):
     reminder_type = models.CharField(max_length=50, choices=REMINDER_TYPES, default='CUSTOM')
     reminder_time = models.DateTimeField()
     is_completed = models.BooleanField(default=False)
+    notified = models.BooleanField(default=False, help_text="Set by run_scheduler once delivered")
 
     class Meta:
         ordering = ['reminder_time']  # Sort reminders by time
+        indexes = [
+            # Pending reminders in firing order, for run_scheduler
+            models.Index(fields=['notified', 'is_completed', 'reminder_time']),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.get_reminder_type_display()} at {self.reminder_time}"
 
+    def save(self, *args, **kwargs):
+        # Moving a reminder into the future arms it again
+        if self.reminder_time and self.reminder_time > timezone.now():
+            self.notified = False
+        super().save(*args, **kwargs)
+
 
 class WellnessLog(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='wellness_logs') 
-    date = models.DateField(auto_now_add=True) 
+    date = models.DateField(default=timezone.localdate)
 
     # (Basic)
     stress_level = models.IntegerField(default=0)  
@@ -325,54 +388,68 @@ class WellnessLog(models.Model):
     sleep_score = models.FloatField(default=0)
     activity_score = models.FloatField(default=0)
     mental_score = models.FloatField(default=0)
+    score_version = models.IntegerField(default=0, help_text="Version of cycle_tracker.scoring used for the computed fields")
 
     class Meta:
         unique_together = ("user", "date")  # Ensures that each user can only have one wellness log entry per day.
+        indexes = [
+            models.Index(fields=['score_version']),
+        ]
 
     def calculate_scores(self):
-        """Calculate wellness scores based on logged data."""
-        # Sleep score (0-100) - optimal is 7-9 hours
-        if self.sleep_hours >= 7 and self.sleep_hours <= 9:
-            sleep_score = 100
-        elif self.sleep_hours < 7:
-            sleep_score = min((self.sleep_hours / 7) * 100, 100)
-        else:
-            sleep_score = max(100 - ((self.sleep_hours - 9) * 10), 0)
-
-        # Activity score (0-100) - based on steps (10000 is optimal)
-        activity_score = min((self.steps / 10000) * 100, 100)
-        
-        # Add exercise bonus
-        if self.exercise_minutes > 0:
-            exercise_bonus = min((self.exercise_minutes / 30) * 20, 20)
-            activity_score = min(activity_score + exercise_bonus, 100)
-
-        # Mental score (0-100) - lower stress/anxiety/pain is better
-        mental_score = 100
-        mental_score -= (self.stress_level * 8)  # 0-10 scale
-        mental_score -= (self.anxiety_level * 8)  # 0-10 scale
-        mental_score -= (self.pain_level * 5)  # 0-10 scale
-        mental_score = max(mental_score, 0)
-        
-        # Add mood and energy bonus
-        if self.mood_level > 5:
-            mental_score = min(mental_score + ((self.mood_level - 5) * 2), 100)
-        if self.energy_level > 5:
-            mental_score = min(mental_score + ((self.energy_level - 5) * 2), 100)
-
-        # Overall wellness score (weighted average)
-        wellness_score = (
-            sleep_score * 0.3 +
-            activity_score * 0.3 +
-            mental_score * 0.4
-        )
-
-        self.sleep_score = round(sleep_score, 2)
-        self.activity_score = round(activity_score, 2)
-        self.mental_score = round(mental_score, 2)
-        self.wellness_score = round(wellness_score, 2)
+        """
+        Calculate wellness scores based on logged data.
+        The formula lives in cycle_tracker.scoring so single saves, bulk
+        uploads and rescoring runs all share one versioned implementation.
+        """
+        apply_scores([self])
     
     def save(self, *args, **kwargs):
         """Override save to calculate scores automatically."""
         self.calculate_scores()
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def bulk_upsert(cls, user, entries):
+        """
+        Insert or update several days of logs for one user in one statement.
+
+        `entries` is a list of dicts with a `date` key plus any raw wellness
+        fields. Fields missing from an entry keep their stored value (or the
+        model default for a new day), so a wearable sync that only sends
+        steps/sleep doesn't wipe manually logged mood or stress.
+        Returns (logs, created_count).
+        """
+        # Merge entries per day, later entries win
+        by_date = {}
+        for entry in entries:
+            by_date.setdefault(entry['date'], {}).update(entry)
+
+        existing = {
+            log.date: log
+            for log in cls.objects.filter(user=user, date__in=list(by_date))
+        }
+
+        logs = []
+        for day, entry in sorted(by_date.items()):
+            log = existing.get(day) or cls(user=user, date=day)
+            for field, value in entry.items():
+                setattr(log, field, value)
+            logs.append(log)
+
+        # Score the whole batch at once instead of calling calculate_scores per row
+        apply_scores(logs)
+
+        update_fields = [
+            f.name for f in cls._meta.concrete_fields
+            if not f.primary_key and f.name not in ('user', 'date')
+        ]
+        with transaction.atomic():
+            cls.objects.bulk_create(
+                logs,
+                update_conflicts=True,
+                unique_fields=['user', 'date'],
+                update_fields=update_fields,
+            )
+
+        return logs, len(logs) - len(existing)
\ No newline at end of file
@@ -0,0 +1,105 @@
+import numpy as np
+
+
+# Bump this whenever the formula or weights below change, then run
+# `python manage.py recompute_wellness_scores` to rescore stored logs.
+# Each WellnessLog records the version it was scored with.
+SCORE_VERSION = 1
+
+# Weights of the component scores in the overall wellness score
+SLEEP_WEIGHT = 0.3
+ACTIVITY_WEIGHT = 0.3
+MENTAL_WEIGHT = 0.4
+
+# Raw WellnessLog fields the scores are derived from
+SCORE_INPUT_FIELDS = [
+    'sleep_hours',
+    'steps',
+    'exercise_minutes',
+    'stress_level',
+    'anxiety_level',
+    'pain_level',
+    'mood_level',
+    'energy_level',
+]
+
+# Computed WellnessLog fields
+SCORE_FIELDS = [
+    'wellness_score',
+    'sleep_score',
+    'activity_score',
+    'mental_score',
+]
+
+
+def calculate_scores_batch(columns):
+    """
+    Vectorized version of WellnessLog.calculate_scores.
+
+    Takes a dict mapping each field in SCORE_INPUT_FIELDS to a sequence of
+    values (one per log) and returns a dict mapping each field in
+    SCORE_FIELDS to a NumPy array of scores rounded to 2 decimals.
+    """
+    sleep_hours = np.asarray(columns['sleep_hours'], dtype=float)
+    steps = np.asarray(columns['steps'], dtype=float)
+    exercise_minutes = np.asarray(columns['exercise_minutes'], dtype=float)
+    stress_level = np.asarray(columns['stress_level'], dtype=float)
+    anxiety_level = np.asarray(columns['anxiety_level'], dtype=float)
+    pain_level = np.asarray(columns['pain_level'], dtype=float)
+    mood_level = np.asarray(columns['mood_level'], dtype=float)
+    energy_level = np.asarray(columns['energy_level'], dtype=float)
+
+    # Sleep score (0-100) - optimal is 7-9 hours
+    sleep_score = np.where(
+        (sleep_hours >= 7) & (sleep_hours <= 9),
+        100.0,
+        np.where(
+            sleep_hours < 7,
+            np.minimum((sleep_hours / 7) * 100, 100),
+            np.maximum(100 - ((sleep_hours - 9) * 10), 0),
+        ),
+    )
+
+    # Activity score (0-100) - based on steps (10000 is optimal) plus exercise bonus
+    activity_score = np.minimum((steps / 10000) * 100, 100)
+    exercise_bonus = np.where(exercise_minutes > 0, np.minimum((exercise_minutes / 30) * 20, 20), 0)
+    activity_score = np.minimum(activity_score + exercise_bonus, 100)
+
+    # Mental score (0-100) - lower stress/anxiety/pain is better
+    mental_score = 100 - (stress_level * 8) - (anxiety_level * 8) - (pain_level * 5)
+    mental_score = np.maximum(mental_score, 0)
+
+    # Mood and energy bonus
+    mental_score = np.where(mood_level > 5, np.minimum(mental_score + ((mood_level - 5) * 2), 100), mental_score)
+    mental_score = np.where(energy_level > 5, np.minimum(mental_score + ((energy_level - 5) * 2), 100), mental_score)
+
+    # Overall wellness score (weighted average)
+    wellness_score = (
+        sleep_score * SLEEP_WEIGHT +
+        activity_score * ACTIVITY_WEIGHT +
+        mental_score * MENTAL_WEIGHT
+    )
+
+    return {
+        'wellness_score': np.round(wellness_score, 2),
+        'sleep_score': np.round(sleep_score, 2),
+        'activity_score': np.round(activity_score, 2),
+        'mental_score': np.round(mental_score, 2),
+    }
+
+
+def apply_scores(logs):
+    """Score a list of WellnessLog instances in place and stamp SCORE_VERSION."""
+    if not logs:
+        return logs
+
+    scores = calculate_scores_batch({
+        field: [getattr(log, field) for log in logs]
+        for field in SCORE_INPUT_FIELDS
+    })
+    for i, log in enumerate(logs):
+        for field in SCORE_FIELDS:
+            setattr(log, field, float(scores[field][i]))
+        log.score_version = SCORE_VERSION
+
+    return logs
@@ -2,6 +2,7 @@ from rest_framework import serializers
 from .models import Period, Ovulation, Partner, WellnessLog
 from notifications.models import Notification, NotificationPreference
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 
 class PeriodSerializer(serializers.ModelSerializer):
@@ -66,13 +67,46 @@ class WellnessLogSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = [
             'user',
+            'date',
             'wellness_score',
             'sleep_score',
             'activity_score',
-            'mental_score'
+            'mental_score',
+            'score_version'
         ]
 
 
+class WellnessLogBulkEntrySerializer(serializers.ModelSerializer):
+    """One dated day of raw wellness data inside a bulk upload."""
+    date = serializers.DateField()
+
+    class Meta:
+        model = WellnessLog
+        exclude = [
+            'id',
+            'user',
+            'wellness_score',
+            'sleep_score',
+            'activity_score',
+            'mental_score',
+            'score_version'
+        ]
+        # (user, date) uniqueness is handled by the upsert, not by validation
+        validators = []
+
+    def validate_date(self, value):
+        if value > timezone.localdate():
+            raise serializers.ValidationError("Cannot log wellness data for a future date.")
+        return value
+
+
+class WellnessLogBulkSerializer(serializers.Serializer):
+    """Payload for bulk wellness upload (offline sync / wearables)."""
+    MAX_ENTRIES = 366
+
+    entries = WellnessLogBulkEntrySerializer(many=True, allow_empty=False, max_length=MAX_ENTRIES)
+
+
 
 # Notification serializers moved to notifications app
 # Import them if needed: from notifications.serializers import NotificationSerializer, NotificationPreferenceSerializer
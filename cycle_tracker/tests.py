@@ -1,3 +1,245 @@
+from datetime import date, timedelta
+from io import StringIO
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from user_profile.models import UserProfile
+from .downsampling import downsample_series, lttb, parse_downsample_params
+from .importers import TrackerCSVImporter
+from .models import Period, WellnessLog
+from .scoring import SCORE_INPUT_FIELDS, SCORE_VERSION, calculate_scores_batch
+from .serializers import WellnessLogBulkSerializer
 
-# Create your tests here.
+
+class DownsamplingTests(TestCase):
+
+    def test_lttb_keeps_ends_and_peaks(self):
+        x = np.arange(100)
+        y = np.zeros(100)
+        y[37], y[71] = 50, -40
+        keep = lttb(x, y, 10)
+        self.assertEqual(len(keep), 10)
+        self.assertEqual((keep[0], keep[-1]), (0, 99))
+        self.assertTrue(np.all(np.diff(keep) > 0))
+        self.assertIn(37, keep)
+        self.assertIn(71, keep)
+
+    def test_lttb_short_series_unchanged(self):
+        x = np.arange(5)
+        self.assertEqual(lttb(x, x * 2.0, 10).tolist(), [0, 1, 2, 3, 4])
+        # Below the minimum useful threshold everything is kept too
+        self.assertEqual(lttb(x, x * 2.0, 2).tolist(), [0, 1, 2, 3, 4])
+
+    def test_downsample_series(self):
+        start = date(2026, 1, 1)
+        dates = [start + timedelta(days=i) for i in range(60)]
+        values = [float(i % 7) for i in range(60)]
+        self.assertEqual(len(downsample_series(dates, values)), 60)
+
+        points = downsample_series(dates, values, max_points=12)
+        self.assertEqual(len(points), 12)
+        self.assertEqual((points[0]['date'], points[-1]['date']), (dates[0], dates[-1]))
+
+        averaged = downsample_series(dates, values, max_points=12, method='average')
+        self.assertEqual(len(averaged), 12)
+        self.assertAlmostEqual(sum(p['value'] for p in averaged) / 12, np.mean(values), delta=0.5)
+        self.assertEqual(downsample_series([], [], max_points=12), [])
+
+    def test_parse_params(self):
+        self.assertEqual(parse_downsample_params({}), (None, 'lttb'))
+        self.assertEqual(parse_downsample_params({'max_points': '50', 'downsample': 'average'}), (50, 'average'))
+        for params in ({'max_points': 'many'}, {'max_points': '2'}, {'max_points': '5000'}, {'downsample': 'median'}):
+            with self.assertRaises(ValueError):
+                parse_downsample_params(params)
+
+
+class ScoringTests(TestCase):
+
+    def scores(self, **values):
+        columns = {field: [0] for field in SCORE_INPUT_FIELDS}
+        columns['energy_level'] = [5]
+        columns.update({field: [value] for field, value in values.items()})
+        return {field: float(array[0]) for field, array in calculate_scores_batch(columns).items()}
+
+    def test_worked_example(self):
+        scores = self.scores(
+            sleep_hours=8, steps=5000, exercise_minutes=15,
+            stress_level=2, anxiety_level=1, pain_level=2, mood_level=7, energy_level=5,
+        )
+        # sleep 100; activity 50 + 10 exercise bonus; mental 100 - 16 - 8 - 10 + 4 mood bonus
+        self.assertEqual(scores, {
+            'sleep_score': 100.0, 'activity_score': 60.0, 'mental_score': 70.0, 'wellness_score': 76.0,
+        })
+
+    def test_bounds(self):
+        self.assertEqual(self.scores(sleep_hours=5)['sleep_score'], 71.43)
+        self.assertEqual(self.scores(sleep_hours=11)['sleep_score'], 80.0)
+        self.assertEqual(self.scores(sleep_hours=30)['sleep_score'], 0.0)
+        self.assertEqual(self.scores(steps=20000, exercise_minutes=90)['activity_score'], 100.0)
+        # Floored at 0 before the mood bonus is added
+        self.assertEqual(self.scores(stress_level=10, anxiety_level=10, mood_level=10)['mental_score'], 10.0)
+
+    def test_batch_matches_single_saves(self):
+        user = User.objects.create_user(username='scored', password='secret', email='scored@example.com')
+        rows = [
+            {'sleep_hours': 6.5, 'steps': 12000, 'stress_level': 3, 'mood_level': 8},
+            {'sleep_hours': 9.5, 'exercise_minutes': 45, 'pain_level': 6, 'energy_level': 9},
+        ]
+        for i, row in enumerate(rows):
+            WellnessLog.objects.create(user=user, date=date(2026, 1, 1) + timedelta(days=i), **row)
+        WellnessLog.bulk_upsert(user, [
+            {'date': date(2026, 2, 1) + timedelta(days=i), **row} for i, row in enumerate(rows)
+        ])
+        saved = WellnessLog.objects.filter(user=user).order_by('date')
+        single, batch = saved[:2], saved[2:]
+        for one, other in zip(single, batch):
+            self.assertEqual(
+                (one.wellness_score, one.sleep_score, one.activity_score, one.mental_score),
+                (other.wellness_score, other.sleep_score, other.activity_score, other.mental_score),
+            )
+            self.assertEqual(other.score_version, SCORE_VERSION)
+
+    def test_recompute_rescores_old_versions(self):
+        user = User.objects.create_user(username='rescored', password='secret', email='rescored@example.com')
+        log = WellnessLog.objects.create(user=user, date=date(2026, 1, 1), sleep_hours=8, steps=10000)
+        expected = log.wellness_score
+        WellnessLog.objects.filter(id=log.id).update(wellness_score=0, score_version=SCORE_VERSION - 1)
+
+        call_command('recompute_wellness_scores', workers=1, stdout=StringIO())
+        log.refresh_from_db()
+        self.assertEqual((log.wellness_score, log.score_version), (expected, SCORE_VERSION))
+
+
+class TrackerCSVImporterTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='importer', password='secret', email='importer@example.com')
+        UserProfile.objects.update_or_create(user=self.user, defaults={'sex': 'female'})
+        self.user.refresh_from_db()
+
+    def run_import(self, kind, text, batch_size=2):
+        return TrackerCSVImporter(self.user, kind, batch_size).run(text.splitlines(keepends=True))
+
+    def test_wellness_aliases_and_errors(self):
+        summary = self.run_import('wellness', (
+            'Day,Step Count,Sleep (hours),Mood\n'
+            '2026-03-01,8000,7.5,6\n'
+            '03/02/2026,9000,,7\n'
+            'yesterday,1,1,1\n'
+            '\n'
+            '2026-03-03T08:00:00Z,abc,6,5\n'
+            '2026.03.04,100,5,5\n'
+        ))
+        self.assertEqual((summary['rows'], summary['imported'], summary['error_count']), (5, 2, 3))
+        self.assertEqual([error['line'] for error in summary['errors']], [4, 6, 7])
+        log = WellnessLog.objects.get(user=self.user, date=date(2026, 3, 2))
+        self.assertEqual((log.steps, log.mood_level, log.sleep_hours), (9000, 7, 0))
+        self.assertGreater(log.wellness_score, 0)
+
+    def test_wellness_reimport_updates(self):
+        self.run_import('wellness', 'date,steps\n2026-03-01,1000\n')
+        self.run_import('wellness', 'date,steps,stress\n2026-03-01,5000,4\n')
+        log = WellnessLog.objects.get(user=self.user)
+        self.assertEqual((log.steps, log.stress_level), (5000, 4))
+
+    def test_periods(self):
+        text = (
+            'Period Start,Period End\n'
+            '2026-01-03,2026-01-07\n'
+            '2026-01-31,2026-02-04\n'
+            '2026-02-28,2026-02-27\n'
+            '2026-03-01,\n'
+        )
+        summary = self.run_import('periods', text)
+        self.assertEqual((summary['imported'], summary['error_count']), (3, 1))
+        self.assertEqual(Period.objects.filter(user=self.user).count(), 3)
+        # The chain was recalculated once at the end
+        first = Period.objects.filter(user=self.user).order_by('start_date').first()
+        self.assertIsNotNone(first.next_period_start_date)
+
+        again = self.run_import('periods', text)
+        self.assertEqual((again['imported'], again['skipped']), (0, 3))
+        self.assertEqual(Period.objects.filter(user=self.user).count(), 3)
+
+    def test_periods_need_female_profile(self):
+        UserProfile.objects.filter(user=self.user).update(sex='male')
+        self.user.refresh_from_db()
+        with self.assertRaises(ValueError):
+            self.run_import('periods', 'start_date\n2026-01-03\n')
+
+    def test_missing_date_column(self):
+        with self.assertRaises(ValueError):
+            self.run_import('wellness', 'steps,mood\n1000,5\n')
+
+
+class WellnessBulkViewTests(TestCase):
+    url = '/api/wellness/bulk/'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='syncer', password='secret', email='syncer@example.com')
+        self.other = User.objects.create_user(username='bystander', password='secret', email='bystander@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.day = timezone.localdate() - timedelta(days=5)
+
+    def post(self, entries):
+        return self.client.post(self.url, {'entries': entries}, format='json')
+
+    def test_create_and_update_in_one_request(self):
+        WellnessLog.objects.create(user=self.user, date=self.day, mood_level=7, steps=100)
+        response = self.post([
+            {'date': str(self.day), 'steps': 9000, 'sleep_hours': 7.5},
+            {'date': str(self.day + timedelta(days=1)), 'steps': 4000},
+            # Later entries for the same day win
+            {'date': str(self.day + timedelta(days=1)), 'steps': 5000},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated']), (1, 1))
+        self.assertEqual([row['steps'] for row in response.data['data']], [9000, 5000])
+
+        updated = WellnessLog.objects.get(user=self.user, date=self.day)
+        # Fields the sync did not send keep their stored value
+        self.assertEqual((updated.steps, updated.sleep_hours, updated.mood_level), (9000, 7.5, 7))
+        self.assertGreater(updated.wellness_score, 0)
+        self.assertEqual(WellnessLog.objects.filter(user=self.user).count(), 2)
+
+    def test_per_item_validation_errors(self):
+        response = self.post([
+            {'date': str(self.day), 'steps': 1000},
+            {'date': str(timezone.localdate() + timedelta(days=1)), 'steps': 1000},
+            {'steps': 'many'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        errors = response.data['entries']
+        self.assertEqual(errors[0], {})
+        self.assertIn('date', errors[1])
+        self.assertEqual(set(errors[2]), {'date', 'steps'})
+        # Nothing is saved when any entry is invalid
+        self.assertFalse(WellnessLog.objects.exists())
+
+    def test_batch_size_limit(self):
+        limit = WellnessLogBulkSerializer.MAX_ENTRIES
+        entries = [{'date': str(self.day - timedelta(days=i)), 'steps': i} for i in range(limit + 1)]
+        response = self.post(entries)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('entries', response.data)
+        self.assertFalse(WellnessLog.objects.exists())
+
+        self.assertEqual(self.post(entries[:limit]).status_code, 200)
+        self.assertEqual(WellnessLog.objects.filter(user=self.user).count(), limit)
+        self.assertEqual(self.post([]).status_code, 400)
+
+    def test_only_the_request_user_is_touched(self):
+        theirs = WellnessLog.objects.create(user=self.other, date=self.day, steps=123)
+        response = self.post([{'date': str(self.day), 'steps': 9000, 'user': self.other.id}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 1)
+        theirs.refresh_from_db()
+        self.assertEqual(theirs.steps, 123)
+        self.assertEqual(WellnessLog.objects.get(user=self.user).steps, 9000)
+
+    def test_requires_authentication(self):
+        self.assertEqual(APIClient().post(self.url, {'entries': []}, format='json').status_code, 401)
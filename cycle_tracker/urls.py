@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    OvulationDetailView, PeriodViewSet, WellnessLogView, NotificationGeneratorView
+    OvulationDetailView, PeriodViewSet, WellnessLogView, NotificationGeneratorView, TrackerImportView
 )
 from django.conf import settings
 from django.conf.urls.static import static
@@ -21,6 +21,7 @@ urlpatterns = [
     path('ovulation/<int:period_id>/', OvulationDetailView.as_view(), name='ovulation-detail'),
     # notification-preferences moved to /api/notifications/preferences/
     path('generate-notifications/', NotificationGeneratorView.as_view(), name='generate-notifications'),
+    path('import/', TrackerImportView.as_view(), name='tracker-import'),
 ]
 
 
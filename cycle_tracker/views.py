@@ -3,11 +3,15 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework.parsers import MultiPartParser
 from django.utils import timezone
 from datetime import datetime, timedelta
+import io
 from .models import Ovulation, Period, WellnessLog
 from notifications.models import Notification, NotificationPreference
-from .serializers import OvulationSerializer, PeriodSerializer, WellnessLogSerializer
+from .importers import IMPORT_KINDS, TrackerCSVImporter
+from .downsampling import downsample_columns, parse_downsample_params
+from .serializers import OvulationSerializer, PeriodSerializer, WellnessLogSerializer, WellnessLogBulkSerializer
 from notifications.serializers import NotificationSerializer, NotificationPreferenceSerializer
 
 
@@ -940,6 +944,28 @@ class WellnessLogView(viewsets.ModelViewSet):
             'message': 'Wellness log created' if created else 'Wellness log updated',
             'data': serializer.data
         }, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create or update many days of wellness logs at once.
+        Used for offline sync and wearable imports (steps, calories, sleep).
+        """
+        bulk_serializer = WellnessLogBulkSerializer(data=request.data)
+        bulk_serializer.is_valid(raise_exception=True)
+
+        logs, created = WellnessLog.bulk_upsert(
+            request.user,
+            bulk_serializer.validated_data['entries']
+        )
+
+        return Response({
+            'status': 'success',
+            'message': f'{created} wellness logs created, {len(logs) - created} updated',
+            'created': created,
+            'updated': len(logs) - created,
+            'data': self.get_serializer(logs, many=True).data
+        }, status=status.HTTP_200_OK)
     
     @action(detail=False, methods=['get'])
     def analytics(self, request):
@@ -949,6 +975,12 @@ class WellnessLogView(viewsets.ModelViewSet):
         
         # Get date range from query params (default: last 30 days)
         days = int(request.query_params.get('days', 30))
+
+        # Optional downsampled daily series for charts
+        try:
+            max_points, downsample_method = parse_downsample_params(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         end_date = timezone.localdate()
         start_date = end_date - timedelta(days=days)
         
@@ -1011,6 +1043,17 @@ class WellnessLogView(viewsets.ModelViewSet):
         
         # Generate insights
         insights = self._generate_wellness_insights(averages, trends, logs)
+
+        # Daily series are only sent when the client asks for a bounded number of points
+        series = None
+        if max_points:
+            series_fields = ['wellness_score', 'sleep_hours', 'mood_level', 'energy_level', 'stress_level']
+            series = downsample_columns(
+                list(logs.values_list('date', *series_fields)),
+                series_fields,
+                max_points,
+                downsample_method
+            )
         
         return Response({
             'status': 'success',
@@ -1042,7 +1085,8 @@ class WellnessLogView(viewsets.ModelViewSet):
                     'date': worst_day.date,
                     'wellness_score': worst_day.wellness_score
                 } if worst_day else None,
-                'insights': insights
+                'insights': insights,
+                'series': series
             }
         })
     
@@ -1249,6 +1293,37 @@ class WellnessLogView(viewsets.ModelViewSet):
 
 
 
+class TrackerImportView(APIView):
+    """Import a CSV export from another period or wellness tracker."""
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        kind = request.data.get('kind')
+
+        if not upload:
+            return Response({'error': 'file is required'}, status=status.HTTP_400_BAD_REQUEST)
+        if kind not in IMPORT_KINDS:
+            return Response({
+                'error': f"kind must be one of: {', '.join(IMPORT_KINDS)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Read the upload line by line instead of loading it into memory
+        lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        try:
+            summary = TrackerCSVImporter(request.user, kind).run(lines)
+        except (ValueError, UnicodeDecodeError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'status': 'success',
+            'message': f"Imported {summary['imported']} of {summary['rows']} rows",
+            'data': summary
+        }, status=status.HTTP_200_OK)
+
+
+
 # Notification views moved to notifications app
 # Use: from notifications.views import NotificationViewSet, NotificationPreferenceViewSet
 
@@ -1257,218 +1332,16 @@ class NotificationGeneratorView(APIView):
     """Generate smart notifications based on cycle data."""
     permission_classes = [IsAuthenticated]
     
-    def _get_notification_time(self, date, preferences):
-        """Helper to create notification datetime from date and preferences."""
-        from datetime import datetime, time as datetime_time
-        from django.utils import timezone
-        
-        # Handle preferred_notification_time whether it's a time object or string
-        pref_time = preferences.preferred_notification_time
-        if isinstance(pref_time, str):
-            hour, minute, second = map(int, pref_time.split(':'))
-            pref_time = datetime_time(hour, minute, second)
-        
-        notification_time = datetime.combine(date, pref_time)
-        return timezone.make_aware(notification_time)
-    
     def post(self, request):
-        """Generate notifications for the user."""
-        from datetime import datetime, timedelta
-        from django.utils import timezone
-        
-        user = request.user
-        
-        # Get user preferences
-        preferences, _ = NotificationPreference.objects.get_or_create(user=user)
-        
-        # Get user's gender
-        try:
-            gender = user.userprofile.sex or 'none'
-        except:
-            gender = 'none'
-        
-        notifications_created = []
-        
-        # For female users - generate cycle notifications
-        if gender == 'female':
-            periods = Period.objects.filter(user=user).order_by('-start_date')
-            
-            if periods.exists():
-                latest_period = periods.first()
-                next_period_date = latest_period.next_period_start_date or latest_period.calculate_next_period()
-                
-                if next_period_date:
-                    today = timezone.now().date()
-                    
-                    # Period coming notification
-                    if preferences.period_reminder_days > 0:
-                        reminder_date = next_period_date - timedelta(days=preferences.period_reminder_days)
-                        if reminder_date >= today:
-                            notification_time = self._get_notification_time(reminder_date, preferences)
-                            
-                            # Check if notification already exists
-                            if not Notification.objects.filter(
-                                user=user,
-                                notification_type='PERIOD_COMING',
-                                scheduled_time__date=reminder_date
-                            ).exists():
-                                notif = Notification.objects.create(
-                                    user=user,
-                                    notification_type='PERIOD_COMING',
-                                    title='Period Coming Soon',
-                                    message=f'Your period is expected in {preferences.period_reminder_days} days. Prepare supplies and plan accordingly.',
-                                    scheduled_time=notification_time,
-                                    related_period=latest_period
-                                )
-                                notifications_created.append(notif.notification_type)
-                    
-                    # PMS phase notification
-                    if preferences.pms_phase_alert:
-                        pms_start_date = next_period_date - timedelta(days=4)
-                        if pms_start_date >= today:
-                            notification_time = self._get_notification_time(pms_start_date, preferences)
-                            
-                            if not Notification.objects.filter(
-                                user=user,
-                                notification_type='PMS_PHASE',
-                                scheduled_time__date=pms_start_date
-                            ).exists():
-                                notif = Notification.objects.create(
-                                    user=user,
-                                    notification_type='PMS_PHASE',
-                                    title='PMS Phase Starting',
-                                    message='You may experience PMS symptoms in the coming days. Practice self-care and be patient with yourself.',
-                                    scheduled_time=notification_time,
-                                    related_period=latest_period
-                                )
-                                notifications_created.append(notif.notification_type)
-                    
-                    # Ovulation notification
-                    if preferences.ovulation_alert:
-                        cycle_length = latest_period.cycle_length or 28
-                        ovulation_date = latest_period.start_date + timedelta(days=cycle_length // 2)
-                        
-                        if ovulation_date >= today:
-                            notification_time = self._get_notification_time(ovulation_date, preferences)
-                            
-                            if not Notification.objects.filter(
-                                user=user,
-                                notification_type='OVULATION_COMING',
-                                scheduled_time__date=ovulation_date
-                            ).exists():
-                                notif = Notification.objects.create(
-                                    user=user,
-                                    notification_type='OVULATION_COMING',
-                                    title='Ovulation Window',
-                                    message='You are entering your ovulation window. Energy levels are typically highest during this phase.',
-                                    scheduled_time=notification_time,
-                                    related_period=latest_period
-                                )
-                                notifications_created.append(notif.notification_type)
-                    
-                    # Fertile window notification
-                    if preferences.fertile_window_alert:
-                        cycle_length = latest_period.cycle_length or 28
-                        fertile_start = latest_period.start_date + timedelta(days=(cycle_length // 2) - 3)
-                        
-                        if fertile_start >= today:
-                            notification_time = self._get_notification_time(fertile_start, preferences)
-                            
-                            if not Notification.objects.filter(
-                                user=user,
-                                notification_type='FERTILE_WINDOW',
-                                scheduled_time__date=fertile_start
-                            ).exists():
-                                notif = Notification.objects.create(
-                                    user=user,
-                                    notification_type='FERTILE_WINDOW',
-                                    title='Fertile Window Starting',
-                                    message='You are entering your fertile window. Be aware if planning or avoiding pregnancy.',
-                                    scheduled_time=notification_time,
-                                    related_period=latest_period
-                                )
-                                notifications_created.append(notif.notification_type)
-        
-        # For male users - generate partner notifications
-        elif gender == 'male':
-            try:
-                user_profile = user.userprofile
-                partners = user_profile.partners.all()
-                
-                if partners.exists():
-                    partner = partners.first()
-                    partner_user = partner.user
-                    partner_periods = Period.objects.filter(user=partner_user).order_by('-start_date')
-                    
-                    if partner_periods.exists():
-                        latest_partner_period = partner_periods.first()
-                        next_period_date = latest_partner_period.next_period_start_date or latest_partner_period.calculate_next_period()
-                        
-                        if next_period_date:
-                            today = timezone.now().date()
-                            
-                            # Partner period notification
-                            if preferences.partner_period_alert:
-                                reminder_date = next_period_date - timedelta(days=1)
-                                if reminder_date >= today:
-                                    notification_time = self._get_notification_time(reminder_date, preferences)
-                                    
-                                    if not Notification.objects.filter(
-                                        user=user,
-                                        notification_type='PARTNER_PERIOD',
-                                        scheduled_time__date=reminder_date
-                                    ).exists():
-                                        partner_name = f"{partner_user.first_name} {partner_user.last_name}".strip() or partner_user.username
-                                        notif = Notification.objects.create(
-                                            user=user,
-                                            notification_type='PARTNER_PERIOD',
-                                            title="Partner's Period Coming",
-                                            message=f"{partner_name}'s period starts tomorrow. Be extra supportive and understanding.",
-                                            scheduled_time=notification_time
-                                        )
-                                        notifications_created.append(notif.notification_type)
-                            
-                            # Partner PMS notification
-                            if preferences.partner_pms_alert:
-                                pms_date = next_period_date - timedelta(days=3)
-                                if pms_date >= today:
-                                    notification_time = self._get_notification_time(pms_date, preferences)
-                                    
-                                    if not Notification.objects.filter(
-                                        user=user,
-                                        notification_type='PARTNER_PMS',
-                                        scheduled_time__date=pms_date
-                                    ).exists():
-                                        partner_name = f"{partner_user.first_name} {partner_user.last_name}".strip() or partner_user.username
-                                        notif = Notification.objects.create(
-                                            user=user,
-                                            notification_type='PARTNER_PMS',
-                                            title="Partner's PMS Phase",
-                                            message=f"{partner_name} may be experiencing PMS symptoms. Be patient and offer support.",
-                                            scheduled_time=notification_time
-                                        )
-                                        notifications_created.append(notif.notification_type)
-            except Exception as e:
-                print(f"Error generating partner notifications: {e}")
+        """
+        Generate notifications for the user.
+        Runs the same rules as the generate_notifications command
+        (notifications/rules.py), for this user only.
+        """
+        from notifications.engine import generate_for_user
         
-        # Wellness reminder (for all users)
-        if preferences.wellness_reminder:
-            tomorrow = timezone.now().date() + timedelta(days=1)
-            notification_time = self._get_notification_time(tomorrow, preferences)
-            
-            if not Notification.objects.filter(
-                user=user,
-                notification_type='WELLNESS_REMINDER',
-                scheduled_time__date=tomorrow
-            ).exists():
-                notif = Notification.objects.create(
-                    user=user,
-                    notification_type='WELLNESS_REMINDER',
-                    title='Log Your Wellness Data',
-                    message='Take a moment to log your mood, energy, and other wellness metrics for today.',
-                    scheduled_time=notification_time
-                )
-                notifications_created.append(notif.notification_type)
+        created = generate_for_user(request.user)
+        notifications_created = [n.notification_type for n in created]
         
         return Response({
             'status': 'success',
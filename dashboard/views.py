@@ -4,6 +4,7 @@ from rest_framework.permissions import IsAuthenticated
 from django.utils import timezone
 from datetime import timedelta
 from cycle_tracker.models import WellnessLog
+from cycle_tracker.downsampling import downsample_columns, parse_downsample_params
 from rest_framework.response import Response
 from django.db.models import Avg, Count, Sum, Q, F
 from .serializers import DashboardMetricsSerializer, WellnessLogSerializer
@@ -28,6 +29,11 @@ class WellnessDashboardView(APIView):
         else:
             end_date = timezone.datetime.strptime(end_date, '%Y-%m-%d').date()
 
+        try:
+            max_points, downsample_method = parse_downsample_params(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
         logs = WellnessLog.objects.filter(
             user = user,
             date__gte=start_date,
@@ -51,28 +57,21 @@ class WellnessDashboardView(APIView):
                     avg_exercise=Avg('exercise_minutes'),
                     avg_nutrition=Avg('nutrition_quality')
                 )
-        recent_logs = logs.filter(
-            date__gte=timezone.now().date() - timedelta(days=7)
-        ).order_by('date')
-
-        stress_trend = []
-        sleep_trend = []
-        mood_trend = []
-
+        # With max_points the trends cover the whole range, downsampled;
+        # without it they keep showing the last 7 days point by point
+        if max_points:
+            trend_logs = logs
+        else:
+            trend_logs = logs.filter(
+                date__gte=timezone.now().date() - timedelta(days=7)
+            )
 
-        for log in recent_logs:
-            stress_trend.append({
-                'date': log.date,
-                'value': log.stress_level
-            })
-            sleep_trend.append({
-                'date': log.date,
-                'value': log.sleep_hours
-            })
-            mood_trend.append({
-                'date': log.date,
-                'value': log.mood_level
-            })
+        trends = downsample_columns(
+            list(trend_logs.values_list('date', 'stress_level', 'sleep_hours', 'mood_level')),
+            ['stress_level', 'sleep_hours', 'mood_level'],
+            max_points,
+            downsample_method
+        )
         
         # Calculate health indicators
         good_days_count = logs.filter(
@@ -98,9 +97,9 @@ class WellnessDashboardView(APIView):
             'avg_pain': round(averages['avg_pain'] or 0, 1),
             'avg_exercise': round(averages['avg_exercise'] or 0, 1),
             'avg_nutrition': round(averages['avg_nutrition'] or 0, 1),
-            'stress_trend': stress_trend,
-            'sleep_trend': sleep_trend,
-            'mood_trend': mood_trend,
+            'stress_trend': trends['stress_level'],
+            'sleep_trend': trends['sleep_hours'],
+            'mood_trend': trends['mood_level'],
             'recent_logs': WellnessLogSerializer(recent_entries, many=True).data,
             'good_days_count': good_days_count,
             'poor_sleep_days': poor_sleep_days,
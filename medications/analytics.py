@@ -0,0 +1,326 @@
+"""
+Medication adherence analytics over a date range.
+
+Every input is read with one query per table (user medications, reminders,
+logs, periods, wellness logs) and laid out on a day grid with NumPy:
+
+- scheduled doses per (medication, day) come from the active reminders'
+  days_of_week, or from `frequency` for medications without reminders
+- taken doses per (medication, day) are a bincount of log dates
+- cycle phase and pain level per day come from Period / WellnessLog
+  (pain_level 0 is the field default, so those days count as not logged)
+
+Results are cached per (user, range, data version). The version is bumped
+by signals whenever one of the user's medication, log, reminder, period or
+wellness rows is saved or deleted; bulk writes (imports, recalculate_chain)
+send no signals and are picked up when ANALYTICS_CACHE_TTL runs out.
+"""
+import logging
+import time
+from datetime import datetime, time as dt_time, timedelta
+import numpy as np
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.functions import TruncDate
+from notifications.timing import DEFAULT_TIMEZONE, get_zone
+from cycle_tracker.models import Period, WellnessLog
+from .models import MedicationLog, MedicationReminder, UserMedication
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RANGE_DAYS = 30
+MAX_RANGE_DAYS = 5 * 366
+
+# Backstop for cached reports; invalidation is by data version
+ANALYTICS_CACHE_TTL = 60 * 60 * 6
+
+# Scheduled doses per day for each UserMedication.frequency; weekly and
+# monthly fall on the start date's weekday / day of month
+DAILY_DOSES = {'daily': 1, 'twice_daily': 2, 'three_times_daily': 3}
+UNSCHEDULED = {'as_needed', 'custom'}
+
+# Same boundaries as PeriodViewSet.wellness_correlation
+PHASES = ('Menstrual', 'Follicular', 'Ovulation', 'Luteal', 'PMS')
+
+# Minimum paired days before a correlation is reported
+MIN_CORRELATION_DAYS = 5
+
+# Minimum distinct pain levels among those days; two levels are barely more than a yes/no
+MIN_PAIN_LEVELS = 3
+
+
+def data_version_key(user_id):
+    return f'medication_analytics_version:{user_id}'
+
+
+def data_version(user_id):
+    try:
+        return cache.get_or_set(data_version_key(user_id), time.time(), timeout=None)
+    except Exception as e:
+        logger.warning(f"Analytics version read failed: {e}")
+        return None
+
+
+def data_changed(user_id):
+    """Call after writing any row the user's adherence report is computed from."""
+    try:
+        cache.set(data_version_key(user_id), time.time(), timeout=None)
+    except Exception as e:
+        logger.warning(f"Analytics version update failed: {e}")
+
+
+def user_timezone(user):
+    try:
+        return user.notification_preferences.timezone
+    except ObjectDoesNotExist:
+        return DEFAULT_TIMEZONE
+
+
+def local_day_bounds(start, end, tz):
+    """
+    [start of `start`, start of the day after `end`) in `tz`, for filtering
+    datetimes by whole local days with an index range scan.
+    """
+    return (
+        datetime.combine(start, dt_time.min, tzinfo=tz),
+        datetime.combine(end + timedelta(days=1), dt_time.min, tzinfo=tz),
+    )
+
+
+# Day grid helpers
+
+def day_index(dates, start):
+    """Offsets of `dates` (a list of date objects) from `start`, as an int array."""
+    return (np.array(dates, dtype='datetime64[D]') - np.datetime64(start, 'D')).astype(int)
+
+
+def weekdays(days):
+    # 1970-01-01 was a Thursday (3)
+    return (days.astype(int) + 3) % 7
+
+
+def days_of_month(days):
+    return (days - days.astype('datetime64[M]')).astype(int) + 1
+
+
+def scheduled_doses(days, user_medication, reminders):
+    """Doses due on each day of `days` (0 outside the medication's start/end dates)."""
+    start_date = np.datetime64(user_medication['start_date'], 'D')
+    active = days >= start_date
+    if user_medication['end_date']:
+        active &= days <= np.datetime64(user_medication['end_date'], 'D')
+
+    if reminders:
+        # One dose per reminder on each of its weekdays (empty means every day)
+        per_weekday = np.zeros(7, dtype=int)
+        for days_of_week in reminders:
+            per_weekday[[int(d) for d in days_of_week] or slice(None)] += 1
+        doses = per_weekday[weekdays(days)]
+    else:
+        frequency = user_medication['frequency']
+        if frequency in DAILY_DOSES:
+            doses = np.full(len(days), DAILY_DOSES[frequency])
+        elif frequency == 'weekly':
+            doses = (weekdays(days) == user_medication['start_date'].weekday()).astype(int)
+        elif frequency == 'monthly':
+            # Short months take the dose on their last day
+            month_end = days_of_month((days.astype('datetime64[M]') + 1).astype('datetime64[D]') - 1)
+            doses = (days_of_month(days) == np.minimum(user_medication['start_date'].day, month_end)).astype(int)
+        else:
+            doses = np.zeros(len(days), dtype=int)
+    return np.where(active, doses, 0)
+
+
+def cycle_phases(days, periods):
+    """Index into PHASES for each day, or -1 before the first period and between cycles."""
+    if not periods:
+        return np.full(len(days), -1)
+    starts = np.array([p['start_date'] for p in periods], dtype='datetime64[D]')
+    lengths = np.array([p['cycle_length'] or 28 for p in periods])
+    next_starts = np.array(
+        [p['next_period_start_date'] or np.datetime64('NaT') for p in periods], dtype='datetime64[D]'
+    )
+
+    latest = np.searchsorted(starts, days, side='right') - 1
+    known = latest >= 0
+    latest = np.maximum(latest, 0)
+    since = (days - starts[latest]).astype(int)
+    length = lengths[latest]
+    # Past the expected cycle length but within 3 days of the next period
+    until_next = next_starts[latest] - days
+    late_pms = ~np.isnat(until_next) & (until_next > np.timedelta64(0, 'D')) & (until_next <= np.timedelta64(3, 'D'))
+
+    phases = np.select(
+        [since <= 5, since <= 13, since <= 16, since <= length - 4, since <= length, late_pms],
+        [0, 1, 2, 3, 4, 4],
+        default=-1,
+    )
+    return np.where(known, phases, -1)
+
+
+def correlation(x, y):
+    """Pearson r of two equal-length arrays, or None with too few points or no variance."""
+    if len(x) < MIN_CORRELATION_DAYS or np.std(x) == 0 or np.std(y) == 0:
+        return None
+    return round(float(np.corrcoef(x, y)[0, 1]), 3)
+
+
+def percent(part, whole):
+    return round(100.0 * float(part) / float(whole), 1) if whole else None
+
+
+def mean(values):
+    return round(float(np.mean(values)), 2) if len(values) else None
+
+
+def effectiveness_trend(log_days, ratings, start):
+    """Average effectiveness, its change per 30 days (least squares) and weekly averages."""
+    if not len(ratings):
+        return {'average': None, 'change_per_30_days': None, 'weekly': []}
+    slope = None
+    if len(np.unique(log_days)) >= 2:
+        slope = round(float(np.polyfit(log_days, ratings, 1)[0]) * 30, 3)
+    weeks = log_days // 7
+    counts = np.bincount(weeks)
+    sums = np.bincount(weeks, weights=ratings)
+    weekly = [
+        {
+            'week_start': (start + timedelta(days=int(week) * 7)).isoformat(),
+            'average': round(float(sums[week] / counts[week]), 2),
+            'count': int(counts[week]),
+        }
+        for week in np.flatnonzero(counts)
+    ]
+    return {'average': mean(ratings), 'change_per_30_days': slope, 'weekly': weekly}
+
+
+# Report
+
+def compute_adherence(user, start, end, user_medication_id=None):
+    tz = get_zone(user_timezone(user))
+    n_days = (end - start).days + 1
+    days = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+
+    medications = UserMedication.objects.filter(user=user, start_date__lte=end).exclude(end_date__lt=start)
+    range_start, range_end = local_day_bounds(start, end, tz)
+    logs = MedicationLog.objects.filter(user=user, date_taken__gte=range_start, date_taken__lt=range_end)
+    reminders = MedicationReminder.objects.filter(user=user, is_active=True)
+    if user_medication_id is not None:
+        medications = medications.filter(id=user_medication_id)
+        logs = logs.filter(user_medication_id=user_medication_id)
+        reminders = reminders.filter(user_medication_id=user_medication_id)
+
+    medications = list(medications.values(
+        'id', 'custom_name', 'medication__name', 'frequency', 'start_date', 'end_date', 'is_active'
+    ))
+    reminders_by_medication = {}
+    for reminder_medication, days_of_week in reminders.values_list('user_medication_id', 'days_of_week'):
+        reminders_by_medication.setdefault(reminder_medication, []).append(days_of_week or [])
+
+    # Dates in the user's timezone, computed by the database
+    log_rows = list(
+        logs.annotate(day=TruncDate('date_taken', tzinfo=tz)).values_list('user_medication_id', 'day', 'effectiveness')
+    )
+    periods = list(
+        Period.objects.filter(user=user, start_date__lte=end)
+        .order_by('start_date')
+        .values('start_date', 'cycle_length', 'next_period_start_date')
+    )
+    # pain_level defaults to 0 for wellness logs that did not record pain
+    pain = dict(
+        WellnessLog.objects.filter(user=user, date__gte=start, date__lte=end, pain_level__gt=0)
+        .values_list('date', 'pain_level')
+    )
+
+    row_of = {m['id']: i for i, m in enumerate(medications)}
+    taken = np.zeros((len(medications), n_days), dtype=int)
+    log_medication = np.array([row_of.get(row[0], -1) for row in log_rows], dtype=int)
+    log_day = day_index([row[1] for row in log_rows], start) if log_rows else np.zeros(0, dtype=int)
+    in_range = (log_medication >= 0) & (log_day >= 0) & (log_day < n_days)
+    log_medication, log_day = log_medication[in_range], log_day[in_range]
+    np.add.at(taken, (log_medication, log_day), 1)
+    ratings = np.array([row[2] if row[2] is not None else np.nan for row in log_rows], dtype=float)[in_range]
+
+    scheduled = np.array(
+        [scheduled_doses(days, m, reminders_by_medication.get(m['id'])) for m in medications], dtype=int
+    ).reshape(len(medications), n_days)
+    on_schedule = np.minimum(taken, scheduled)
+
+    phases = cycle_phases(days, periods)
+    pain_days = day_index(list(pain), start) if pain else np.zeros(0, dtype=int)
+    pain_levels = np.array(list(pain.values()), dtype=float)
+    pain_varies = len(np.unique(pain_levels)) >= MIN_PAIN_LEVELS
+
+    results = []
+    for row, medication in enumerate(medications):
+        is_scheduled = medication['frequency'] not in UNSCHEDULED or medication['id'] in reminders_by_medication
+        mine = log_medication == row
+        rated = mine & ~np.isnan(ratings)
+
+        by_phase = {}
+        for code, phase in enumerate(PHASES):
+            in_phase = phases == code
+            if not in_phase.any():
+                continue
+            phase_ratings = ratings[rated & in_phase[log_day]]
+            by_phase[phase] = {
+                'days': int(in_phase.sum()),
+                'adherence': percent(on_schedule[row][in_phase].sum(), scheduled[row][in_phase].sum()),
+                'taken_doses': int(taken[row][in_phase].sum()),
+                'average_effectiveness': mean(phase_ratings),
+            }
+
+        results.append({
+            'user_medication': medication['id'],
+            'name': medication['custom_name'] or medication['medication__name'],
+            'frequency': medication['frequency'],
+            'is_active': medication['is_active'],
+            'scheduled_doses': int(scheduled[row].sum()) if is_scheduled else None,
+            'taken_doses': int(taken[row].sum()),
+            'on_schedule_doses': int(on_schedule[row].sum()) if is_scheduled else None,
+            'missed_doses': int((scheduled[row] - on_schedule[row]).sum()) if is_scheduled else None,
+            'adherence': percent(on_schedule[row].sum(), scheduled[row].sum()) if is_scheduled else None,
+            'effectiveness': effectiveness_trend(log_day[rated], ratings[rated], start),
+            'cycle_phases': by_phase,
+            # Doses taken that day vs. the pain level logged the same day, over days
+            # with pain recorded; None without MIN_PAIN_LEVELS distinct levels
+            'pain_correlation': correlation(taken[row][pain_days], pain_levels) if pain_varies else None,
+        })
+
+    total_scheduled = int(sum(r['scheduled_doses'] or 0 for r in results))
+    total_on_schedule = int(sum(r['on_schedule_doses'] or 0 for r in results))
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'days': n_days,
+        'overall_adherence': percent(total_on_schedule, total_scheduled),
+        'scheduled_doses': total_scheduled,
+        'taken_doses': int(taken.sum()),
+        'medications': results,
+    }
+
+
+def adherence_report(user, start, end, user_medication_id=None):
+    """
+    compute_adherence() through the cache. Returns (report, cached).
+    """
+    version = data_version(user.id)
+    if version is None:
+        return compute_adherence(user, start, end, user_medication_id), False
+
+    key = f'medication_adherence:{user.id}:{start}:{end}:{user_medication_id or "all"}:{version}'
+    try:
+        report = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Adherence cache read failed: {e}")
+        report = None
+    if report is not None:
+        return report, True
+
+    report = compute_adherence(user, start, end, user_medication_id)
+    try:
+        cache.set(key, report, timeout=ANALYTICS_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"Adherence cache write failed: {e}")
+    return report, False
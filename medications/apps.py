@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class MedicationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'medications'
+
+    def ready(self):
+        import medications.signals  # Keeps search trie, interaction graph, adherence caches and reminders current
@@ -0,0 +1,341 @@
+import csv
+import gzip
+import hashlib
+import json
+from django.db.models.functions import Lower
+from .ingest import resolve_medication_types
+from .interactions import interactions_changed
+from .jsonstream import iter_json_arrays
+from .models import Medication, MedicationInteraction, MedicationType
+from .search import catalog_changed
+
+
+# Rows written per bulk statement
+LOAD_BATCH_SIZE = 1000
+
+# Errors kept in the report; the rest are only counted
+MAX_REPORTED_ERRORS = 500
+
+# In dependency order: medications name their type, interactions name medications
+CATALOG_KINDS = ('medication_types', 'medications', 'interactions')
+
+INTERACTION_TYPES = {choice for choice, _ in MedicationInteraction._meta.get_field('interaction_type').choices}
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+
+
+def content_hash(row):
+    return hashlib.sha1(json.dumps(row, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def as_bool(value, default):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def as_text(value):
+    return '' if value is None else str(value).strip()
+
+
+def as_dosages(value):
+    """List of dosages from a JSON list, a JSON-encoded list or 'a; b | c' text."""
+    if isinstance(value, list):
+        return [as_text(v) for v in value if as_text(v)]
+    value = as_text(value)
+    if value.startswith('['):
+        return as_dosages(json.loads(value))
+    return [part.strip() for part in value.replace('|', ';').split(';') if part.strip()]
+
+
+def medication_ref(record, field):
+    """(name, generic_name) a row refers to: "Name", {"name": ..., "generic_name": ...} or <field>_generic."""
+    value = record.get(field)
+    if isinstance(value, dict):
+        return as_text(value.get('name')), as_text(value.get('generic_name'))
+    return as_text(value), as_text(record.get(f'{field}_generic'))
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8-sig', newline='')
+    return open(path, encoding='utf-8-sig', newline='')
+
+
+def kind_from_path(path):
+    name = path.lower().rsplit('/', 1)[-1]
+    if 'interaction' in name:
+        return 'interactions'
+    if 'type' in name:
+        return 'medication_types'
+    if 'medication' in name or 'drug' in name:
+        return 'medications'
+    return None
+
+
+def iter_file_records(path, kind=None):
+    """
+    (kind, record) pairs from a catalog dump, read incrementally:
+    - .json: {"medication_types": [...], "medications": [...], "interactions": [...]}
+    - .ndjson/.jsonl: one object per line with a "kind" key
+    - .csv: one kind per file, from `kind` or the file name
+    Any of them may be gzipped (.gz).
+    """
+    base = path[:-3] if path.endswith('.gz') else path
+    with open_text(path) as stream:
+        if base.endswith('.csv'):
+            kind = kind or kind_from_path(base)
+            if kind not in CATALOG_KINDS:
+                raise ValueError(f"Cannot tell what {path} contains; pass --kind")
+            for record in csv.DictReader(stream):
+                yield kind, {key.strip(): value for key, value in record.items() if key}
+        elif base.endswith(('.ndjson', '.jsonl')):
+            for line in stream:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record.pop('kind', kind), record
+        elif base.endswith('.json'):
+            yield from iter_json_arrays(stream, CATALOG_KINDS)
+        else:
+            raise ValueError(f"Unsupported file type: {path}")
+
+
+class CatalogLoader:
+    """
+    Load medication types, medications and interactions from catalog dumps.
+
+    Records are buffered per kind and written in batches with one upsert
+    statement each. Every row stores a hash of the record it came from, so
+    re-running a load only writes records whose content changed. A batch of
+    a later kind first flushes the earlier kinds, and interactions naming a
+    medication that is not loaded yet are retried at the end, so references
+    resolve whatever order the file lists them in.
+    """
+
+    def __init__(self, batch_size=LOAD_BATCH_SIZE, force=False):
+        self.batch_size = batch_size
+        self.force = force
+        self.pending = {kind: [] for kind in CATALOG_KINDS}
+        self.stats = {kind: {'rows': 0, 'written': 0, 'unchanged': 0} for kind in CATALOG_KINDS}
+        self.error_count = 0
+        self.errors = []
+        # Interactions whose medications were not in the catalog yet
+        self.deferred = []
+        self.finishing = False
+
+    def add_error(self, kind, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'kind': kind, 'error': message})
+
+    def add(self, kind, record):
+        if kind not in CATALOG_KINDS:
+            self.add_error(kind, f"Unknown record kind '{kind}'")
+            return
+        self.stats[kind]['rows'] += 1
+        try:
+            row = getattr(self, f'parse_{kind}')(record)
+        except (ValueError, TypeError) as e:
+            self.add_error(kind, str(e))
+            return
+        row['content_hash'] = content_hash(row)
+        self.pending[kind].append(row)
+        if len(self.pending[kind]) >= self.batch_size:
+            self.flush(kind)
+
+    def flush(self, kind):
+        """Write `kind`'s pending rows, after those of every kind it depends on."""
+        for earlier in CATALOG_KINDS[:CATALOG_KINDS.index(kind) + 1]:
+            rows, self.pending[earlier] = self.pending[earlier], []
+            if rows:
+                getattr(self, f'write_{earlier}')(rows)
+
+    def finish(self):
+        self.flush(CATALOG_KINDS[-1])
+        self.finishing = True
+        deferred, self.deferred = self.deferred, []
+        for start in range(0, len(deferred), self.batch_size):
+            self.write_interactions(deferred[start:start + self.batch_size])
+        if self.stats['medications']['written']:
+            catalog_changed()
+        if self.stats['interactions']['written']:
+            interactions_changed()
+        return self.summary()
+
+    def summary(self):
+        rows = sum(stats['rows'] for stats in self.stats.values())
+        return {
+            'rows': rows,
+            'kinds': self.stats,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+    # Parsing
+
+    def parse_medication_types(self, record):
+        name = as_text(record.get('name'))
+        if not name:
+            raise ValueError("Medication type without a name")
+        return {
+            'name': name[:100],
+            'description': as_text(record.get('description')),
+            'icon': as_text(record.get('icon'))[:50],
+            'color': as_text(record.get('color')) or '#007bff',
+            'is_active': as_bool(record.get('is_active'), True),
+        }
+
+    def parse_medications(self, record):
+        name = as_text(record.get('name'))
+        if not name:
+            raise ValueError("Medication without a name")
+        medication_type = record.get('medication_type') or record.get('type')
+        if isinstance(medication_type, dict):
+            medication_type = medication_type.get('name')
+        return {
+            'name': name[:200],
+            'generic_name': as_text(record.get('generic_name'))[:200],
+            'medication_type': as_text(medication_type)[:100] or 'Unknown',
+            'description': as_text(record.get('description')),
+            'common_dosages': as_dosages(record.get('common_dosages')),
+            'side_effects': as_text(record.get('side_effects')),
+            'contraindications': as_text(record.get('contraindications')),
+            'is_prescription': as_bool(record.get('is_prescription'), False),
+            'is_active': as_bool(record.get('is_active'), True),
+        }
+
+    def parse_interactions(self, record):
+        first = medication_ref(record, 'medication1')
+        second = medication_ref(record, 'medication2')
+        if not first[0] or not second[0]:
+            raise ValueError("Interaction needs medication1 and medication2")
+        interaction_type = as_text(record.get('interaction_type')).lower()
+        if interaction_type not in INTERACTION_TYPES:
+            raise ValueError(f"Unknown interaction_type '{interaction_type}' for {first[0]} + {second[0]}")
+        return {
+            'medication1': first,
+            'medication2': second,
+            'interaction_type': interaction_type,
+            'description': as_text(record.get('description')),
+            'recommendation': as_text(record.get('recommendation')),
+            'is_active': as_bool(record.get('is_active'), True),
+        }
+
+    # Writing
+
+    def write_medication_types(self, rows):
+        rows = list({row['name']: row for row in rows}.values())
+        stored = dict(
+            MedicationType.objects.filter(name__in=[row['name'] for row in rows]).values_list('name', 'content_hash')
+        )
+        changed = [row for row in rows if self.force or stored.get(row['name']) != row['content_hash']]
+        self.stats['medication_types']['unchanged'] += len(rows) - len(changed)
+        if not changed:
+            return
+        MedicationType.objects.bulk_create(
+            [MedicationType(**row) for row in changed],
+            update_conflicts=True,
+            unique_fields=['name'],
+            update_fields=['description', 'icon', 'color', 'is_active', 'content_hash', 'updated_at'],
+        )
+        self.stats['medication_types']['written'] += len(changed)
+
+    def write_medications(self, rows):
+        by_key = {Medication.make_catalog_key(row['name'], row['generic_name']): row for row in rows}
+        stored = dict(
+            Medication.objects.filter(catalog_key__in=by_key.keys()).values_list('catalog_key', 'content_hash')
+        )
+        changed = {key: row for key, row in by_key.items() if self.force or stored.get(key) != row['content_hash']}
+        self.stats['medications']['unchanged'] += len(by_key) - len(changed)
+        if not changed:
+            return
+        types = resolve_medication_types(row['medication_type'] for row in changed.values())
+        Medication.objects.bulk_create(
+            [
+                Medication(
+                    catalog_key=key,
+                    medication_type_id=types[row['medication_type']],
+                    **{field: value for field, value in row.items() if field != 'medication_type'}
+                )
+                for key, row in changed.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['catalog_key'],
+            update_fields=[
+                'name', 'generic_name', 'medication_type', 'description', 'common_dosages', 'side_effects',
+                'contraindications', 'is_prescription', 'is_active', 'content_hash', 'updated_at',
+            ],
+        )
+        self.stats['medications']['written'] += len(changed)
+
+    def resolve_medications(self, refs):
+        """{(name, generic_name): id}; a ref without generic name also matches by name alone."""
+        keys = {ref: Medication.make_catalog_key(*ref) for ref in refs}
+        ids = dict(Medication.objects.filter(catalog_key__in=keys.values()).values_list('catalog_key', 'id'))
+        resolved = {ref: ids[key] for ref, key in keys.items() if key in ids}
+
+        by_name = {ref[0].lower(): ref for ref in refs if ref not in resolved and not ref[1]}
+        if by_name:
+            matches = (
+                Medication.objects.annotate(lower_name=Lower('name'))
+                .filter(lower_name__in=by_name.keys())
+                .order_by('id')
+                .values_list('lower_name', 'id')
+            )
+            for lower_name, medication_id in matches:
+                resolved.setdefault(by_name[lower_name], medication_id)
+        return resolved
+
+    def write_interactions(self, rows):
+        ids = self.resolve_medications({row['medication1'] for row in rows} | {row['medication2'] for row in rows})
+        by_pair = {}
+        for row in rows:
+            first, second = ids.get(row['medication1']), ids.get(row['medication2'])
+            if (first is None or second is None) and not self.finishing:
+                self.deferred.append(row)
+                continue
+            if first is None or second is None:
+                missing = row['medication1'] if first is None else row['medication2']
+                self.add_error('interactions', f"Unknown medication '{missing[0]}'")
+                continue
+            if first == second:
+                self.add_error('interactions', f"Medication '{row['medication1'][0]}' cannot interact with itself")
+                continue
+            # One row per pair whichever way round the dump lists it
+            by_pair[(min(first, second), max(first, second))] = row
+        if not by_pair:
+            return
+
+        stored = {
+            (first, second): stored_hash
+            for first, second, stored_hash in MedicationInteraction.objects.filter(
+                medication1_id__in={pair[0] for pair in by_pair},
+                medication2_id__in={pair[1] for pair in by_pair},
+            ).values_list('medication1_id', 'medication2_id', 'content_hash')
+        }
+        changed = {pair: row for pair, row in by_pair.items() if self.force or stored.get(pair) != row['content_hash']}
+        self.stats['interactions']['unchanged'] += len(by_pair) - len(changed)
+        if not changed:
+            return
+        MedicationInteraction.objects.bulk_create(
+            [
+                MedicationInteraction(
+                    medication1_id=pair[0],
+                    medication2_id=pair[1],
+                    interaction_type=row['interaction_type'],
+                    description=row['description'],
+                    recommendation=row['recommendation'],
+                    is_active=row['is_active'],
+                    content_hash=row['content_hash'],
+                )
+                for pair, row in changed.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['medication1', 'medication2'],
+            update_fields=[
+                'interaction_type', 'description', 'recommendation', 'is_active', 'content_hash', 'updated_at'
+            ],
+        )
+        self.stats['interactions']['written'] += len(changed)
@@ -0,0 +1,129 @@
+"""
+Batch ingestion of OpenFDA label results into the Medication catalog.
+
+ingest_fda_results() maps a list of labels, resolves every medication type
+they name with one query (creating missing ones in one insert), and upserts
+all medications in a single bulk_create keyed by Medication.catalog_key.
+submit_ingest() runs the same thing on a background thread, for callers
+that should not wait for catalog writes.
+"""
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from django.db import close_old_connections, connection, transaction
+from .models import Medication, MedicationType
+from .search import catalog_changed
+
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_TYPE = 'Unknown'
+
+# Columns refreshed when an ingested label matches an existing medication
+UPSERT_FIELDS = [
+    'medication_type', 'description', 'side_effects', 'contraindications',
+    'is_prescription', 'common_dosages', 'updated_at',
+]
+
+# One writer thread: ingestion is small and ordering keeps upserts from racing
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='medication-ingest')
+
+
+def get_first(item, key, default=""):
+    value = item.get(key, [])
+    if isinstance(value, list) and value:
+        return value[0]
+    return default
+
+
+def extract_dosages(text):
+    if not text:
+        return []
+    return list(set(re.findall(r"\b\d+\s?mg\b", text.lower())))
+
+
+def map_fda_item(fda_item):
+    """Medication field values for one OpenFDA label, with the type by name."""
+    openfda = fda_item.get("openfda", {})
+    name = (get_first(openfda, "generic_name") or get_first(openfda, "brand_name")).title()
+    pharm_classes = openfda.get("pharm_class_epc", [])
+    return {
+        "name": name[:200],
+        "generic_name": get_first(openfda, "generic_name").lower()[:200],
+        "medication_type_name": (pharm_classes[0] if pharm_classes else UNKNOWN_TYPE)[:100],
+        "description": get_first(fda_item, "purpose") or get_first(fda_item, "indications_and_usage"),
+        "side_effects": get_first(fda_item, "warnings"),
+        "contraindications": get_first(fda_item, "do_not_use"),
+        "is_prescription": "OTC" not in get_first(openfda, "product_type"),
+        "common_dosages": extract_dosages(get_first(fda_item, "dosage_and_administration")),
+        "is_active": True,
+    }
+
+
+def resolve_medication_types(names):
+    """{name: MedicationType id}, creating missing types in one insert."""
+    names = set(names)
+    types = dict(MedicationType.objects.filter(name__in=names).values_list('name', 'id'))
+    missing = names - types.keys()
+    if missing:
+        MedicationType.objects.bulk_create(
+            [MedicationType(name=name) for name in missing], ignore_conflicts=True
+        )
+        types.update(MedicationType.objects.filter(name__in=missing).values_list('name', 'id'))
+    return types
+
+
+def upsert_medications(rows):
+    """
+    Insert or refresh medications from mapped rows (see map_fda_item) in one
+    statement. Returns the affected catalog keys in input order.
+    """
+    by_key = {}
+    for row in rows:
+        if not row['name']:
+            continue
+        # Later duplicates in the batch win, like later rows of a dump file
+        by_key[Medication.make_catalog_key(row['name'], row['generic_name'])] = row
+    if not by_key:
+        return []
+
+    types = resolve_medication_types(row['medication_type_name'] for row in by_key.values())
+    medications = [
+        Medication(
+            catalog_key=key,
+            medication_type_id=types[row['medication_type_name']],
+            **{field: value for field, value in row.items() if field != 'medication_type_name'}
+        )
+        for key, row in by_key.items()
+    ]
+    with transaction.atomic():
+        Medication.objects.bulk_create(
+            medications,
+            update_conflicts=True,
+            unique_fields=['catalog_key'],
+            update_fields=UPSERT_FIELDS,
+        )
+    transaction.on_commit(catalog_changed)
+    return list(by_key)
+
+
+def ingest_fda_results(fda_items):
+    """Upsert OpenFDA labels into the catalog. Returns their Medication rows in result order."""
+    keys = upsert_medications([map_fda_item(item) for item in fda_items])
+    medications = Medication.objects.select_related('medication_type').in_bulk(keys, field_name='catalog_key')
+    return [medications[key] for key in keys if key in medications]
+
+
+def _ingest_in_background(fda_items):
+    close_old_connections()
+    try:
+        ingest_fda_results(fda_items)
+    except Exception as e:
+        logger.error(f"Background OpenFDA ingestion failed: {e}")
+    finally:
+        connection.close()
+
+
+def submit_ingest(fda_items):
+    """Queue ingest_fda_results() on the writer thread and return immediately."""
+    return _executor.submit(_ingest_in_background, list(fda_items))
@@ -0,0 +1,196 @@
+"""
+Drug-interaction checks against an in-memory graph of active interactions.
+
+The graph maps each medication id to its interacting medications, so
+checking a list of k medications is k dictionary lookups instead of k²
+pair queries. It is loaded once per process and reloaded when the shared
+interactions version changes (bumped by MedicationInteraction signals and
+by load_medications).
+
+scan_new_interactions() is the batch side: it finds users whose active
+medication lists contain both ends of a recently added interaction and
+notifies them.
+"""
+import logging
+import threading
+import time
+from django.core.cache import cache
+from .models import MedicationInteraction, UserMedication
+
+
+logger = logging.getLogger(__name__)
+
+SEVERITY_RANK = {'minor': 1, 'moderate': 2, 'major': 3, 'severe': 4}
+
+INTERACTIONS_VERSION_KEY = 'medication_interactions_version'
+
+# Without the shared version, reload on this interval instead
+GRAPH_UNVERSIONED_REFRESH = 60
+
+
+def interactions_version():
+    try:
+        return cache.get_or_set(INTERACTIONS_VERSION_KEY, time.time(), timeout=None)
+    except Exception as e:
+        logger.warning(f"Interactions version read failed: {e}")
+        return None
+
+
+def interactions_changed():
+    """Call after writing MedicationInteraction rows so every process reloads its graph."""
+    try:
+        cache.set(INTERACTIONS_VERSION_KEY, time.time(), timeout=None)
+    except Exception as e:
+        logger.warning(f"Interactions version update failed: {e}")
+
+
+class InteractionGraph:
+    """Adjacency map: medication id -> {other medication id: (interaction id, interaction type)}."""
+
+    __slots__ = ('edges', 'size')
+
+    def __init__(self, rows):
+        self.edges = {}
+        self.size = 0
+        for interaction_id, first, second, interaction_type in rows:
+            edge = (interaction_id, interaction_type)
+            self.edges.setdefault(first, {})[second] = edge
+            self.edges.setdefault(second, {})[first] = edge
+            self.size += 1
+
+    def check(self, medication_ids):
+        """
+        Interactions among `medication_ids`, most severe first, as
+        (interaction id, interaction type, medication id, other medication id).
+        """
+        ids = set(medication_ids)
+        found = {}
+        for medication_id in ids:
+            for other_id, (interaction_id, interaction_type) in self.edges.get(medication_id, {}).items():
+                if other_id in ids and interaction_id not in found:
+                    found[interaction_id] = (interaction_id, interaction_type, medication_id, other_id)
+        return sorted(found.values(), key=lambda edge: (-SEVERITY_RANK.get(edge[1], 0), edge[0]))
+
+
+_graph = None
+_graph_lock = threading.Lock()
+_graph_state = {'version': None, 'loaded_at': 0.0}
+
+
+def get_graph():
+    """The process-wide graph, reloaded if interactions changed since it was built."""
+    global _graph
+    version = interactions_version()
+    if _graph is not None:
+        if version is not None and version == _graph_state['version']:
+            return _graph
+        if version is None and time.monotonic() - _graph_state['loaded_at'] < GRAPH_UNVERSIONED_REFRESH:
+            return _graph
+
+    with _graph_lock:
+        if _graph is not None and version is not None and version == _graph_state['version']:
+            return _graph
+        rows = MedicationInteraction.objects.filter(is_active=True).values_list(
+            'id', 'medication1_id', 'medication2_id', 'interaction_type'
+        )
+        _graph = InteractionGraph(rows.iterator())
+        _graph_state['version'] = version
+        _graph_state['loaded_at'] = time.monotonic()
+        return _graph
+
+
+def user_medication_ids(user_id):
+    return set(
+        UserMedication.objects.filter(user_id=user_id, is_active=True).values_list('medication_id', flat=True)
+    )
+
+
+def check_interactions(medication_ids):
+    """
+    MedicationInteraction rows (with both medications loaded) among
+    `medication_ids`, most severe first. One graph pass plus one query.
+    """
+    edges = get_graph().check(medication_ids)
+    if not edges:
+        return []
+    interactions = MedicationInteraction.objects.select_related('medication1', 'medication2').in_bulk(
+        [edge[0] for edge in edges]
+    )
+    return [interactions[edge[0]] for edge in edges if edge[0] in interactions]
+
+
+def highest_severity(interactions):
+    if not interactions:
+        return None
+    return max((i.interaction_type for i in interactions), key=lambda t: SEVERITY_RANK.get(t, 0))
+
+
+def interaction_notification(user_id, interaction):
+    from notifications.models import Notification
+    from notifications.rules import candidate
+    first, second = interaction.medication1.name, interaction.medication2.name
+    message = f"{first} and {second} can interact ({interaction.get_interaction_type_display().lower()})."
+    if interaction.recommendation:
+        message = f"{message} {interaction.recommendation}"
+    notification = candidate(
+        user_id, 'medication_interaction',
+        'Medication Interaction Warning',
+        message,
+        related_id=interaction.id,
+        related_type='medication_interaction',
+    )
+    # One per interaction and severity: re-scans never notify twice, an upgrade notifies again
+    notification.dedup_key = Notification.make_dedup_key(
+        user_id, 'medication_interaction', interaction.interaction_type, interaction.id, interaction.created_at.date()
+    )
+    return notification
+
+
+def scan_new_interactions(since, chunk_size=5000, dry_run=False):
+    """
+    Notify every user with both medications of an interaction added or
+    changed since `since` on their active list. Changes that keep the
+    severity are not notified again. Returns stats.
+    """
+    from notifications.engine import save_notifications
+
+    # updated_at is set on insert too, and moved by CatalogLoader's upserts
+    new = list(
+        MedicationInteraction.objects.filter(is_active=True, updated_at__gte=since)
+        .select_related('medication1', 'medication2')
+    )
+    stats = {'interactions': len(new), 'affected_users': 0, 'notified': 0}
+    if not new:
+        return stats
+
+    by_medication = {}
+    for interaction in new:
+        by_medication.setdefault(interaction.medication1_id, []).append(interaction)
+        by_medication.setdefault(interaction.medication2_id, []).append(interaction)
+
+    # user -> ids of their active medications that appear in a new interaction
+    holdings = {}
+    rows = UserMedication.objects.filter(
+        is_active=True, medication_id__in=by_medication.keys()
+    ).values_list('user_id', 'medication_id').iterator(chunk_size=chunk_size)
+    for user_id, medication_id in rows:
+        holdings.setdefault(user_id, set()).add(medication_id)
+
+    candidates = []
+    for user_id, medication_ids in holdings.items():
+        hits = {
+            interaction.id: interaction
+            for medication_id in medication_ids
+            for interaction in by_medication[medication_id]
+            if interaction.medication1_id in medication_ids and interaction.medication2_id in medication_ids
+        }
+        if hits:
+            stats['affected_users'] += 1
+            candidates.extend(interaction_notification(user_id, i) for i in hits.values())
+
+    if dry_run:
+        stats['notified'] = len(candidates)
+        return stats
+    for start in range(0, len(candidates), chunk_size):
+        stats['notified'] += len(save_notifications(candidates[start:start + chunk_size]))
+    return stats
@@ -0,0 +1,59 @@
+"""
+Incremental reader for large JSON dump files whose payload is one or more
+top-level arrays of objects, e.g. {"meta": {...}, "results": [{...}, ...]}.
+Objects are decoded one at a time from a bounded buffer, so memory use
+does not grow with the file.
+"""
+import codecs
+import json
+import re
+
+
+def array_pattern(keys):
+    """Regex matching `"<key>": [` for any of `keys`; group 1 is the key."""
+    return re.compile(r'"(%s)"\s*:\s*\[' % '|'.join(re.escape(key) for key in keys))
+
+
+def iter_json_arrays(stream, keys, chunk_size=1 << 20):
+    """
+    Yield (key, object) for every object in the arrays stored under `keys`,
+    in file order. `stream` may be text or binary (decoded as UTF-8).
+    A key whose value is not an array (OpenFDA's meta.results) is ignored.
+    """
+    pattern = array_pattern(keys)
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    current = None
+
+    while True:
+        if current is None:
+            match = pattern.search(buffer)
+            if match:
+                current = match.group(1)
+                buffer = buffer[match.end():]
+                continue
+            # Keep only enough tail to complete a key split across chunks
+            buffer = buffer[-200:]
+        else:
+            stripped = buffer.lstrip().lstrip(',').lstrip()
+            if stripped.startswith(']'):
+                buffer = stripped[1:]
+                current = None
+                continue
+            if stripped:
+                try:
+                    record, end = decoder.raw_decode(stripped)
+                except ValueError:
+                    # Object continues in the next chunk
+                    pass
+                else:
+                    yield current, record
+                    buffer = stripped[end:]
+                    continue
+            buffer = stripped
+
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        buffer += utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from medications.models import Medication
+
+
+class Command(BaseCommand):
+    help = 'Fill Medication.catalog_key for medications stored before the field existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows updated per query (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        taken = set(Medication.objects.exclude(catalog_key=None).values_list('catalog_key', flat=True))
+        pending = []
+        duplicates = []
+        for medication in Medication.objects.filter(catalog_key=None).only('id', 'name', 'generic_name').order_by('id'):
+            key = Medication.make_catalog_key(medication.name, medication.generic_name)
+            if key in taken:
+                # Differs from another row only by case/whitespace; left for manual merge
+                duplicates.append(medication)
+                continue
+            taken.add(key)
+            medication.catalog_key = key
+            pending.append(medication)
+
+        Medication.objects.bulk_update(pending, ['catalog_key'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Backfilled {len(pending)} medications'))
+        for medication in duplicates:
+            self.stdout.write(self.style.WARNING(
+                f'  Duplicate of an existing catalog entry, not keyed: #{medication.id} {medication}'
+            ))
@@ -0,0 +1,47 @@
+import time
+from itertools import islice
+from django.core.management.base import BaseCommand, CommandError
+from medications.openfda import INDEX_BATCH_SIZE, index_labels, iter_dump_records
+
+
+class Command(BaseCommand):
+    help = 'Build the offline OpenFDA search index from downloaded drug label dump files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='+',
+            help='Dump files: drug-label-*.json.zip from open.fda.gov/downloads, .json(.gz) or .ndjson',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=INDEX_BATCH_SIZE,
+            help=f'Labels written per transaction (default: {INDEX_BATCH_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        started = time.monotonic()
+        total = 0
+        for path in options['paths']:
+            records = iter_dump_records(path)
+            indexed = 0
+            try:
+                while True:
+                    batch = list(islice(records, options['batch_size']))
+                    if not batch:
+                        break
+                    indexed += index_labels(batch)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'{path}: {str(e)}')
+            total += indexed
+            self.stdout.write(self.style.SUCCESS(f'✓ Indexed {indexed} labels from {path}'))
+
+        elapsed = time.monotonic() - started
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(f'\n✓ Complete! Indexed {total} labels ({rate:.0f} labels/sec)')
+        )
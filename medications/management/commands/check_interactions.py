@@ -0,0 +1,49 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from medications.interactions import scan_new_interactions
+
+
+class Command(BaseCommand):
+    help = "Notify users whose active medications include both sides of a new or upgraded interaction"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=24,
+            help='Check interactions added or changed in the last N hours (default: 24)',
+        )
+        parser.add_argument(
+            '--since',
+            help='Check interactions added or changed since this ISO datetime instead of --hours',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count the notifications that would be sent without saving them',
+        )
+
+    def handle(self, *args, **options):
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError(f"Invalid --since datetime: {options['since']}")
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+        else:
+            if options['hours'] < 1:
+                raise CommandError('--hours must be at least 1')
+            since = timezone.now() - timedelta(hours=options['hours'])
+
+        stats = scan_new_interactions(since, dry_run=options['dry_run'])
+        if not stats['interactions']:
+            self.stdout.write(self.style.WARNING(f'No interactions added or changed since {since:%Y-%m-%d %H:%M}'))
+            return
+
+        verb = 'Would notify' if options['dry_run'] else 'Notified'
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {stats['interactions']} new or changed interactions; {verb} {stats['affected_users']} users "
+            f"({stats['notified']} notifications)"
+        ))
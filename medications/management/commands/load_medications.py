@@ -0,0 +1,65 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from medications.importers import CATALOG_KINDS, LOAD_BATCH_SIZE, CatalogLoader, iter_file_records
+
+
+class Command(BaseCommand):
+    help = 'Load medication types, medications and interactions from JSON/NDJSON/CSV catalog dumps'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Dump files (.json, .ndjson, .csv, optionally .gz)')
+        parser.add_argument(
+            '--kind',
+            choices=CATALOG_KINDS,
+            help='What CSV files contain, when the file name does not say',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=LOAD_BATCH_SIZE,
+            help=f'Rows per bulk upsert (default: {LOAD_BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Write every row, even those whose content hash is unchanged',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        loader = CatalogLoader(options['batch_size'], options['force'])
+        started = time.monotonic()
+
+        for path in options['paths']:
+            try:
+                for kind, record in iter_file_records(path, options['kind']):
+                    loader.add(kind, record)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'{path}: {str(e)}')
+            self.stdout.write(f'  Read {path}')
+
+        summary = loader.finish()
+        elapsed = time.monotonic() - started
+
+        for error in summary['errors']:
+            self.stdout.write(self.style.WARNING(f"  {error['kind']}: {error['error']}"))
+        if summary['error_count'] > len(summary['errors']):
+            self.stdout.write(self.style.WARNING(
+                f"  ... and {summary['error_count'] - len(summary['errors'])} more errors"
+            ))
+
+        for kind, stats in summary['kinds'].items():
+            if stats['rows']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"✓ {kind}: {stats['written']} written, {stats['unchanged']} unchanged of {stats['rows']} rows"
+                ))
+
+        rate = summary['rows'] / elapsed if elapsed else summary['rows']
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\n✓ Complete! {summary['rows']} rows ({summary['error_count']} errors) "
+                f"in {elapsed:.1f}s ({rate:.0f} rows/sec)"
+            )
+        )
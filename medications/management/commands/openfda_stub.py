@@ -0,0 +1,135 @@
+import json
+import os
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from django.core.management.base import BaseCommand, CommandError
+from medications.openfda import iter_dump_records, label_terms, normalize_term
+
+
+DEFAULT_FIXTURE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'fixtures', 'openfda_labels.json'
+)
+
+# First field:value clause of the search parameter, e.g. openfda.generic_name:ibu*
+SEARCH_TERM = re.compile(r'[\w.]+:(?:"([^"]*)"|([^\s*]+))')
+
+
+def match_labels(labels, term, limit):
+    words = normalize_term(term).split()
+    results = [
+        record for record, terms in labels
+        if words and all(any(t.startswith(word) for t in terms) for word in words)
+    ]
+    return results[:limit]
+
+
+def load_labels(fixture=DEFAULT_FIXTURE):
+    """(record, index terms) pairs the stub serves."""
+    return [(record, label_terms(record)) for record in iter_dump_records(fixture)]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers /drug/label.json from server.labels like OpenFDA, 404 included."""
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        server = self.server
+        server.requests += 1
+        url = urlparse(self.path)
+        if server.latency:
+            time.sleep(server.latency)
+        if not url.path.endswith('/drug/label.json'):
+            return self.send_json(404, {'error': {'code': 'NOT_FOUND', 'message': 'Unknown endpoint'}})
+        if server.error_rate and random.random() < server.error_rate:
+            return self.send_json(500, {'error': {'code': 'SERVER_ERROR', 'message': 'Simulated failure'}})
+
+        params = parse_qs(url.query)
+        match = SEARCH_TERM.search(params.get('search', [''])[0])
+        try:
+            limit = int(params.get('limit', ['1'])[0])
+        except ValueError:
+            limit = 1
+        results = match_labels(server.labels, (match.group(1) or match.group(2)) if match else '', limit)
+        if not results:
+            return self.send_json(404, {'error': {'code': 'NOT_FOUND', 'message': 'No matches found!'}})
+        self.send_json(200, {
+            'meta': {'results': {'skip': 0, 'limit': limit, 'total': len(results)}},
+            'results': results,
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_stub_server(labels, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0):
+    """
+    Stub server, not yet serving; port 0 picks a free port. Tests run
+    serve_forever() on a thread and point OPENFDA_URL at stub_url(server).
+    server.requests counts the requests received.
+    """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.labels = labels
+    server.latency = latency
+    server.error_rate = error_rate
+    server.requests = 0
+    return server
+
+
+def stub_url(server):
+    host, port = server.server_address[:2]
+    return f'http://{host}:{port}/drug/label.json'
+
+
+class Command(BaseCommand):
+    help = 'Serve a local stand-in for the OpenFDA drug label API (set OPENFDA_URL to it in tests)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument(
+            '--fixture',
+            default=DEFAULT_FIXTURE,
+            help='Label dump file to serve (default: medications/fixtures/openfda_labels.json)',
+        )
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.0,
+            help='Seconds to wait before every response, to simulate a slow upstream',
+        )
+        parser.add_argument(
+            '--error-rate',
+            type=float,
+            default=0.0,
+            help='Fraction of requests answered with HTTP 500 (0-1)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            labels = load_labels(options['fixture'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"{options['fixture']}: {str(e)}")
+
+        server = make_stub_server(
+            labels, options['host'], options['port'], options['latency'], options['error_rate']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ OpenFDA stub serving {len(labels)} labels on {stub_url(server)}"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
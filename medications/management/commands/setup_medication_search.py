@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from medications.search import create_trigram_indexes, get_trie, search_backend
+
+
+class Command(BaseCommand):
+    help = 'Create the pg_trgm GIN indexes for medication search, or report the in-memory trie fallback'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            create_trigram_indexes()
+            self.stdout.write(self.style.SUCCESS('✓ pg_trgm extension and GIN indexes are in place'))
+        except Exception as e:
+            self.stdout.write(self.style.WARNING(f'⚠ Trigram indexes unavailable ({str(e).strip()})'))
+
+        backend = search_backend()
+        if backend == 'trie':
+            try:
+                trie = get_trie()
+            except Exception as e:
+                raise CommandError(f'Could not build the search trie: {str(e)}')
+            self.stdout.write(f'  Searches use the in-memory trie ({trie.size} word entries)')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Complete! Search backend: {backend} ({elapsed:.1f}s)'))
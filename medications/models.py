@@ -1,6 +1,12 @@
+import hashlib
+from datetime import datetime, time, timedelta
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.exceptions import ObjectDoesNotExist
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from notifications.timing import DEFAULT_TIMEZONE, get_zone, next_local_time
 
 
 class MedicationType(models.Model):
@@ -10,6 +16,8 @@ class MedicationType(models.Model):
     icon = models.CharField(max_length=50, blank=True, help_text="Icon name for UI")
     color = models.CharField(max_length=7, default="#007bff", help_text="Hex color code")
     is_active = models.BooleanField(default=True)
+    # Hash of the dump row last loaded by load_medications; unchanged rows are skipped
+    content_hash = models.CharField(max_length=40, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -32,6 +40,9 @@ class Medication(models.Model):
     contraindications = models.TextField(blank=True)
     is_prescription = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
+    # Case/whitespace-insensitive identity used for upserts, see make_catalog_key()
+    catalog_key = models.CharField(max_length=191, null=True, blank=True, unique=True, editable=False)
+    content_hash = models.CharField(max_length=40, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -42,6 +53,36 @@ class Medication(models.Model):
     def __str__(self):
         return f"{self.name} ({self.generic_name})" if self.generic_name else self.name
 
+    @staticmethod
+    def make_catalog_key(name, generic_name):
+        key = f"{' '.join(name.lower().split())}|{' '.join((generic_name or '').lower().split())}"
+        if len(key) > 191:
+            return hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return key
+
+    def save(self, *args, **kwargs):
+        self.catalog_key = self.make_catalog_key(self.name, self.generic_name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'name', 'generic_name'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'catalog_key'}
+        super().save(*args, **kwargs)
+
+
+class UserMedicationQuerySet(models.QuerySet):
+    def with_log_stats(self):
+        """Annotate logs_count and last_taken with correlated subqueries (no join fan-out)."""
+        logs = MedicationLog.objects.filter(user_medication=models.OuterRef('pk')).order_by().values('user_medication')
+        return self.annotate(
+            logs_count=Coalesce(
+                models.Subquery(logs.annotate(count=models.Count('id')).values('count')),
+                0,
+            ),
+            last_taken=models.Subquery(logs.annotate(last=models.Max('date_taken')).values('last')),
+        )
+
+    def for_listing(self):
+        return self.select_related('medication__medication_type').with_log_stats()
+
 
 class UserMedication(models.Model):
     """User's personal medication tracking"""
@@ -68,6 +109,8 @@ class UserMedication(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = UserMedicationQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
         unique_together = ('user', 'medication')
@@ -79,6 +122,18 @@ class UserMedication(models.Model):
     def medication_name(self):
         return self.custom_name or self.medication.name
 
+    def reschedule_reminders(self):
+        """Recompute next_fire_at of this medication's reminders (after is_active/start/end changes)."""
+        try:
+            tz_name = self.user.notification_preferences.timezone
+        except ObjectDoesNotExist:
+            tz_name = DEFAULT_TIMEZONE
+        reminders = list(self.reminders.all())
+        for reminder in reminders:
+            reminder.user_medication = self
+            reminder.next_fire_at = reminder.compute_next_fire_at(tz_name=tz_name)
+        MedicationReminder.objects.bulk_update(reminders, ['next_fire_at'])
+
 
 class MedicationLog(models.Model):
     """Daily medication intake tracking"""
@@ -97,6 +152,11 @@ class MedicationLog(models.Model):
 
     class Meta:
         ordering = ['-date_taken']
+        indexes = [
+            # Date-range scans of one medication's logs and of all of a user's logs
+            models.Index(fields=['user', 'user_medication', 'date_taken']),
+            models.Index(fields=['user', 'date_taken']),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.user_medication.medication_name} on {self.date_taken.date()}"
@@ -109,15 +169,47 @@ class MedicationReminder(models.Model):
     reminder_time = models.TimeField()
     is_active = models.BooleanField(default=True)
     days_of_week = models.JSONField(default=list, help_text="List of weekday numbers (0=Monday, 6=Sunday)")
+    # Next reminder_time on one of days_of_week in the user's timezone, picked up by run_scheduler
+    next_fire_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['reminder_time']
+        indexes = [
+            models.Index(fields=['is_active', 'next_fire_at']),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.user_medication.medication_name} at {self.reminder_time}"
 
+    def compute_next_fire_at(self, after=None, tz_name=None):
+        """
+        Next firing time after `after`, or None when the reminder or its
+        medication is inactive or the medication's end_date has passed.
+        Never before the medication's start_date.
+        """
+        user_medication = self.user_medication
+        if not self.is_active or not user_medication.is_active:
+            return None
+        if tz_name is None:
+            try:
+                tz_name = self.user.notification_preferences.timezone
+            except ObjectDoesNotExist:
+                tz_name = DEFAULT_TIMEZONE
+        tz = get_zone(tz_name)
+        after = after or timezone.now()
+        # next_local_time() is strictly after its start, so a 00:00 reminder still fires on start_date
+        first_day = datetime.combine(user_medication.start_date, time.min, tzinfo=tz) - timedelta(microseconds=1)
+        fire_at = next_local_time(max(after, first_day), self.reminder_time, tz_name, self.days_of_week)
+        if fire_at and user_medication.end_date and fire_at.astimezone(tz).date() > user_medication.end_date:
+            return None
+        return fire_at
+
+    def save(self, *args, **kwargs):
+        self.next_fire_at = self.compute_next_fire_at()
+        super().save(*args, **kwargs)
+
 
 class MedicationInteraction(models.Model):
     """Track potential medication interactions"""
@@ -132,10 +224,56 @@ class MedicationInteraction(models.Model):
     description = models.TextField()
     recommendation = models.TextField(blank=True)
     is_active = models.BooleanField(default=True)
+    content_hash = models.CharField(max_length=40, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Also moved by catalog upserts, so check_interactions rescans changed severities
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ['medication1', 'medication2']
 
     def __str__(self):
-        return f"{self.medication1.name} + {self.medication2.name} ({self.interaction_type})"
\ No newline at end of file
+        return f"{self.medication1.name} + {self.medication2.name} ({self.interaction_type})"
+
+class OpenFDAQuery(models.Model):
+    """Cached OpenFDA label search response for one normalized search term"""
+    term = models.CharField(max_length=191, unique=True)
+    limit = models.PositiveIntegerField()
+    response = models.JSONField(default=dict)
+    fetched_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.term} (until {self.expires_at})"
+
+    @property
+    def is_fresh(self):
+        return self.expires_at > timezone.now()
+
+
+class OpenFDALabel(models.Model):
+    """Drug label from a downloaded OpenFDA dump, used by offline search"""
+    label_id = models.CharField(max_length=64, unique=True)
+    generic_name = models.CharField(max_length=255, blank=True)
+    brand_name = models.CharField(max_length=255, blank=True)
+    # Trimmed label record in the same shape as an API result
+    data = models.JSONField(default=dict)
+    effective_time = models.CharField(max_length=8, blank=True)
+
+    class Meta:
+        ordering = ['generic_name']
+
+    def __str__(self):
+        return self.generic_name or self.brand_name or self.label_id
+
+
+class OpenFDALabelTerm(models.Model):
+    """Inverted index: one row per word of a label's generic/brand name and active ingredients"""
+    term = models.CharField(max_length=100, db_index=True)
+    label = models.ForeignKey(OpenFDALabel, on_delete=models.CASCADE, related_name='terms')
+
+    class Meta:
+        unique_together = ['term', 'label']
+
+    def __str__(self):
+        return f"{self.term} -> {self.label_id}"
@@ -0,0 +1,401 @@
+"""
+OpenFDA drug label search with a persistent result cache and an offline index.
+
+asearch_labels() is the entry point, used by the async medication_search view:
+
+- Offline mode (settings.OPENFDA_OFFLINE): answer from OpenFDALabel rows
+  built by `build_openfda_index` from a downloaded label dump. No request
+  ever leaves the box.
+- Online mode: answer from the OpenFDAQuery cache while it is fresh,
+  otherwise call settings.OPENFDA_URL once and store the response (empty
+  results are cached too, for a shorter time). If the upstream call fails,
+  fall back to the offline index when one has been built.
+
+Under ASGI it shares one pooled HTTP client per event loop; under WSGI,
+where every request runs in a new loop, each call opens and closes its
+own. Identical in-flight queries are coalesced into a single upstream call
+behind a circuit breaker: after repeated failures or slow answers the
+upstream is skipped for a while and the offline index answers instead.
+
+Responses always have the OpenFDA shape {"results": [label, ...]}.
+"""
+import asyncio
+import gzip
+import json
+import logging
+import re
+import threading
+import time
+import weakref
+import zipfile
+from datetime import timedelta
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .jsonstream import iter_json_arrays
+from .models import OpenFDALabel, OpenFDALabelTerm, OpenFDAQuery
+
+
+logger = logging.getLogger(__name__)
+
+# Shorter terms match too much of the catalog to be worth a remote call
+MIN_TERM_LENGTH = 3
+
+# Label keys kept in the offline index (what ingest.map_fda_item reads)
+LABEL_FIELDS = (
+    'id', 'set_id', 'effective_time', 'openfda', 'active_ingredient', 'purpose',
+    'indications_and_usage', 'warnings', 'do_not_use', 'dosage_and_administration',
+)
+
+# openfda keys whose words are indexed for offline prefix search
+INDEXED_OPENFDA_FIELDS = ('generic_name', 'brand_name', 'substance_name')
+
+# Label rows written per transaction while building the index
+INDEX_BATCH_SIZE = 500
+
+
+def normalize_term(term):
+    """Lowercase, drop query syntax characters and collapse whitespace: 'Ibuprofen* ' -> 'ibuprofen'."""
+    term = re.sub(r'[^\w\s-]', ' ', (term or '').lower())
+    return ' '.join(term.split())
+
+
+def tokenize(text):
+    return {word for word in re.split(r'[^\w]+', (text or '').lower()) if len(word) > 1}
+
+
+def build_search_query(term):
+    """OpenFDA query string: prefix match on generic name, brand name or active ingredient."""
+    # Wildcards only apply to single words; several words are matched as a phrase
+    term = f'"{term}"' if ' ' in term else f'{term}*'
+    return (
+        f"openfda.generic_name:{term} OR "
+        f"openfda.brand_name:{term} OR "
+        f"active_ingredient:{term}"
+    )
+
+
+# Cache
+
+def get_cached(term, limit):
+    """Fresh cached response for `term` with at least `limit` results requested, else None."""
+    entry = OpenFDAQuery.objects.filter(term=term, expires_at__gt=timezone.now()).first()
+    if entry is None or entry.limit < limit:
+        return None
+    return {'results': entry.response.get('results', [])[:limit]}
+
+
+def store_cached(term, limit, response):
+    now = timezone.now()
+    ttl = settings.OPENFDA_CACHE_TTL if response.get('results') else settings.OPENFDA_NEGATIVE_CACHE_TTL
+    try:
+        OpenFDAQuery.objects.update_or_create(
+            term=term,
+            defaults={
+                'limit': limit,
+                'response': {'results': response.get('results', [])},
+                'fetched_at': now,
+                'expires_at': now + timedelta(seconds=ttl),
+            }
+        )
+    except Exception as e:
+        # A concurrent request cached the same term; either row is fine
+        logger.warning(f"OpenFDA cache write failed for '{term}': {e}")
+
+
+# Upstream
+
+class CircuitBreaker:
+    """
+    Stops calling a failing or slow upstream. After `failure_threshold`
+    consecutive failures (errors, or answers slower than `slow_seconds`)
+    the circuit opens and allow() is False for `reset_seconds`; then one
+    trial call is let through, and its outcome closes or reopens it.
+    Shared by threads and event loops of one process.
+    """
+
+    def __init__(self, failure_threshold, slow_seconds, reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.slow_seconds = slow_seconds
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.reset_seconds:
+            return 'open'
+        return 'half-open'
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record(self, ok, elapsed):
+        with self.lock:
+            self.trial_running = False
+            if ok and elapsed < self.slow_seconds:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                if self.opened_at is None or self.state == 'half-open':
+                    logger.warning(f"OpenFDA circuit opened after {self.failures} failed or slow calls")
+                self.opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker(
+    settings.OPENFDA_BREAKER_FAILURES,
+    settings.OPENFDA_BREAKER_SLOW_SECONDS,
+    settings.OPENFDA_BREAKER_RESET_SECONDS,
+)
+
+
+def new_client():
+    return httpx.AsyncClient(
+        timeout=settings.OPENFDA_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=settings.OPENFDA_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPENFDA_MAX_CONNECTIONS,
+        ),
+    )
+
+
+# Per event loop: the pooled client and the in-flight requests by (term, limit)
+_loop_state = weakref.WeakKeyDictionary()
+
+
+def get_loop_state():
+    loop = asyncio.get_running_loop()
+    state = _loop_state.get(loop)
+    if state is None:
+        state = {'client': None, 'inflight': {}}
+        _loop_state[loop] = state
+    return state
+
+
+async def afetch_remote(client, term, limit):
+    """
+    Call OpenFDA and cache the answer. Returns the response dict
+    ({'results': []} when nothing matches) or None when the upstream is
+    unreachable or errors. The breaker was checked by the caller.
+    """
+    params = {'search': build_search_query(term), 'limit': limit}
+    started = time.monotonic()
+    ok = False
+    try:
+        response = await client.get(settings.OPENFDA_URL, params=params)
+        if response.status_code == 404:
+            # OpenFDA answers "no matches" with 404 NOT_FOUND
+            result = {'results': []}
+        else:
+            response.raise_for_status()
+            result = response.json()
+        ok = True
+    except (httpx.HTTPError, ValueError) as e:
+        logger.warning(f"OpenFDA request failed for '{term}': {e}")
+        return None
+    finally:
+        # Also on cancellation, which would otherwise leave a half-open trial running
+        breaker.record(ok, time.monotonic() - started)
+    await sync_to_async(store_cached)(term, limit, result)
+    return result
+
+
+async def afetch_with_own_client(term, limit):
+    async with new_client() as client:
+        return await afetch_remote(client, term, limit)
+
+
+async def afetch_coalesced(term, limit, pooled=True):
+    """
+    One upstream call per (term, limit) at a time: concurrent callers await
+    the same task. Returns None when the circuit is open or the call failed.
+
+    The pooled client lives as long as the event loop, which is only worth
+    it (and only ever closed) under an ASGI server. Under WSGI every request
+    runs in a fresh loop, so pass pooled=False to use a client that is closed
+    when the call ends.
+    """
+    state = get_loop_state()
+    key = (term, limit)
+    task = state['inflight'].get(key)
+    if task is None:
+        if not breaker.allow():
+            return None
+        if pooled:
+            if state['client'] is None:
+                state['client'] = new_client()
+            fetch = afetch_remote(state['client'], term, limit)
+        else:
+            fetch = afetch_with_own_client(term, limit)
+        task = asyncio.ensure_future(fetch)
+        state['inflight'][key] = task
+        task.add_done_callback(lambda _: state['inflight'].pop(key, None))
+    # shield: a caller that disconnects must not cancel the call for the others
+    return await asyncio.shield(task)
+
+
+# Offline index
+
+def trim_label(record):
+    return {key: record[key] for key in LABEL_FIELDS if key in record}
+
+
+def label_terms(record):
+    openfda = record.get('openfda', {})
+    terms = set()
+    for key in INDEXED_OPENFDA_FIELDS:
+        for value in openfda.get(key, []):
+            terms |= tokenize(value)
+    for value in record.get('active_ingredient', []):
+        terms |= tokenize(value)
+    return {term[:100] for term in terms}
+
+
+def search_index(term, limit):
+    """
+    Prefix search over the offline index. Every word of `term` must prefix
+    some indexed word of the label. Returns the OpenFDA response shape.
+    """
+    words = term.split()
+    if not words:
+        return {'results': []}
+
+    label_ids = None
+    for word in words:
+        matches = set(
+            OpenFDALabelTerm.objects.filter(term__startswith=word).values_list('label_id', flat=True)
+        )
+        label_ids = matches if label_ids is None else label_ids & matches
+        if not label_ids:
+            return {'results': []}
+
+    labels = OpenFDALabel.objects.filter(id__in=label_ids).order_by('generic_name', '-effective_time')
+    return {'results': [label.data for label in labels[:limit]]}
+
+
+def index_available():
+    return OpenFDALabel.objects.exists()
+
+
+def index_labels(records):
+    """
+    Upsert a batch of raw label records and rebuild their index terms.
+    Returns the number of labels written.
+    """
+    labels = {}
+    for record in records:
+        label_id = record.get('id') or record.get('set_id')
+        if not label_id:
+            continue
+        openfda = record.get('openfda', {})
+        labels[label_id] = (
+            OpenFDALabel(
+                label_id=label_id,
+                generic_name=(openfda.get('generic_name') or [''])[0][:255].lower(),
+                brand_name=(openfda.get('brand_name') or [''])[0][:255],
+                effective_time=str(record.get('effective_time', ''))[:8],
+                data=trim_label(record),
+            ),
+            label_terms(record),
+        )
+    if not labels:
+        return 0
+
+    with transaction.atomic():
+        OpenFDALabel.objects.bulk_create(
+            [label for label, _ in labels.values()],
+            update_conflicts=True,
+            unique_fields=['label_id'],
+            update_fields=['generic_name', 'brand_name', 'effective_time', 'data'],
+        )
+        ids = dict(
+            OpenFDALabel.objects.filter(label_id__in=labels.keys()).values_list('label_id', 'id')
+        )
+        OpenFDALabelTerm.objects.filter(label_id__in=ids.values()).delete()
+        OpenFDALabelTerm.objects.bulk_create(
+            [
+                OpenFDALabelTerm(term=term, label_id=ids[label_id])
+                for label_id, (_, terms) in labels.items()
+                for term in terms
+            ],
+            ignore_conflicts=True,
+        )
+    return len(labels)
+
+
+def iter_json_results(stream, chunk_size=1 << 20):
+    """
+    Yield the objects of the top-level "results" array of an OpenFDA dump
+    file one at a time, without loading the whole file into memory.
+    """
+    for _, record in iter_json_arrays(stream, ['results'], chunk_size):
+        yield record
+
+
+def iter_dump_records(path):
+    """
+    Records from an OpenFDA label download: the official .json.zip files,
+    plain or gzipped .json, or NDJSON (one label per line).
+    """
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                if name.endswith('.json'):
+                    with archive.open(name) as stream:
+                        yield from iter_json_results(stream)
+        return
+
+    opener = gzip.open if path.endswith('.gz') else open
+    if '.ndjson' in path or '.jsonl' in path:
+        with opener(path, 'rt', encoding='utf-8') as stream:
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+        return
+    with opener(path, 'rt', encoding='utf-8') as stream:
+        yield from iter_json_results(stream)
+
+
+# Entry point
+
+def search_local(term, limit):
+    """Offline index answer, or None when no index has been built."""
+    return search_index(term, limit) if index_available() else None
+
+
+async def asearch_labels(term, limit=5, pooled=True):
+    """
+    OpenFDA-shaped results for `term`, or None when nothing could be asked.
+    Upstream calls are coalesced behind the circuit breaker, on the loop's
+    pooled client unless pooled=False (see afetch_coalesced()).
+    """
+    term = normalize_term(term)
+    if len(term) < MIN_TERM_LENGTH:
+        return None
+
+    if settings.OPENFDA_OFFLINE:
+        return await sync_to_async(search_index)(term, limit)
+
+    cached = await sync_to_async(get_cached)(term, limit)
+    if cached is not None:
+        return cached
+
+    response = await afetch_coalesced(term, limit, pooled)
+    if response is None:
+        return await sync_to_async(search_local)(term, limit)
+    return response
@@ -0,0 +1,378 @@
+"""
+Ranked, typo-tolerant search over the Medication catalog.
+
+Two interchangeable backends:
+
+- trigram: Postgres with the pg_trgm extension and the GIN indexes created
+  by `setup_medication_search`. Matching uses the word-similarity operator,
+  which the indexes serve, and results are ranked by similarity.
+- trie: an in-process prefix trie over every word of the name and generic
+  name, searched with a bounded edit distance. Used wherever pg_trgm is not
+  available (other databases, no permission to create extensions).
+
+The trie is built lazily per process and kept current through a catalog
+version in the shared cache: writers call catalog_changed(), readers pull
+only rows updated since their last build and re-index them, dropping the
+words of renamed or deactivated medications.
+"""
+import logging
+import re
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .models import Medication
+
+
+logger = logging.getLogger(__name__)
+
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+# Trie candidates gathered per query word before ranking
+MAX_CANDIDATES = 500
+
+# Rebuild the trie from scratch at least this often, dropping deleted rows
+TRIE_MAX_AGE = 60 * 60
+
+# Without the shared catalog version, refresh on this interval instead
+TRIE_UNVERSIONED_REFRESH = 60
+
+CATALOG_VERSION_KEY = 'medication_catalog_version'
+
+# (column, index name) pairs created by setup_medication_search
+TRIGRAM_INDEXES = (
+    ('name', 'medications_medication_name_trgm'),
+    ('generic_name', 'medications_medication_generic_trgm'),
+)
+
+
+def normalize_query(query):
+    return ' '.join(re.split(r'[^\w]+', (query or '').lower())).strip()
+
+
+def max_distance(word):
+    """Typos allowed in one word: none for short words, up to two for long ones."""
+    if len(word) < 4:
+        return 0
+    return 1 if len(word) < 8 else 2
+
+
+# Backend selection
+
+_trigram_available = None
+
+
+def trigram_available():
+    """True when this database has pg_trgm and the search indexes (checked once per process)."""
+    global _trigram_available
+    if _trigram_available is None:
+        _trigram_available = False
+        if connection.vendor == 'postgresql':
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT count(*) FROM pg_indexes WHERE indexname = ANY(%s)",
+                        [[name for _, name in TRIGRAM_INDEXES]]
+                    )
+                    _trigram_available = cursor.fetchone()[0] == len(TRIGRAM_INDEXES)
+            except Exception as e:
+                logger.warning(f"Trigram index check failed, using the in-memory trie: {e}")
+    return _trigram_available
+
+
+def create_trigram_indexes():
+    """
+    Create pg_trgm and the GIN indexes (concurrently, without locking writes).
+    Raises on non-Postgres databases or missing privileges.
+    """
+    global _trigram_available
+    if connection.vendor != 'postgresql':
+        raise RuntimeError(f'Trigram indexes need PostgreSQL, not {connection.vendor}')
+    table = Medication._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for column, name in TRIGRAM_INDEXES:
+            cursor.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} '
+                f'ON {table} USING gin ({column} gin_trgm_ops)'
+            )
+    _trigram_available = None
+
+
+# Catalog version
+
+def catalog_version():
+    try:
+        return cache.get_or_set(CATALOG_VERSION_KEY, time.time(), timeout=None)
+    except Exception as e:
+        logger.warning(f"Catalog version read failed: {e}")
+        return None
+
+
+def catalog_changed():
+    """Call after writing Medication rows so every process refreshes its trie."""
+    try:
+        cache.set(CATALOG_VERSION_KEY, time.time(), timeout=None)
+    except Exception as e:
+        logger.warning(f"Catalog version update failed: {e}")
+
+
+# Trie
+
+class PrefixTrie:
+    """Word -> ids trie. Every word of a medication's names points to its id."""
+
+    __slots__ = ('root', 'names', 'size')
+
+    def __init__(self):
+        self.root = {}
+        # id -> (name, generic_name), for ranking without a query
+        self.names = {}
+        self.size = 0
+
+    def add(self, word, item_id):
+        node = self.root
+        for char in word:
+            node = node.setdefault(char, {})
+        ids = node.setdefault(None, set())
+        if item_id not in ids:
+            ids.add(item_id)
+            self.size += 1
+
+    def discard(self, item_id):
+        """Remove `item_id` from the words of its indexed names (no-op if not indexed)."""
+        names = self.names.get(item_id)
+        if names is None:
+            return
+        for word in indexed_words(*names):
+            node = self.root
+            for char in word:
+                node = node.get(char)
+                if node is None:
+                    break
+            else:
+                ids = node.get(None, set())
+                if item_id in ids:
+                    ids.discard(item_id)
+                    self.size -= 1
+        del self.names[item_id]
+
+    @staticmethod
+    def collect(node, found, distance, limit):
+        """Add ids in the subtree of `node` (shorter words first) with `distance` if better."""
+        queue = deque([node])
+        while queue:
+            node = queue.popleft()
+            for item_id in node.get(None, ()):
+                if found.get(item_id, distance + 1) > distance:
+                    found[item_id] = distance
+                    if len(found) >= limit:
+                        return
+            queue.extend(node[char] for char in sorted(c for c in node if c is not None))
+
+    def search(self, word, max_dist=0, wanted=MAX_CANDIDATES, limit=MAX_CANDIDATES):
+        """
+        {id: edit distance} for words that start with `word`, allowing up to
+        `max_dist` insertions, deletions or substitutions in the typed part.
+        Typo matches are only looked for when fewer than `wanted` ids match exactly.
+        """
+        found = {}
+        node = self.root
+        for char in word:
+            node = node.get(char)
+            if node is None:
+                break
+        else:
+            self.collect(node, found, 0, limit)
+        if max_dist == 0 or len(found) >= wanted:
+            return found
+
+        # Levenshtein rows along trie paths; a prefix whose distance to `word`
+        # is within budget matches its whole subtree, and deeper prefixes may
+        # still lower that distance. The first letter is taken as typed,
+        # which keeps the walk to one branch of the root.
+        first = self.root.get(word[0])
+        if first is None:
+            return found
+        first_row = list(range(len(word)))
+        stack = [(child, char, first_row) for char, child in first.items() if char is not None]
+        word = word[1:]
+        while stack and len(found) < limit:
+            node, char, previous = stack.pop()
+            row = [previous[0] + 1]
+            for i in range(1, len(word) + 1):
+                row.append(min(
+                    row[i - 1] + 1,
+                    previous[i] + 1,
+                    previous[i - 1] + (word[i - 1] != char),
+                ))
+            if row[-1] <= max_dist:
+                self.collect(node, found, row[-1], limit)
+            if row[-1] > 0 and min(row) <= max_dist:
+                stack.extend((child, c, row) for c, child in node.items() if c is not None)
+        return found
+
+
+_trie = None
+_trie_lock = threading.Lock()
+_trie_state = {'version': None, 'built_at': None, 'refreshed_at': None}
+
+
+def indexed_words(name, generic_name):
+    return set(normalize_query(f'{name} {generic_name}').split())
+
+
+def add_rows(trie, rows):
+    for item_id, name, generic_name in rows:
+        trie.names[item_id] = (name, generic_name)
+        for word in indexed_words(name, generic_name):
+            trie.add(word, item_id)
+
+
+def refresh_rows(trie, rows):
+    """Re-index changed rows: old words are dropped, only active rows are added back."""
+    for item_id, name, generic_name, is_active in rows:
+        trie.discard(item_id)
+        if is_active:
+            add_rows(trie, [(item_id, name, generic_name)])
+
+
+def get_trie():
+    """The process-wide trie, refreshed if the catalog changed since it was built."""
+    global _trie
+    version = catalog_version()
+    if _trie is not None:
+        if version is not None and version == _trie_state['version']:
+            return _trie
+        if version is None and (timezone.now() - _trie_state['refreshed_at']).total_seconds() < TRIE_UNVERSIONED_REFRESH:
+            # Cache unavailable: poll the database at most this often
+            return _trie
+
+    with _trie_lock:
+        if _trie is not None and version is not None and version == _trie_state['version']:
+            return _trie
+        now = timezone.now()
+        columns = ('id', 'name', 'generic_name')
+        stale = _trie is None or (now - _trie_state['built_at']).total_seconds() > TRIE_MAX_AGE
+        if stale:
+            trie = PrefixTrie()
+            add_rows(trie, Medication.objects.filter(is_active=True).values_list(*columns).iterator())
+            _trie_state['built_at'] = now
+            _trie = trie
+        else:
+            # Small overlap so rows committed during the last refresh are not missed
+            since = _trie_state['refreshed_at'] - timedelta(seconds=5)
+            refresh_rows(_trie, Medication.objects.filter(updated_at__gte=since).values_list(*columns, 'is_active'))
+        _trie_state['refreshed_at'] = now
+        _trie_state['version'] = version
+        return _trie
+
+
+# Search
+
+def rank_key(names, query, distance):
+    name, generic = (value.lower() for value in names)
+    if query in (name, generic):
+        position = 0
+    elif name.startswith(query) or generic.startswith(query):
+        position = 1
+    else:
+        position = 2
+    return (distance, position, len(name), name)
+
+
+def prefix_distance(word, target, max_dist):
+    """Edit distance from `word` to the closest prefix of `target`, or max_dist + 1 if over budget."""
+    previous = list(range(len(word) + 1))
+    best = previous[-1]
+    for char in target:
+        row = [previous[0] + 1]
+        for i in range(1, len(word) + 1):
+            row.append(min(row[i - 1] + 1, previous[i] + 1, previous[i - 1] + (word[i - 1] != char)))
+        best = min(best, row[-1])
+        if min(row) > max_dist:
+            break
+        previous = row
+    return best if best <= max_dist else max_dist + 1
+
+
+def trie_search(query, queryset, limit):
+    trie = get_trie()
+    words = query.split()
+    # The longest word drives the trie lookup; the others filter its candidates
+    driver = words.pop(words.index(max(words, key=len)))
+    distances = trie.search(driver, max_distance(driver), wanted=MAX_CANDIDATES if words else limit)
+    # Names as of this search; a concurrent refresh may drop ids after the lookup
+    names = {item_id: trie.names.get(item_id) for item_id in distances}
+    distances = {item_id: distance for item_id, distance in distances.items() if names[item_id]}
+
+    if words:
+        filtered = {}
+        for item_id, distance in distances.items():
+            name_words = normalize_query(' '.join(names[item_id])).split()
+            for word in words:
+                budget = max_distance(word)
+                best = min(prefix_distance(word, name_word, budget) for name_word in name_words)
+                if best > budget:
+                    break
+                distance += best
+            else:
+                filtered[item_id] = distance
+        distances = filtered
+
+    # Rank in memory, then load only the rows that are returned. Ids the
+    # queryset excludes (deleted since the last rebuild, filtered by the
+    # caller) are skipped and the next ranked ids fill their slots.
+    ranked = sorted(distances, key=lambda i: rank_key(names[i], query, distances[i]))
+    results = []
+    for start in range(0, len(ranked), limit):
+        top = ranked[start:start + limit]
+        medications = queryset.in_bulk(top)
+        for medication_id in top:
+            if medication_id in medications and len(results) < limit:
+                medication = medications[medication_id]
+                medication.score = round(1.0 / (1 + distances[medication_id]), 3)
+                results.append(medication)
+        if len(results) == limit:
+            break
+    return results
+
+
+def trigram_search(query, queryset, limit):
+    medications = list(
+        queryset.filter(Q(name__trigram_word_similar=query) | Q(generic_name__trigram_word_similar=query))
+        .annotate(score=Greatest(
+            TrigramWordSimilarity(query, 'name'),
+            TrigramWordSimilarity(query, 'generic_name'),
+        ))
+        .order_by('-score', 'name')[:limit * 2]
+    )
+    # Prefix and exact matches first; similarity breaks ties
+    medications.sort(key=lambda m: rank_key((m.name, m.generic_name), query, round(1 - m.score, 1)))
+    for medication in medications:
+        medication.score = round(medication.score, 3)
+    return medications[:limit]
+
+
+def search_medications(query, limit=SEARCH_LIMIT, queryset=None):
+    """Active medications matching `query`, best first; each has a `score` attribute (0-1]."""
+    query = normalize_query(query)
+    if not query:
+        return []
+    if queryset is None:
+        queryset = Medication.objects.filter(is_active=True)
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    if trigram_available():
+        return trigram_search(query, queryset, limit)
+    return trie_search(query, queryset, limit)
+
+
+def search_backend():
+    return 'trigram' if trigram_available() else 'trie'
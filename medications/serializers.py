@@ -13,6 +13,9 @@ class MedicationTypeSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'icon', 'color', 'is_active', 'medications_count']
 
     def get_medications_count(self, obj):
+        # Annotated by MedicationTypeView; single objects (e.g. after create) query it
+        if hasattr(obj, 'medications_count'):
+            return obj.medications_count
         return obj.medications.filter(is_active=True).count()
 
 
@@ -43,10 +46,16 @@ class UserMedicationSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['user']
     
+    # Listings annotate these with UserMedication.objects.with_log_stats()
+
     def get_logs_count(self, obj):
+        if hasattr(obj, 'logs_count'):
+            return obj.logs_count
         return obj.logs.count()
 
     def get_last_taken(self, obj):
+        if hasattr(obj, 'last_taken'):
+            return obj.last_taken
         last_log = obj.logs.first()
         return last_log.date_taken if last_log else None
 
@@ -0,0 +1,39 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from cycle_tracker.models import Period, WellnessLog
+from .analytics import data_changed
+from .interactions import interactions_changed
+from .models import Medication, MedicationInteraction, MedicationLog, MedicationReminder, UserMedication
+from .search import catalog_changed
+
+
+@receiver(post_save, sender=Medication)
+@receiver(post_delete, sender=Medication)
+def medication_changed(sender, instance, **kwargs):
+    catalog_changed()
+
+
+@receiver(post_save, sender=MedicationInteraction)
+@receiver(post_delete, sender=MedicationInteraction)
+def interaction_changed(sender, instance, **kwargs):
+    interactions_changed()
+
+
+@receiver(post_save, sender=UserMedication)
+@receiver(post_delete, sender=UserMedication)
+@receiver(post_save, sender=MedicationLog)
+@receiver(post_delete, sender=MedicationLog)
+@receiver(post_save, sender=MedicationReminder)
+@receiver(post_delete, sender=MedicationReminder)
+@receiver(post_save, sender=Period)
+@receiver(post_delete, sender=Period)
+@receiver(post_save, sender=WellnessLog)
+@receiver(post_delete, sender=WellnessLog)
+def adherence_data_changed(sender, instance, **kwargs):
+    data_changed(instance.user_id)
+
+
+@receiver(post_save, sender=UserMedication)
+def user_medication_saved(sender, instance, created, **kwargs):
+    if not created:
+        instance.reschedule_reminders()
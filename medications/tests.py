@@ -1,3 +1,883 @@
-from django.test import TestCase
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+import asyncio
+import json
+import os
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock, skipUnless
+from zoneinfo import ZoneInfo
+import httpx
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from cycle_tracker.models import WellnessLog
+from notifications.models import Notification, NotificationPreference
+from notifications.scheduler import backfill_fire_times
+from . import openfda, search
+from .management.commands.openfda_stub import load_labels, make_stub_server, stub_url
+from .analytics import compute_adherence
+from .importers import CatalogLoader, iter_file_records
+from .ingest import (
+    ingest_fda_results, map_fda_item, resolve_medication_types, submit_ingest, upsert_medications
+)
+from .interactions import InteractionGraph, check_interactions, scan_new_interactions
+from .models import (
+    Medication, MedicationInteraction, MedicationLog, MedicationReminder, MedicationType, UserMedication
+)
+from .search import SEARCH_LIMIT, PrefixTrie, search_medications, trigram_search
 
-# Create your tests here.
+
+class ListQueryCountTests(TestCase):
+    """List endpoints must run the same number of queries however many rows they return."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='lister', password='secret', email='lister@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.count = 0
+
+    def add_medication(self):
+        self.count += 1
+        medication_type = MedicationType.objects.create(name=f'Type {self.count}')
+        medication = Medication.objects.create(name=f'Drug {self.count}', medication_type=medication_type)
+        user_medication = UserMedication.objects.create(
+            user=self.user, medication=medication, dosage='10 mg', frequency='daily',
+            start_date=date.today() - timedelta(days=30),
+        )
+        for days_ago in range(3):
+            MedicationLog.objects.create(
+                user=self.user, user_medication=user_medication, dosage_taken='10 mg',
+                date_taken=timezone.now() - timedelta(days=days_ago),
+            )
+        MedicationReminder.objects.create(
+            user=self.user, user_medication=user_medication, reminder_time='08:00', days_of_week=[0, 2, 4]
+        )
+        return user_medication
+
+    def queries_for(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context), response.json()
+
+    def assert_constant_queries(self, url):
+        self.add_medication()
+        few, _ = self.queries_for(url)
+        for _ in range(4):
+            self.add_medication()
+        many, data = self.queries_for(url)
+        self.assertEqual(few, many, f'{url} ran {few} queries for 1 medication but {many} for 5')
+        return data
+
+    def test_my_medications(self):
+        data = self.assert_constant_queries('/api/medications/my-medications/')
+        rows = data['results'] if isinstance(data, dict) else data
+        self.assertEqual(len(rows), 5)
+        for row in rows:
+            self.assertEqual(row['logs_count'], 3)
+            self.assertIsNotNone(row['last_taken'])
+            self.assertTrue(row['medication_details']['medication_type_name'].startswith('Type'))
+
+    def test_my_medications_only_lists_own(self):
+        other = User.objects.create_user(username='other', password='secret', email='other@example.com')
+        medication = Medication.objects.create(
+            name='Other Drug', medication_type=MedicationType.objects.create(name='Other')
+        )
+        UserMedication.objects.create(user=other, medication=medication, dosage='1', start_date=date.today())
+        self.add_medication()
+        _, data = self.queries_for('/api/medications/my-medications/')
+        rows = data['results'] if isinstance(data, dict) else data
+        self.assertEqual([row['medication_name'] for row in rows], ['Drug 1'])
+
+    def test_logs(self):
+        data = self.assert_constant_queries('/api/medications/logs/')
+        rows = data['results'] if isinstance(data, dict) else data
+        self.assertEqual(rows[0]['user_medication_details']['logs_count'], 3)
+
+    def test_reminders(self):
+        self.assert_constant_queries('/api/medications/reminders/')
+
+    def test_medication_types(self):
+        data = self.assert_constant_queries('/api/medications/types/')
+        rows = data['results'] if isinstance(data, dict) else data
+        self.assertEqual({row['medications_count'] for row in rows}, {1})
+
+    def test_drugs(self):
+        self.assert_constant_queries('/api/medications/drugs/')
+
+
+class CircuitBreakerTests(TestCase):
+
+    def setUp(self):
+        # Opens on the first failure and lets a trial through right away
+        self.breaker = openfda.CircuitBreaker(failure_threshold=1, slow_seconds=5, reset_seconds=0)
+        patcher = mock.patch.object(openfda, 'breaker', self.breaker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_opens_and_closes(self):
+        self.breaker.record(False, 0.1)
+        self.assertEqual(self.breaker.state, 'half-open')
+        self.assertTrue(self.breaker.allow())
+        # Only one trial at a time
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record(True, 0.1)
+        self.assertEqual(self.breaker.state, 'closed')
+
+    def test_unexpected_error_ends_trial(self):
+        self.breaker.record(False, 0.1)
+        self.assertTrue(self.breaker.allow())
+
+        def fail(request):
+            raise RuntimeError('bug')
+
+        @async_to_sync
+        async def fetch():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(fail)) as client:
+                return await openfda.afetch_remote(client, 'ibuprofen', 5)
+
+        with self.assertRaises(RuntimeError):
+            fetch()
+        self.assertFalse(self.breaker.trial_running)
+        self.assertTrue(self.breaker.allow())
+
+
+class OpenFDAClientTests(TestCase):
+    """Outside a long-lived (ASGI) loop the OpenFDA client is closed after each call."""
+
+    def setUp(self):
+        self.clients = []
+        patcher = mock.patch.object(openfda, 'new_client', self.new_client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def new_client(self):
+        client = httpx.AsyncClient(transport=httpx.MockTransport(
+            lambda request: httpx.Response(200, json={'results': [{'id': 'label-1'}]})
+        ))
+        self.clients.append(client)
+        return client
+
+    def test_unpooled_client_is_closed(self):
+        @async_to_sync
+        async def fetch():
+            response = await openfda.afetch_coalesced('ibuprofen', 5, pooled=False)
+            return response, openfda.get_loop_state()['client']
+
+        response, pooled_client = fetch()
+        self.assertEqual(response, {'results': [{'id': 'label-1'}]})
+        self.assertIsNone(pooled_client)
+        self.assertEqual(len(self.clients), 1)
+        self.assertTrue(self.clients[0].is_closed)
+
+
+class MedicationSearchAuthTests(TestCase):
+    """The async search view answers auth failures like every other DRF endpoint."""
+
+    url = '/api/medications/drugs/search/?q=ibuprofen'
+
+    def test_missing_credentials(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {'detail': 'Authentication credentials were not provided.'})
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+
+    def test_invalid_token(self):
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'token_not_valid')
+
+    def test_authenticated(self):
+        user = User.objects.create_user(username='searcher', password='secret', email='searcher@example.com')
+        medication = Medication.objects.create(
+            name='Ibuprofen', medication_type=MedicationType.objects.create(name='NSAID')
+        )
+        token = AccessToken.for_user(user)
+        response = self.client.get(self.url, HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()], [medication.id])
+
+
+class AdherenceTests(TestCase):
+
+    start = date(2026, 3, 1)
+    end = date(2026, 3, 10)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='adherent', password='secret', email='adherent@example.com')
+        self.user_medication = UserMedication.objects.create(
+            user=self.user, dosage='200 mg', frequency='daily', start_date=self.start,
+            medication=Medication.objects.create(
+                name='Ibuprofen', medication_type=MedicationType.objects.create(name='NSAID')
+            ),
+        )
+        # Taken on the first 7 of 10 days
+        for offset in range(7):
+            MedicationLog.objects.create(
+                user=self.user, user_medication=self.user_medication, dosage_taken='200 mg',
+                date_taken=datetime.combine(self.start + timedelta(days=offset), time(12), tzinfo=dt_timezone.utc),
+            )
+
+    def log_pain(self, levels):
+        for offset, level in enumerate(levels):
+            WellnessLog.objects.create(user=self.user, date=self.start + timedelta(days=offset), pain_level=level)
+
+    def report(self):
+        return compute_adherence(self.user, self.start, self.end)['medications'][0]
+
+    def test_adherence(self):
+        report = self.report()
+        self.assertEqual(
+            (report['scheduled_doses'], report['taken_doses'], report['missed_doses'], report['adherence']),
+            (10, 7, 3, 70.0)
+        )
+
+    def test_unlogged_pain_is_ignored(self):
+        # Pain left at its default on the days taken, so only the 3 days without a dose count
+        self.log_pain([0] * 7 + [5, 5, 5])
+        self.assertIsNone(self.report()['pain_correlation'])
+
+    def test_pain_needs_several_levels(self):
+        self.log_pain([2, 2, 2, 2, 2, 2, 2, 6, 6, 6])
+        self.assertIsNone(self.report()['pain_correlation'])
+
+    def test_pain_correlation(self):
+        self.log_pain([2, 3, 2, 3, 2, 3, 2, 6, 7, 6])
+        self.assertLess(self.report()['pain_correlation'], -0.8)
+
+
+class DailyLogParamsTests(TestCase):
+
+    url = '/api/medications/logs/daily/'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='charts', password='secret', email='charts@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        medication = Medication.objects.create(name='Drug', medication_type=MedicationType.objects.create(name='Type'))
+        self.mine = UserMedication.objects.create(
+            user=self.user, medication=medication, dosage='1', start_date=date.today()
+        )
+        other = User.objects.create_user(username='not-mine', password='secret', email='not-mine@example.com')
+        self.theirs = UserMedication.objects.create(user=other, medication=medication, dosage='1', start_date=date.today())
+        MedicationLog.objects.create(
+            user=self.user, user_medication=self.mine, dosage_taken='1', date_taken=timezone.now()
+        )
+
+    def test_filter_by_own_medication(self):
+        response = self.client.get(self.url, {'user_medication': self.mine.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([m['user_medication'] for m in response.json()['medications']], [self.mine.id])
+
+    def test_invalid_id(self):
+        response = self.client.get(self.url, {'user_medication': 'abc'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('user_medication', response.json()['error'])
+
+    def test_other_users_medication(self):
+        response = self.client.get(self.url, {'user_medication': self.theirs.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('not one of your medications', response.json()['error'])
+
+
+class OpenFDASearchTests(TestCase):
+    """asearch_labels() against the local OpenFDA stub server."""
+
+    def setUp(self):
+        self.labels = load_labels()
+        patcher = mock.patch.object(openfda, 'breaker', openfda.CircuitBreaker(2, 5, 60))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def serve(self, **options):
+        server = make_stub_server(self.labels, **options)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        settings_override = override_settings(OPENFDA_URL=stub_url(server), OPENFDA_OFFLINE=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        return server
+
+    def search(self, term, limit=5):
+        # A fresh loop per call, as under WSGI
+        return async_to_sync(openfda.asearch_labels)(term, limit, pooled=False)
+
+    def ids(self, response):
+        return [label['id'] for label in response['results']]
+
+    def test_remote_answer_is_cached(self):
+        server = self.serve()
+        self.assertEqual(self.ids(self.search('Ibuprofen*')), ['stub-label-0001', 'stub-label-0002'])
+        self.assertEqual(self.ids(self.search('ibuprofen')), ['stub-label-0001', 'stub-label-0002'])
+        self.assertEqual(server.requests, 1)
+        # A smaller page is answered from the same entry, a larger one is not
+        self.assertEqual(len(self.search('ibuprofen', limit=1)['results']), 1)
+        self.search('ibuprofen', limit=10)
+        self.assertEqual(server.requests, 2)
+
+    def test_no_match_is_cached(self):
+        server = self.serve()
+        self.assertEqual(self.search('zzzdrug'), {'results': []})
+        self.assertEqual(self.search('zzzdrug'), {'results': []})
+        self.assertEqual(server.requests, 1)
+
+    def test_short_terms_are_not_searched(self):
+        server = self.serve()
+        self.assertIsNone(self.search('ib'))
+        self.assertEqual(server.requests, 0)
+
+    def test_failing_upstream_falls_back_to_index(self):
+        server = self.serve(error_rate=1)
+        self.assertIsNone(self.search('naproxen'))
+        openfda.index_labels([record for record, _ in self.labels])
+        self.assertEqual(self.ids(self.search('naproxen')), ['stub-label-0003'])
+        # Two failures opened the circuit: the third search does not call out
+        self.assertEqual(server.requests, 2)
+        self.assertEqual(self.ids(self.search('mefenamic')), ['stub-label-0005'])
+        self.assertEqual(server.requests, 2)
+
+    def test_offline_mode_stays_local(self):
+        server = self.serve()
+        openfda.index_labels([record for record, _ in self.labels])
+        with override_settings(OPENFDA_OFFLINE=True):
+            self.assertEqual(self.ids(self.search('acetamin')), ['stub-label-0004'])
+            self.assertEqual(self.search('zzzdrug'), {'results': []})
+        self.assertEqual(server.requests, 0)
+
+    def test_concurrent_async_searches_share_one_call(self):
+        server = self.serve(latency=0.2)
+
+        @async_to_sync
+        async def search_twice():
+            return await asyncio.gather(
+                openfda.afetch_coalesced('ibuprofen', 5, pooled=False),
+                openfda.afetch_coalesced('ibuprofen', 5, pooled=False),
+            )
+
+        first, second = search_twice()
+        self.assertEqual(first, second)
+        self.assertEqual(server.requests, 1)
+
+
+class LogCursorPaginationTests(TestCase):
+
+    url = '/api/medications/logs/'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='pager', password='secret', email='pager@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        user_medication = UserMedication.objects.create(
+            user=self.user, dosage='1', start_date=date(2026, 1, 1),
+            medication=Medication.objects.create(name='Drug', medication_type=MedicationType.objects.create(name='T')),
+        )
+        # Three logs share each timestamp, so page boundaries fall inside ties
+        base = datetime(2026, 3, 1, 8, tzinfo=dt_timezone.utc)
+        self.logs = [
+            MedicationLog.objects.create(
+                user=self.user, user_medication=user_medication, dosage_taken='1',
+                date_taken=base + timedelta(hours=i // 3),
+            )
+            for i in range(7)
+        ]
+
+    def pages(self, limit):
+        ids, cursor = [], None
+        while True:
+            params = {'limit': limit, **({'cursor': cursor} if cursor else {})}
+            data = self.client.get(self.url, params).json()
+            self.assertLessEqual(data['count'], limit)
+            ids.extend(row['id'] for row in data['results'])
+            if not data['has_more']:
+                self.assertIsNone(data['next_cursor'])
+                return ids
+            cursor = data['next_cursor']
+
+    def test_pages_cover_every_log_once_in_order(self):
+        expected = [log.id for log in sorted(self.logs, key=lambda log: (log.date_taken, log.id), reverse=True)]
+        for limit in (1, 2, 3, 7):
+            self.assertEqual(self.pages(limit), expected, f'limit={limit}')
+
+    def test_exact_last_page(self):
+        data = self.client.get(self.url, {'limit': 7}).json()
+        self.assertEqual((data['count'], data['has_more'], data['next_cursor']), (7, False, None))
+
+    def test_page_size_is_clamped(self):
+        self.assertEqual(self.client.get(self.url, {'limit': 0}).json()['count'], 1)
+        with mock.patch('medications.views.LOG_MAX_PAGE_SIZE', 5):
+            self.assertEqual(self.client.get(self.url, {'limit': 100}).json()['count'], 5)
+
+    def test_invalid_params(self):
+        for params in ({'cursor': 'not-a-cursor'}, {'limit': 'ten'}, {'limit': -1}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('error', response.json())
+
+
+CATALOG = {
+    # Interactions first: they must still resolve medications listed after them
+    'interactions': [
+        {'medication1': 'Ibuprofen', 'medication2': {'name': 'Warfarin', 'generic_name': 'warfarin'},
+         'interaction_type': 'major', 'description': 'Bleeding risk'},
+        {'medication1': 'Ibuprofen', 'medication2': 'Ibuprofen', 'interaction_type': 'minor'},
+        {'medication1': 'Ibuprofen', 'medication2': 'Unknown Drug', 'interaction_type': 'minor'},
+    ],
+    'medication_types': [{'name': 'NSAID'}, {'name': 'Anticoagulant', 'color': '#ff0000'}],
+    'medications': [
+        {'name': 'Ibuprofen', 'generic_name': 'ibuprofen', 'medication_type': 'NSAID',
+         'common_dosages': '200 mg; 400 mg'},
+        {'name': 'Warfarin', 'generic_name': 'warfarin', 'medication_type': 'Anticoagulant',
+         'is_prescription': 'yes'},
+        {'generic_name': 'nameless'},
+    ],
+}
+
+
+class CatalogLoaderTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'catalog.json')
+        self.write(CATALOG)
+
+    def write(self, catalog):
+        with open(self.path, 'w') as f:
+            json.dump(catalog, f)
+
+    def load(self, **options):
+        loader = CatalogLoader(batch_size=2, **options)
+        for kind, record in iter_file_records(self.path):
+            loader.add(kind, record)
+        return loader.finish()
+
+    def written(self, summary):
+        return {kind: stats['written'] for kind, stats in summary['kinds'].items()}
+
+    def test_first_load(self):
+        summary = self.load()
+        self.assertEqual(self.written(summary), {'medication_types': 2, 'medications': 2, 'interactions': 1})
+        self.assertEqual(summary['error_count'], 3)
+        ibuprofen = Medication.objects.get(name='Ibuprofen')
+        self.assertEqual(ibuprofen.common_dosages, ['200 mg', '400 mg'])
+        self.assertTrue(Medication.objects.get(name='Warfarin').is_prescription)
+        interaction = MedicationInteraction.objects.get()
+        self.assertEqual(interaction.interaction_type, 'major')
+        self.assertIn(ibuprofen.id, (interaction.medication1_id, interaction.medication2_id))
+
+    def test_reload_is_idempotent(self):
+        self.load()
+        counts = (MedicationType.objects.count(), Medication.objects.count(), MedicationInteraction.objects.count())
+        summary = self.load()
+        self.assertEqual(self.written(summary), {'medication_types': 0, 'medications': 0, 'interactions': 0})
+        self.assertEqual(
+            {kind: stats['unchanged'] for kind, stats in summary['kinds'].items()},
+            {'medication_types': 2, 'medications': 2, 'interactions': 1}
+        )
+        self.assertEqual(
+            (MedicationType.objects.count(), Medication.objects.count(), MedicationInteraction.objects.count()),
+            counts
+        )
+
+    def test_only_changed_rows_are_written(self):
+        self.load()
+        changed = json.loads(json.dumps(CATALOG))
+        changed['medications'][1]['description'] = 'Blood thinner'
+        self.write(changed)
+        self.assertEqual(self.written(self.load()), {'medication_types': 0, 'medications': 1, 'interactions': 0})
+        self.assertEqual(Medication.objects.get(name='Warfarin').description, 'Blood thinner')
+
+    def test_force_rewrites_everything(self):
+        self.load()
+        self.assertEqual(
+            self.written(self.load(force=True)), {'medication_types': 2, 'medications': 2, 'interactions': 1}
+        )
+
+    def test_upgraded_interactions_are_rescanned(self):
+        since = timezone.now() - timedelta(minutes=1)
+        self.load()
+        user = User.objects.create_user(username='holder', password='secret', email='holder@example.com')
+        for medication in Medication.objects.filter(name__in=['Ibuprofen', 'Warfarin']):
+            UserMedication.objects.create(user=user, medication=medication, dosage='1', start_date=date.today())
+        self.assertEqual(scan_new_interactions(since)['notified'], 1)
+
+        # Same severity, new wording: rescanned but not notified again
+        changed = json.loads(json.dumps(CATALOG))
+        changed['interactions'][0]['description'] = 'Higher bleeding risk'
+        self.write(changed)
+        rescan_since = timezone.now()
+        self.load()
+        self.assertEqual(scan_new_interactions(rescan_since)['interactions'], 1)
+        self.assertEqual(scan_new_interactions(since)['notified'], 0)
+
+        changed['interactions'][0]['interaction_type'] = 'severe'
+        self.write(changed)
+        self.load()
+        self.assertEqual(scan_new_interactions(since)['notified'], 1)
+        self.assertEqual(
+            list(Notification.objects.filter(user=user).values_list('message', flat=True).order_by('id')),
+            ['Ibuprofen and Warfarin can interact (major).', 'Ibuprofen and Warfarin can interact (severe).']
+        )
+
+
+class InteractionGraphTests(TestCase):
+
+    def test_check(self):
+        graph = InteractionGraph([
+            (1, 10, 11, 'minor'), (2, 11, 12, 'severe'), (3, 10, 12, 'moderate'), (4, 12, 13, 'major'),
+        ])
+        self.assertEqual(
+            [(edge[0], edge[1]) for edge in graph.check([10, 11, 12])],
+            [(2, 'severe'), (3, 'moderate'), (1, 'minor')]
+        )
+        self.assertEqual(graph.check([10, 13]), [])
+        self.assertEqual(graph.check([]), [])
+
+    def test_follows_database_changes(self):
+        medication_type = MedicationType.objects.create(name='Type')
+        first, second, third = (
+            Medication.objects.create(name=name, medication_type=medication_type)
+            for name in ('Ibuprofen', 'Warfarin', 'Aspirin')
+        )
+        self.assertEqual(check_interactions([first.id, second.id]), [])
+        interaction = MedicationInteraction.objects.create(
+            medication1=first, medication2=second, interaction_type='major', description='Bleeding risk'
+        )
+        self.assertEqual(check_interactions([first.id, second.id, third.id]), [interaction])
+        interaction.is_active = False
+        interaction.save()
+        self.assertEqual(check_interactions([first.id, second.id]), [])
+
+    def test_scan_notifies_users_with_both_medications_once(self):
+        medication_type = MedicationType.objects.create(name='Type')
+        first, second = (
+            Medication.objects.create(name=name, medication_type=medication_type)
+            for name in ('Ibuprofen', 'Warfarin')
+        )
+        both = User.objects.create_user(username='both', password='secret', email='both@example.com')
+        one = User.objects.create_user(username='one', password='secret', email='one@example.com')
+        for user, medications in ((both, (first, second)), (one, (first,))):
+            for medication in medications:
+                UserMedication.objects.create(user=user, medication=medication, dosage='1', start_date=date.today())
+        since = timezone.now() - timedelta(minutes=1)
+        MedicationInteraction.objects.create(medication1=first, medication2=second, interaction_type='major')
+
+        stats = scan_new_interactions(since)
+        self.assertEqual((stats['interactions'], stats['affected_users'], stats['notified']), (1, 1, 1))
+        self.assertEqual(Notification.objects.get().user_id, both.id)
+        self.assertEqual(scan_new_interactions(since)['notified'], 0)
+
+
+def fda_label(generic_name, pharm_class=None, purpose='Pain reliever', dosage='Take 200 mg'):
+    openfda_fields = {'generic_name': [generic_name], 'product_type': ['HUMAN OTC DRUG']}
+    if pharm_class:
+        openfda_fields['pharm_class_epc'] = [pharm_class]
+    return {'openfda': openfda_fields, 'purpose': [purpose], 'dosage_and_administration': [dosage]}
+
+
+class IngestTests(TestCase):
+
+    def test_repeated_ingest_upserts_on_catalog_key(self):
+        ingest_fda_results([fda_label('ibuprofen', 'NSAID [EPC]'), fda_label('naproxen', 'NSAID [EPC]')])
+        # Same drug spelled differently, with a new description
+        medications = ingest_fda_results([fda_label('IBUPROFEN ', 'NSAID [EPC]', purpose='Fever reducer')])
+
+        self.assertEqual(Medication.objects.count(), 2)
+        self.assertEqual(MedicationType.objects.count(), 1)
+        ibuprofen = Medication.objects.get(catalog_key=Medication.make_catalog_key('Ibuprofen', 'ibuprofen'))
+        self.assertEqual([m.id for m in medications], [ibuprofen.id])
+        self.assertEqual((ibuprofen.description, ibuprofen.common_dosages), ('Fever reducer', ['200 mg']))
+        self.assertFalse(ibuprofen.is_prescription)
+
+    def test_labels_without_a_name_are_skipped(self):
+        self.assertEqual(ingest_fda_results([{'openfda': {}}]), [])
+        self.assertFalse(Medication.objects.exists())
+
+    def test_queries_do_not_grow_with_batch(self):
+        def upsert_queries(names):
+            with CaptureQueriesContext(connection) as queries:
+                upsert_medications([map_fda_item(fda_label(name, f'{name} class')) for name in names])
+            return len(queries)
+
+        # Every type is new in both batches, so both create types and medications
+        self.assertEqual(upsert_queries(['alpha']), upsert_queries([f'drug{i}' for i in range(10)]))
+
+    def test_resolve_medication_types(self):
+        existing = MedicationType.objects.create(name='NSAID')
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_medication_types(['NSAID', 'NSAID']), {'NSAID': existing.id})
+        with self.assertNumQueries(3):
+            types = resolve_medication_types(['NSAID', 'Statin', 'Opioid'])
+        self.assertEqual(set(types), {'NSAID', 'Statin', 'Opioid'})
+        self.assertEqual(MedicationType.objects.count(), 3)
+
+    @override_settings(MEDICATION_INGEST_IN_BACKGROUND=True)
+    def test_background_ingest_is_off_the_request_thread(self):
+        user = User.objects.create_user(username='ingester', password='secret', email='ingester@example.com')
+        labels = [fda_label('ibuprofen', 'NSAID [EPC]')]
+        done = threading.Event()
+        threads = []
+
+        def record(fda_items):
+            threads.append((threading.current_thread(), fda_items))
+            done.set()
+
+        with mock.patch('medications.views.asearch_labels', mock.AsyncMock(return_value={'results': labels})), \
+                mock.patch('medications.ingest.ingest_fda_results', record):
+            response = self.client.get(
+                '/api/medications/drugs/search/?q=ibuprofen',
+                HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}'
+            )
+            self.assertTrue(done.wait(5))
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'accepted')
+        self.assertEqual([row['name'] for row in response.json()['results']], ['Ibuprofen'])
+        (thread, fda_items), = threads
+        self.assertNotEqual(thread, threading.current_thread())
+        self.assertEqual(fda_items, labels)
+        # Nothing was written on the request thread
+        self.assertFalse(Medication.objects.exists())
+
+    def test_submit_ingest_logs_failures(self):
+        with mock.patch('medications.ingest.ingest_fda_results', side_effect=RuntimeError('boom')), \
+                self.assertLogs('medications.ingest', 'ERROR'):
+            submit_ingest([fda_label('ibuprofen')]).result(timeout=5)
+
+    def test_backfill_catalog_keys(self):
+        medication_type = MedicationType.objects.create(name='NSAID')
+        old = Medication.objects.create(name='Ibuprofen', generic_name='ibuprofen', medication_type=medication_type)
+        duplicate = Medication.objects.create(name='Advil', medication_type=medication_type)
+        keyed = Medication.objects.create(name='Naproxen', medication_type=medication_type)
+        Medication.objects.filter(id__in=[old.id, duplicate.id]).update(catalog_key=None)
+        # Differs from the first row only by case and whitespace
+        Medication.objects.filter(id=duplicate.id).update(name='IBUPROFEN', generic_name='Ibuprofen ')
+
+        out = StringIO()
+        call_command('backfill_catalog_keys', batch_size=1, stdout=out)
+        self.assertIn('✓ Backfilled 1 medications', out.getvalue())
+        self.assertIn(f'#{duplicate.id}', out.getvalue())
+        self.assertEqual(
+            dict(Medication.objects.values_list('id', 'catalog_key')),
+            {
+                old.id: Medication.make_catalog_key('Ibuprofen', 'ibuprofen'),
+                duplicate.id: None,
+                keyed.id: Medication.make_catalog_key('Naproxen', ''),
+            }
+        )
+
+
+class MedicationSearchTests(TestCase):
+    """The in-memory trie backend (the test database has no pg_trgm)."""
+
+    def setUp(self):
+        cache.delete(search.CATALOG_VERSION_KEY)
+        patcher = mock.patch.object(search, '_trie', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        medication_type = MedicationType.objects.create(name='NSAID')
+        self.medications = {
+            name: Medication.objects.create(
+                name=name, generic_name=generic_name, medication_type=medication_type, is_active=is_active
+            )
+            for name, generic_name, is_active in (
+                ('Ibuprofen', 'ibuprofen', True),
+                ('Ibuprofen Lysine', 'ibuprofen lysine', True),
+                ('Naproxen', 'naproxen sodium', True),
+                ('Aspirin', 'acetylsalicylic acid', True),
+                ('Aspirin Extra Strength', 'acetylsalicylic acid', True),
+                ('Ibuprofen Retired', 'ibuprofen', False),
+            )
+        }
+
+    def names(self, query, limit=SEARCH_LIMIT):
+        return [medication.name for medication in search_medications(query, limit)]
+
+    def test_prefix_ranking(self):
+        self.assertEqual(self.names('aspirin'), ['Aspirin', 'Aspirin Extra Strength'])
+        self.assertEqual(self.names('ibu'), ['Ibuprofen', 'Ibuprofen Lysine'])
+        self.assertEqual(self.names('sodium'), ['Naproxen'])
+        self.assertEqual(self.names('ibuprofen lys'), ['Ibuprofen Lysine'])
+
+    def test_edit_distance_limit(self):
+        results = search_medications('ibuprf')
+        self.assertEqual([m.name for m in results], ['Ibuprofen', 'Ibuprofen Lysine'])
+        self.assertEqual(results[0].score, 0.5)
+        self.assertEqual(self.names('naproxn'), ['Naproxen'])
+        # One typo allowed below 8 letters, none below 4
+        self.assertEqual(self.names('ibxprxf'), [])
+        self.assertEqual(self.names('ibx'), [])
+
+    def test_first_letter_typo_never_matches(self):
+        self.assertEqual(self.names('ubuprofen'), [])
+        self.assertEqual(self.names('maproxen'), [])
+
+    def test_inactive_medications_are_filtered(self):
+        self.assertNotIn('Ibuprofen Retired', self.names('ibuprofen'))
+
+    def test_refresh_after_rename_and_deactivation(self):
+        self.assertEqual(self.names('naproxen'), ['Naproxen'])
+        built_at = search._trie_state['built_at']
+
+        naproxen = self.medications['Naproxen']
+        naproxen.name, naproxen.generic_name = 'Ketoprofen', 'ketoprofen'
+        naproxen.save()
+        aspirin = self.medications['Aspirin']
+        aspirin.is_active = False
+        aspirin.save()
+
+        self.assertEqual(self.names('naproxen'), [])
+        self.assertEqual(self.names('ketoprofen'), ['Ketoprofen'])
+        self.assertEqual(self.names('aspirin', limit=1), ['Aspirin Extra Strength'])
+        # Refreshed in place, not rebuilt
+        self.assertEqual(search._trie_state['built_at'], built_at)
+        self.assertNotIn(aspirin.id, search.get_trie().names)
+
+    def test_deleted_rows_do_not_take_result_slots(self):
+        self.assertEqual(self.names('ibuprofen', limit=1), ['Ibuprofen'])
+        self.medications['Ibuprofen'].delete()
+        self.assertEqual(self.names('ibuprofen', limit=1), ['Ibuprofen Lysine'])
+
+    def test_prefix_trie(self):
+        trie = PrefixTrie()
+        trie.add('ibuprofen', 1)
+        trie.add('ibuprofen', 1)
+        trie.add('ibupirac', 2)
+        self.assertEqual(trie.size, 2)
+        self.assertEqual(trie.search('ibup'), {1: 0, 2: 0})
+        self.assertEqual(trie.search('ibuprf', max_dist=1), {1: 1})
+        # Enough exact matches: no typo walk
+        self.assertEqual(trie.search('ibupi', max_dist=1, wanted=1), {2: 0})
+        self.assertEqual(trie.search('ibupi', max_dist=1), {2: 0, 1: 1})
+
+    def test_autocomplete(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='typist', password='secret', email='t@example.com'))
+        response = client.get('/api/medications/drugs/autocomplete/', {'q': 'naproxn', 'limit': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'success')
+        self.assertEqual(
+            [(row['id'], row['score']) for row in response.data['results']],
+            [(self.medications['Naproxen'].id, 0.5)]
+        )
+        self.assertEqual(client.get('/api/medications/drugs/autocomplete/').status_code, 400)
+
+    def test_setup_command_reports_trie(self):
+        out = StringIO()
+        call_command('setup_medication_search', stdout=out)
+        self.assertIn('Searches use the in-memory trie', out.getvalue())
+        self.assertIn('Search backend: trie', out.getvalue())
+
+    @skipUnless(connection.vendor == 'postgresql', 'pg_trgm needs PostgreSQL')
+    def test_trigram_search(self):
+        results = trigram_search('ibuprofen', Medication.objects.filter(is_active=True), 2)
+        self.assertEqual([m.name for m in results], ['Ibuprofen', 'Ibuprofen Lysine'])
+        self.assertTrue(all(0 < m.score <= 1 for m in results))
+
+
+class ReminderFireTimeTests(TestCase):
+
+    utc = dt_timezone.utc
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='reminded', password='secret', email='reminded@example.com')
+        self.pref, _ = NotificationPreference.objects.get_or_create(user=self.user)
+        self.pref.timezone = 'UTC'
+        self.pref.save()
+        self.user_medication = UserMedication.objects.create(
+            user=self.user, dosage='10 mg', start_date=date(2026, 3, 10), end_date=date(2026, 3, 12),
+            medication=Medication.objects.create(
+                name='Drug', medication_type=MedicationType.objects.create(name='Type')
+            ),
+        )
+        self.reminder = MedicationReminder.objects.create(
+            user=self.user, user_medication=self.user_medication, reminder_time=time(8), days_of_week=[]
+        )
+
+    def next_fire(self, after, **fields):
+        for field, value in fields.items():
+            setattr(self.reminder, field, value)
+        return self.reminder.compute_next_fire_at(after, tz_name='UTC')
+
+    def test_clamped_to_start_date(self):
+        before_start = datetime(2026, 3, 1, 12, tzinfo=self.utc)
+        self.assertEqual(self.next_fire(before_start), datetime(2026, 3, 10, 8, tzinfo=self.utc))
+        # A midnight reminder still fires on the start date itself
+        self.assertEqual(
+            self.next_fire(before_start, reminder_time=time(0)), datetime(2026, 3, 10, tzinfo=self.utc)
+        )
+
+    def test_none_after_end_date(self):
+        self.assertEqual(
+            self.next_fire(datetime(2026, 3, 12, 7, tzinfo=self.utc)), datetime(2026, 3, 12, 8, tzinfo=self.utc)
+        )
+        self.assertIsNone(self.next_fire(datetime(2026, 3, 12, 9, tzinfo=self.utc)))
+
+    def test_weekdays_and_timezone(self):
+        # 2026-03-10 is a Tuesday; 08:00 in Tokyo is 23:00 UTC the day before
+        self.user_medication.end_date = None
+        self.assertEqual(
+            self.next_fire(datetime(2026, 3, 10, 9, tzinfo=self.utc), days_of_week=[0]),
+            datetime(2026, 3, 16, 8, tzinfo=self.utc)
+        )
+        fire_at = self.reminder.compute_next_fire_at(datetime(2026, 3, 10, 9, tzinfo=self.utc), tz_name='Asia/Tokyo')
+        self.assertEqual(fire_at, datetime(2026, 3, 15, 23, tzinfo=self.utc))
+
+    def test_inactive_reminder_or_medication(self):
+        after = datetime(2026, 3, 1, tzinfo=self.utc)
+        self.assertIsNone(self.next_fire(after, is_active=False))
+        self.reminder.is_active = True
+        self.user_medication.is_active = False
+        self.assertIsNone(self.next_fire(after))
+
+    def test_medication_changes_reschedule_reminders(self):
+        today = timezone.now().astimezone(self.utc).date()
+        self.user_medication.start_date, self.user_medication.end_date = today - timedelta(days=3), today - timedelta(days=1)
+        self.user_medication.save()
+        self.reminder.refresh_from_db()
+        self.assertIsNone(self.reminder.next_fire_at)
+
+        self.user_medication.end_date = None
+        self.user_medication.save()
+        self.reminder.refresh_from_db()
+        self.assertIsNotNone(self.reminder.next_fire_at)
+        self.assertEqual(self.reminder.next_fire_at, self.reminder.compute_next_fire_at())
+
+        self.user_medication.is_active = False
+        self.user_medication.save(update_fields=['is_active'])
+        self.reminder.refresh_from_db()
+        self.assertIsNone(self.reminder.next_fire_at)
+
+    def test_timezone_change_reschedules_reminders(self):
+        self.user_medication.start_date, self.user_medication.end_date = date(2026, 1, 1), None
+        self.user_medication.save()
+        self.reminder.refresh_from_db()
+        in_utc = self.reminder.next_fire_at
+        self.assertEqual(in_utc.astimezone(self.utc).time(), time(8))
+
+        # Other preference changes leave the fire time alone
+        pref = NotificationPreference.objects.get(id=self.pref.id)
+        pref.email_ovulation = False
+        pref.save()
+        self.reminder.refresh_from_db()
+        self.assertEqual(self.reminder.next_fire_at, in_utc)
+
+        pref.timezone = 'Asia/Tokyo'
+        pref.save()
+        self.reminder.refresh_from_db()
+        self.assertIsNone(self.reminder.next_fire_at)
+
+        backfill_fire_times(timezone.now())
+        self.reminder.refresh_from_db()
+        self.assertEqual(self.reminder.next_fire_at.astimezone(ZoneInfo('Asia/Tokyo')).time(), time(8))
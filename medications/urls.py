@@ -6,7 +6,9 @@ from .views import (
     MedicationView,
     UserMedicationView,
     UserMedicationLogView,
-    MedicationReminderView
+    MedicationReminderView,
+    MedicationInteractionView,
+    medication_search
 )
 
 router = DefaultRouter()
@@ -15,10 +17,13 @@ router.register(r'drugs', MedicationView, basename='drugs')
 router.register(r'my-medications',UserMedicationView,basename='my-medications')
 router.register(r'logs',UserMedicationLogView,basename='logs')
 router.register(r'reminders',MedicationReminderView,basename='reminders')
+router.register(r'interactions', MedicationInteractionView, basename='interactions')
 
 
 
 
 urlpatterns = [
+    # Async view; registered before the router so it is not taken for a drug id
+    path('drugs/search/', medication_search, name='drugs-search'),
     path('', include(router.urls)),
 ]
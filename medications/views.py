@@ -1,3 +1,5 @@
+import base64
+import binascii
 from django.shortcuts import render
 from rest_framework import viewsets , status
 from rest_framework.response import Response
@@ -5,179 +7,310 @@ from .models import (   MedicationType ,
                         Medication ,
                         UserMedication ,
                         MedicationLog,
-                        MedicationReminder
+                        MedicationReminder,
+                        MedicationInteraction
                     )
 from .serializers import (  MedicationTypeSerializer,
                             MedicationSerializer,
                             UserMedicationSerializer,
                             MedicationLogSerializer,
-                            MedicationReminderSerializer
+                            MedicationReminderSerializer,
+                            MedicationInteractionSerializer
                          )
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
-from django.db.models import Q
-import requests
-import re
-
-
-
-
-
-
-def get_first(item, key, default=""):
-    value = item.get(key, [])
-    if isinstance(value, list) and value:
-        return value[0]
-    return default
-
-def extract_dosages(text):
-    if not text:
-        return []
-    return list(set(re.findall(r"\b\d+\s?mg\b", text.lower())))
-
-def map_fda_to_serializer_data(fda_item, medication_type_id):
-    #print (fda_item)
-    openfda = fda_item.get("openfda", {})
-    #print(openfda)
-    name = ( get_first(openfda, "generic_name") or get_first(openfda, "brand_name") ).title()
-    generic_name = get_first(openfda, "generic_name").lower()
-    description = get_first(fda_item, "purpose") or get_first(fda_item, "indications_and_usage")
-    side_effects = get_first(fda_item, "warnings")
-    contraindications = get_first(fda_item, "do_not_use")
-    is_prescription = "OTC" not in get_first(openfda, "product_type")
-    common_dosages = extract_dosages(get_first(fda_item, "dosage_and_administration"))
-    print (name,generic_name,get_first(openfda, "brand_name"),get_first(fda_item, "purpose"))
-    return {
-        "name": name,
-        "generic_name": generic_name,
-        "medication_type": medication_type_id,
-        "description": description,
-        "side_effects": side_effects,
-        "contraindications": contraindications,
-        "is_prescription": is_prescription,
-        "common_dosages": common_dosages,
-        "is_active": True
-    }
+import logging
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse
+from rest_framework.exceptions import APIException
+from rest_framework.views import APIView
+from django.conf import settings
+from django.db.models import Avg, Count, Prefetch, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from datetime import datetime, timedelta
+from .analytics import DEFAULT_RANGE_DAYS, MAX_RANGE_DAYS, adherence_report, local_day_bounds, user_timezone
+from notifications.timing import get_zone
+from .ingest import ingest_fda_results, map_fda_item, submit_ingest
+from .interactions import check_interactions, highest_severity, user_medication_ids
+from .openfda import asearch_labels
+from .search import MAX_SEARCH_LIMIT, SEARCH_LIMIT, search_medications
 
 
-class MedicationTypeView(viewsets.ModelViewSet):
+logger = logging.getLogger(__name__)
 
-    serializer_class = MedicationTypeSerializer
-    permission_classes= [IsAuthenticated]
+AUTOCOMPLETE_LIMIT = 10
 
-    def get_queryset(self):
-        return MedicationType.objects.filter(is_active=True)
+# Keyset page sizes for medication logs
+LOG_PAGE_SIZE = 50
+LOG_MAX_PAGE_SIZE = 500
 
 
-class MedicationView(viewsets.ModelViewSet):
-    serializer_class = MedicationSerializer
-    permission_classes = [IsAuthenticated]
 
-    def get_queryset(self):
-        return Medication.objects.filter(is_active=True)
 
 
 
-    def _normalize(term: str) -> str:
-        return term.lower().strip()
+def parse_limit(params, default):
+    try:
+        return max(1, min(int(params.get('limit', default)), MAX_SEARCH_LIMIT))
+    except (TypeError, ValueError):
+        return default
 
-    def search_data_fda(self,term, limit=5):
-        fda_url = "https://api.fda.gov/drug/label.json"
 
-        term = term
-        if len(term) < 3 :
-            return None
+def encode_log_cursor(log):
+    """Opaque keyset cursor pointing at (date_taken, id) of a log."""
+    raw = f"{log.date_taken.isoformat()}|{log.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
 
-        search_query = (
-            f"openfda.generic_name:{term}* OR "
-            f"openfda.brand_name:{term}* OR "
-            f"active_ingredient:{term}*"
-        )
-        params = {
-            "search": search_query,
-            "limit": limit
-        }
 
+def decode_log_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        date_taken, log_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(date_taken), int(log_id)
+    except (UnicodeError, binascii.Error, TypeError, ValueError):
+        raise ValueError('Invalid cursor')
 
-        try:
-            response= requests.get(fda_url,params=params, timeout=5)
-            response.raise_for_status()
-            return response.json()
 
-        except requests.exceptions.RequestException as e:
-            print(f"OpenFDA request failed: {e}")
-            return None
+def user_medication_prefetch():
+    """Nested user_medication_details for a page of logs/reminders in one extra query."""
+    return Prefetch('user_medication', queryset=UserMedication.objects.for_listing())
 
 
+def parse_day(params, name):
+    """Date from a YYYY-MM-DD query parameter, or None if absent. Raises ValueError."""
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError(f'{name} must be a date in YYYY-MM-DD format')
 
 
-    @action(detail=False, methods=['get'])
-    def search(self, request):
-        print("search debug")
-        query = request.query_params.get('q','')
+def parse_user_medication(params, user):
+    """Id from ?user_medication= if it is one of the user's medications, or None if absent. Raises ValueError."""
+    value = params.get('user_medication')
+    if not value:
+        return None
+    if not str(value).isdigit():
+        raise ValueError('user_medication must be the id of one of your medications')
+    if not UserMedication.objects.filter(id=int(value), user=user).exists():
+        raise ValueError(f'user_medication {value} is not one of your medications')
+    return int(value)
+
+
+def parse_date_range(params, default_days, max_days):
+    """(start_date, end_date) from ?start_date=&end_date= (YYYY-MM-DD). Raises ValueError."""
+    end_date = parse_day(params, 'end_date') or timezone.now().date()
+    start_date = parse_day(params, 'start_date') or end_date - timedelta(days=default_days - 1)
+    if start_date > end_date:
+        raise ValueError('start_date must not be after end_date')
+    if (end_date - start_date).days >= max_days:
+        raise ValueError(f'Date range is limited to {max_days} days')
+    return start_date, end_date
 
+
+class MedicationTypeView(viewsets.ModelViewSet):
+
+    serializer_class = MedicationTypeSerializer
+    permission_classes= [IsAuthenticated]
+
+    def get_queryset(self):
+        return MedicationType.objects.filter(is_active=True).annotate(
+            medications_count=Count('medications', filter=Q(medications__is_active=True))
+        )
+
+
+class MedicationView(viewsets.ModelViewSet):
+    serializer_class = MedicationSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Medication.objects.filter(is_active=True).select_related('medication_type')
+
+
+
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """Typo-tolerant name suggestions while typing: ?q=ibuprf&limit=10"""
+        query = request.query_params.get('q', '').strip()
         if not query:
             return Response({
-                'status':'error',
+                'status': 'error',
                 'message': 'Search query parameter "q" is required'
-            },status=400)
-
-        print("q is :",query)
-        try:
-            medications = Medication.objects.filter(
-                Q(name__icontains=query) |
-                Q(generic_name__icontains=query) |
-                Q(description__icontains=query),
-                is_active=True
-            ).order_by('name')
-
-            print( "medications db is:", medications)
-            if medications.exists():
-                print("found in database %s",query)
-                serializer = self.get_serializer(medications, many=True)
-                return Response(serializer.data)
-            else:
-                print("Not found in database %s start exeptions",query)
-                get_data_fda =self.search_data_fda(query)
-                #print ("fda data is: ", get_data_fda)
-                if not get_data_fda or "results" not in get_data_fda:
-                    return Response({
-                        "status": "error",
-                        "message": f"No results found for '{query}'"
-                    }, status=status.HTTP_404_NOT_FOUND)           
-
-
-                fda_item = get_data_fda["results"][1]
-                # Determine the MedicationType name from FDA data (fallback to "Unknown")
-                pharm_classes = fda_item.get("openfda", {}).get("pharm_class_epc", [])
-                med_type_name = pharm_classes[0] if pharm_classes else "Unknown"
-                # Get or create the MedicationType
-                medication_type, _ = MedicationType.objects.get_or_create(name=med_type_name)
-                serializer_data = map_fda_to_serializer_data(fda_item, medication_type.id)
-                serializer = MedicationSerializer(data=serializer_data)
-                if serializer.is_valid():
-                    medication = serializer.save()
-                    return Response(MedicationSerializer(medication).data, status=status.HTTP_201_CREATED)
-                else:
-                    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-        except:
-            print("Not found in database %s start exeptions",query)
-            return Response({
-                "status": "error",
-                "message": f"No results found for '{query}'"
-            }, status=status.HTTP_404_NOT_FOUND)    
+            }, status=400)
+
+        medications = search_medications(query, parse_limit(request.query_params, AUTOCOMPLETE_LIMIT))
+        return Response({
+            'status': 'success',
+            'query': query,
+            'results': [
+                {
+                    'id': medication.id,
+                    'name': medication.name,
+                    'generic_name': medication.generic_name,
+                    'score': medication.score,
+                }
+                for medication in medications
+            ]
+        })
+
+
+def _run_drf_checks(request):
+    """
+    What APIView.initial() does for a DRF view: the default authentication,
+    permission and throttle classes. Returns (user, None), or (None, the
+    response DRF would have sent, e.g. 401 {"detail": ...}).
+    """
+    view = APIView()
+    view.args, view.kwargs, view.headers = (), {}, {}
+    drf_request = view.initialize_request(request)
+    view.request = drf_request
+    try:
+        view.initial(drf_request)
+    except APIException as exc:
+        response = view.handle_exception(exc)
+        json_response = JsonResponse(response.data, status=response.status_code)
+        for header in ('WWW-Authenticate', 'Retry-After'):
+            if header in response:
+                json_response[header] = response[header]
+        return None, json_response
+    return drf_request.user, None
+
+
+async def _authorize(request):
+    """_run_drf_checks() for a plain async view (DRF's own dispatch is sync only)."""
+    return await sync_to_async(_run_drf_checks)(request)
+
+
+async def medication_search(request):
+    """
+    GET /drugs/search/?q= : ranked catalog matches, or on a miss the OpenFDA
+    labels upserted into the catalog and the best one returned (201). With
+    MEDICATION_INGEST_IN_BACKGROUND the labels are returned unsaved (202)
+    and written off the request path. Async so that waiting on OpenFDA does
+    not hold a worker thread.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    _, error = await _authorize(request)
+    if error is not None:
+        return error
+
+    query = request.GET.get('q', '')
+    if not query:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Search query parameter "q" is required'
+        }, status=400)
+
+    not_found = JsonResponse({
+        "status": "error",
+        "message": f"No results found for '{query}'"
+    }, status=status.HTTP_404_NOT_FOUND)
+
+    # Ranked trigram / trie match on name and generic name, best first
+    medications = await sync_to_async(search_medications)(
+        query,
+        parse_limit(request.GET, SEARCH_LIMIT),
+        queryset=Medication.objects.filter(is_active=True).select_related('medication_type')
+    )
+    if medications:
+        data = await sync_to_async(lambda: MedicationSerializer(medications, many=True).data)()
+        return JsonResponse(data, safe=False)
+
+    # Coalesced OpenFDA call, pooled when served by ASGI; offline index when the circuit is open
+    get_data_fda = await asearch_labels(query, pooled=isinstance(request, ASGIRequest))
+    if not get_data_fda or not get_data_fda.get("results"):
+        return not_found
+    results = get_data_fda["results"]
+
+    if settings.MEDICATION_INGEST_IN_BACKGROUND:
+        # Answer from the labels now; the catalog catches up on the writer thread
+        submit_ingest(results)
+        return JsonResponse({
+            'status': 'accepted',
+            'results': [row for row in map(map_fda_item, results) if row['name']]
+        }, status=status.HTTP_202_ACCEPTED)
+
+    try:
+        medications = await sync_to_async(ingest_fda_results)(results)
+    except Exception as e:
+        logger.warning(f"Could not add OpenFDA results for '{query}': {e}")
+        return not_found
+    if not medications:
+        return not_found
+    data = await sync_to_async(lambda: MedicationSerializer(medications[0]).data)()
+    return JsonResponse(data, status=status.HTTP_201_CREATED)
+
+
+class MedicationInteractionView(viewsets.ReadOnlyModelViewSet):
+    serializer_class = MedicationInteractionSerializer
+    permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        queryset = MedicationInteraction.objects.filter(is_active=True).select_related('medication1', 'medication2')
+        medication_id = self.request.query_params.get('medication')
+        if medication_id:
+            queryset = queryset.filter(Q(medication1_id=medication_id) | Q(medication2_id=medication_id))
+        return queryset
 
+    @action(detail=False, methods=['get', 'post'])
+    def check(self, request):
+        """
+        Interactions among the user's active medications, most severe first.
+        POST {"medication_ids": [...]} also includes medications the user is
+        considering, before adding them.
+        """
+        medication_ids = user_medication_ids(request.user.id)
+        checked = len(medication_ids)
+        if request.method == 'POST':
+            extra = request.data.get('medication_ids', [])
+            if not isinstance(extra, list):
+                return Response({'error': 'medication_ids must be a list'}, status=status.HTTP_400_BAD_REQUEST)
+            try:
+                medication_ids.update(int(medication_id) for medication_id in extra)
+            except (TypeError, ValueError):
+                return Response({'error': 'medication_ids must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        interactions = check_interactions(medication_ids)
+        return Response({
+            'status': 'success',
+            'checked': len(medication_ids),
+            'user_medications': checked,
+            'count': len(interactions),
+            'highest_severity': highest_severity(interactions),
+            'interactions': MedicationInteractionSerializer(interactions, many=True).data,
+        })
 
 
 class UserMedicationView(viewsets.ModelViewSet):
-    queryset = UserMedication.objects.all()
     serializer_class = UserMedicationSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        return UserMedication.objects.filter(user=self.request.user).for_listing()
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=['get'])
+    def adherence(self, request):
+        """
+        Adherence, effectiveness trend, cycle phase breakdown and pain
+        correlation per medication: ?start_date=&end_date=&user_medication=
+        """
+        try:
+            start_date, end_date = parse_date_range(request.query_params, DEFAULT_RANGE_DAYS, MAX_RANGE_DAYS)
+            user_medication_id = parse_user_medication(request.query_params, request.user)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        report, cached = adherence_report(request.user, start_date, end_date, user_medication_id)
+        return Response({'status': 'success', 'cached': cached, 'data': report})
+
 
 class UserMedicationLogView(viewsets.ModelViewSet):
     serializer_class = MedicationLogSerializer
@@ -185,13 +318,102 @@ class UserMedicationLogView(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        queryset = MedicationLog.objects.filter(user=user)
+        queryset = MedicationLog.objects.filter(user=user).prefetch_related(user_medication_prefetch())
         user_med_id = self.request.query_params.get('user_medication')
         if user_med_id:
             queryset = queryset.filter(user_medication_id=user_med_id)
 
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        """
+        Logs, newest first (date_taken, then id, both descending). Query
+        params: user_medication, start_date and end_date (YYYY-MM-DD, whole
+        days in the user's timezone). With limit (default 50, max 500) or
+        cursor (next_cursor of the previous page) the result is one keyset
+        page instead of the full list.
+        """
+        params = request.query_params
+        try:
+            start_date, end_date = parse_day(params, 'start_date'), parse_day(params, 'end_date')
+            queryset = self.get_queryset().order_by('-date_taken', '-id')
+            if start_date or end_date:
+                tz = get_zone(user_timezone(request.user))
+                range_start, range_end = local_day_bounds(start_date or end_date, end_date or start_date, tz)
+                if start_date:
+                    queryset = queryset.filter(date_taken__gte=range_start)
+                if end_date:
+                    queryset = queryset.filter(date_taken__lt=range_end)
+
+            if 'limit' not in params and 'cursor' not in params:
+                return Response(self.get_serializer(queryset, many=True).data)
+
+            limit = str(params.get('limit', LOG_PAGE_SIZE))
+            if not limit.isdigit():
+                raise ValueError('limit must be a positive integer')
+            limit = max(1, min(int(limit), LOG_MAX_PAGE_SIZE))
+            if params.get('cursor'):
+                date_taken, log_id = decode_log_cursor(params['cursor'])
+                queryset = queryset.filter(
+                    Q(date_taken__lt=date_taken) |
+                    Q(date_taken=date_taken, id__lt=log_id)
+                )
+            page = list(queryset[:limit + 1])
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        has_more = len(page) > limit
+        page = page[:limit]
+        return Response({
+            'count': len(page),
+            'has_more': has_more,
+            'next_cursor': encode_log_cursor(page[-1]) if has_more else None,
+            'results': self.get_serializer(page, many=True).data,
+        })
+
+    @action(detail=False, methods=['get'])
+    def daily(self, request):
+        """
+        Doses and average effectiveness per medication and local day, for
+        charts: ?start_date=&end_date=&user_medication= (default last 30 days)
+        """
+        try:
+            start_date, end_date = parse_date_range(request.query_params, DEFAULT_RANGE_DAYS, MAX_RANGE_DAYS)
+            tz = get_zone(user_timezone(request.user))
+            range_start, range_end = local_day_bounds(start_date, end_date, tz)
+            logs = MedicationLog.objects.filter(
+                user=request.user, date_taken__gte=range_start, date_taken__lt=range_end
+            )
+            user_medication_id = parse_user_medication(request.query_params, request.user)
+            if user_medication_id is not None:
+                logs = logs.filter(user_medication_id=user_medication_id)
+            buckets = list(
+                logs.annotate(day=TruncDate('date_taken', tzinfo=tz))
+                .values('user_medication_id', 'day')
+                .annotate(doses=Count('id'), average_effectiveness=Avg('effectiveness'))
+                .order_by('user_medication_id', 'day')
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        medications = {}
+        for bucket in buckets:
+            average = bucket['average_effectiveness']
+            medications.setdefault(bucket['user_medication_id'], []).append({
+                'date': bucket['day'].isoformat(),
+                'doses': bucket['doses'],
+                'average_effectiveness': round(average, 2) if average is not None else None,
+            })
+        return Response({
+            'status': 'success',
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'medications': [
+                {'user_medication': user_medication_id, 'days': days}
+                for user_medication_id, days in medications.items()
+            ],
+        })
+
     def perform_create(self, serializer):
         # Automatically assign the logged-in user
         serializer.save(user=self.request.user)
@@ -202,7 +424,7 @@ class MedicationReminderView(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        return MedicationReminder.objects.filter(user=self.request.user)
+        return MedicationReminder.objects.filter(user=self.request.user).prefetch_related(user_medication_prefetch())
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
\ No newline at end of file
@@ -0,0 +1,111 @@
+"""
+Per-user unread counters kept in the Django cache (Redis), so badge polls
+are a single GET instead of a COUNT query.
+
+Counters are created lazily from the database on first read and kept in
+step by incr/decr at the places that change unread state. Anything that
+changes many users at once just deletes their keys; the next read
+recomputes them. If the cache is unavailable every call falls back to the
+database, so a Redis outage only costs speed.
+
+Writes to the counters wait for the surrounding transaction to commit
+(immediately outside one): applied earlier, a rollback would leave the
+counter off, and a concurrent read could recount from the database before
+the change is visible and cache the old number.
+"""
+import logging
+from django.core.cache import cache
+from django.db import transaction
+from .models import Notification, PartnerMessage
+
+
+logger = logging.getLogger(__name__)
+
+# Recompute from the database at least this often, to bound any drift
+COUNTER_TTL = 24 * 60 * 60
+
+COUNTER_KINDS = ('notifications', 'messages')
+
+
+def counter_key(kind, user_id):
+    return f'unread_{kind}_{user_id}'
+
+
+def count_unread_from_db(kind, user_id):
+    if kind == 'notifications':
+        return Notification.objects.filter(user_id=user_id, is_read=False).count()
+    return PartnerMessage.objects.filter(receiver_id=user_id, is_read=False).count()
+
+
+def get_unread_count(kind, user_id):
+    key = counter_key(kind, user_id)
+    try:
+        count = cache.get(key)
+    except Exception as e:
+        logger.warning(f"Unread counter read failed, using database: {e}")
+        return count_unread_from_db(kind, user_id)
+
+    if count is None:
+        count = count_unread_from_db(kind, user_id)
+        try:
+            # add() so a concurrent incr that created the key first is not overwritten
+            cache.add(key, count, timeout=COUNTER_TTL)
+        except Exception as e:
+            logger.warning(f"Unread counter write failed: {e}")
+    return count
+
+
+def adjust_unread_count(kind, user_id, delta):
+    """Apply +delta/-delta to an existing counter once the transaction commits."""
+    if delta:
+        transaction.on_commit(lambda: _adjust(kind, user_id, delta))
+
+
+def _adjust(kind, user_id, delta):
+    """Missing counters are left to lazy init."""
+    key = counter_key(kind, user_id)
+    try:
+        value = cache.incr(key, delta) if delta > 0 else cache.decr(key, -delta)
+        if value < 0:
+            cache.delete(key)
+    except ValueError:
+        # Key not cached yet: the next read counts from the database
+        pass
+    except Exception as e:
+        logger.warning(f"Unread counter update failed, dropping it: {e}")
+        _reset([counter_key(kind, user_id)])
+
+
+def set_unread_count(kind, user_id, value):
+    def write():
+        try:
+            cache.set(counter_key(kind, user_id), value, timeout=COUNTER_TTL)
+        except Exception as e:
+            logger.warning(f"Unread counter write failed: {e}")
+    transaction.on_commit(write)
+
+
+def reset_unread_counts(kind, user_ids):
+    """Forget counters (one round trip) after commit, so they are recounted on next read."""
+    keys = [counter_key(kind, user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: _reset(keys))
+
+
+def _reset(keys):
+    try:
+        cache.delete_many(keys)
+    except Exception as e:
+        logger.warning(f"Unread counter reset failed: {e}")
+
+
+def notifications_created(user_ids):
+    """Call after inserting unread notifications for `user_ids` (one entry per row)."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    distinct = set(user_ids)
+    if len(distinct) == 1:
+        adjust_unread_count('notifications', user_ids[0], len(user_ids))
+    else:
+        reset_unread_counts('notifications', distinct)
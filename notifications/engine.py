@@ -0,0 +1,238 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Mod
+from django.utils import timezone
+from cycle_tracker.models import WellnessLog
+from .counters import notifications_created
+from .models import Notification, NotificationPreference, NotificationSchedule
+from .outbox import enqueue
+from .realtime import publish_notifications
+from .rules import apply_delivery_mode, build_candidates, load_contexts, next_event_date, wellness_reminder
+from .timing import get_zone
+
+
+# Users loaded and evaluated together; each chunk costs a fixed number of queries
+DEFAULT_CHUNK_SIZE = 500
+
+# Furthest-ahead zone (Kiribati, UTC+14); its date is the latest one anywhere
+LATEST_TIMEZONE = 'Pacific/Kiritimati'
+
+
+def parse_shard(value):
+    """'2/8' -> (2, 8). Shards are 0-based: 0/8 ... 7/8."""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except (AttributeError, ValueError):
+        raise ValueError("Shard must look like i/n, e.g. 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError("Shard index must be between 0 and n-1")
+    return index, count
+
+
+def user_id_chunks(users, chunk_size=DEFAULT_CHUNK_SIZE, shard=None):
+    """Yield lists of user ids, optionally restricted to one id % n shard."""
+    if shard:
+        index, count = shard
+        users = users.annotate(_shard=Mod('id', count)).filter(_shard=index)
+
+    chunk = []
+    for user_id in users.order_by('id').values_list('id', flat=True).iterator(chunk_size=chunk_size):
+        chunk.append(user_id)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def existing_dedup_keys(candidates):
+    """The candidates' dedup keys that are already stored, in one query."""
+    return set(
+        Notification.objects.filter(
+            dedup_key__in=[n.dedup_key for n in candidates]
+        ).values_list('dedup_key', flat=True)
+    )
+
+
+def digested_dedup_keys(user_ids, today):
+    """Dedup keys delivered as part of the users' digests for `today`."""
+    keys = set()
+    digests = Notification.objects.filter(
+        user_id__in=user_ids, notification_type='digest', dedup_key__endswith=f':{today.isoformat()}'
+    )
+    for digest_keys in digests.values_list('digest_keys', flat=True):
+        keys.update(digest_keys)
+    return keys
+
+
+def lock_recipients(user_ids):
+    """Row-lock the users in id order (so concurrent callers cannot deadlock) until commit."""
+    list(User.objects.select_for_update().filter(id__in=user_ids).order_by('id').values_list('id', flat=True))
+
+
+def save_notifications(candidates, force=False):
+    """
+    Insert candidates in one statement. The unique dedup_key makes this
+    idempotent: rows that already exist are skipped by the database. One
+    prefilter query tells us which candidates are actually new, so callers
+    can report what was created.
+    Concurrent runs for the same users are serialized by locking the users
+    before the prefilter, so a key cannot be inserted by another run between
+    the prefilter and the insert, and every id looked up afterwards belongs
+    to a row this call created.
+    With force=True the keys are cleared and everything is inserted.
+    Email/push deliveries are queued in the same transaction (outbox.enqueue)
+    and open streams are notified after commit (realtime).
+    """
+    if not candidates:
+        return []
+
+    if force:
+        for notification in candidates:
+            notification.dedup_key = None
+        with transaction.atomic():
+            created = Notification.objects.bulk_create(candidates)
+            enqueue(created)
+            publish_notifications(created)
+        notifications_created(n.user_id for n in created)
+        return created
+
+    with transaction.atomic():
+        lock_recipients({n.user_id for n in candidates})
+        existing = existing_dedup_keys(candidates)
+        seen = set()
+        new = []
+        for notification in candidates:
+            if notification.dedup_key in existing or notification.dedup_key in seen:
+                continue
+            seen.add(notification.dedup_key)
+            new.append(notification)
+
+        if not new:
+            return []
+
+        Notification.objects.bulk_create(new, ignore_conflicts=True)
+        # Conflict-ignoring inserts return no ids; fetch them to queue deliveries
+        ids = dict(
+            Notification.objects.filter(dedup_key__in=seen).values_list('dedup_key', 'id')
+        )
+        for notification in new:
+            notification.id = ids.get(notification.dedup_key)
+        enqueue(new)
+        publish_notifications(new)
+    notifications_created(n.user_id for n in new)
+    return new
+
+
+def update_schedule(contexts, today):
+    """Store the next rule-firing day after today for each evaluated user (one upsert)."""
+    tomorrow = today + timedelta(days=1)
+    NotificationSchedule.objects.bulk_create(
+        [
+            NotificationSchedule(user_id=user_id, next_event_date=next_event_date(context, tomorrow))
+            for user_id, context in contexts.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['next_event_date', 'updated_at']
+    )
+
+
+def users_by_local_day(user_ids, now=None):
+    """{date: user ids} for the current date in each user's timezone (one query)."""
+    now = now or timezone.now()
+    timezones = dict(
+        NotificationPreference.objects.filter(user_id__in=user_ids).values_list('user_id', 'timezone')
+    )
+    groups = defaultdict(list)
+    for user_id in user_ids:
+        groups[now.astimezone(get_zone(timezones.get(user_id))).date()].append(user_id)
+    return groups
+
+
+def latest_local_date(now=None):
+    """The calendar date in the timezone furthest ahead (UTC+14)."""
+    return (now or timezone.now()).astimezone(get_zone(LATEST_TIMEZONE)).date()
+
+
+def due_users(users, today=None):
+    """
+    Users with no schedule yet (new or invalidated) or whose next event is
+    today or earlier. Without `today` the latest date anywhere is used, so
+    nobody is left out because their local day started before UTC's; users
+    still on the previous day are merely evaluated early.
+    """
+    today = today or latest_local_date()
+    return users.filter(
+        Q(notification_schedule__isnull=True) |
+        Q(notification_schedule__next_event_date__lte=today)
+    )
+
+
+def generate_for_users(user_ids, today=None, force=False):
+    """
+    Evaluate all rules for one chunk of users, store the new notifications
+    and refresh their schedule. Returns the list of created Notification objects.
+    Without `today` each user is evaluated for their own local date, like
+    the scheduler does, so dedup keys agree whichever path runs first.
+    """
+    if today is None:
+        created = []
+        for day, day_user_ids in users_by_local_day(user_ids).items():
+            created.extend(generate_for_users(day_user_ids, today=day, force=force))
+        return created
+
+    contexts = load_contexts(user_ids, today)
+
+    built = {user_id: build_candidates(context, today) for user_id, context in contexts.items()}
+    # Drop what was already sent today, on its own or inside a digest, before
+    # digests are built, so a digest never repeats a notification
+    existing = set()
+    if not force:
+        existing = existing_dedup_keys([n for user_candidates in built.values() for n in user_candidates])
+        existing |= digested_dedup_keys(list(contexts), today)
+
+    candidates = []
+    for user_id, context in contexts.items():
+        fresh = [n for n in built[user_id] if n.dedup_key not in existing]
+        candidates.extend(apply_delivery_mode(context, fresh, today))
+
+    created = save_notifications(candidates, force=force)
+    update_schedule(contexts, today)
+    return created
+
+
+def generate_for_user(user, today=None, force=False):
+    """Synchronous single-user run, used by the API."""
+    return generate_for_users([user.id], today=today, force=force)
+
+
+def generate_wellness_reminders(user_ids, today=None, force=False):
+    """
+    Daily wellness reminder for users that are not due for a full
+    evaluation: one query for today's logs, one for users who turned the
+    reminder off, one insert. Without `today`, each user's local date.
+    """
+    if today is None:
+        created = []
+        for day, day_user_ids in users_by_local_day(user_ids).items():
+            created.extend(generate_wellness_reminders(day_user_ids, today=day, force=force))
+        return created
+
+    skipped = set(
+        WellnessLog.objects.filter(user_id__in=user_ids, date=today)
+        .values_list('user_id', flat=True)
+    )
+    skipped.update(
+        NotificationPreference.objects.filter(user_id__in=user_ids, inapp_wellness_reminder=False)
+        .values_list('user_id', flat=True)
+    )
+    candidates = [
+        wellness_reminder(user_id, today)
+        for user_id in user_ids
+        if user_id not in skipped
+    ]
+    return save_notifications(candidates, force=force)
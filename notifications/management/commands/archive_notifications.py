@@ -0,0 +1,79 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from notifications.retention import (
+    ARCHIVE_AFTER_DAYS, PURGE_AFTER_DAYS, RETENTION_BATCH_SIZE,
+    archive_read_notifications, purge_notifications
+)
+
+
+class Command(BaseCommand):
+    help = 'Move old read notifications to compressed cold storage and purge expired ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--archive-days',
+            type=int,
+            default=ARCHIVE_AFTER_DAYS,
+            help=f'Archive read notifications older than this many days (default: {ARCHIVE_AFTER_DAYS})',
+        )
+        parser.add_argument(
+            '--purge-days',
+            type=int,
+            default=PURGE_AFTER_DAYS,
+            help=f'Delete any notification older than this many days (default: {PURGE_AFTER_DAYS})',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=RETENTION_BATCH_SIZE,
+            help=f'Rows per select/delete batch (default: {RETENTION_BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--archive-dir',
+            default=settings.NOTIFICATION_ARCHIVE_DIR,
+            help='Directory for the .ndjson.gz archive files (default: settings.NOTIFICATION_ARCHIVE_DIR)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count what would be archived and purged',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if options['purge_days'] < options['archive_days']:
+            raise CommandError('--purge-days must not be shorter than --archive-days')
+
+        now = timezone.now()
+        dry_run = options['dry_run']
+        started = time.monotonic()
+
+        archived, path = archive_read_notifications(
+            now - timedelta(days=options['archive_days']),
+            options['archive_dir'],
+            options['batch_size'],
+            dry_run
+        )
+        if dry_run:
+            self.stdout.write(f'  Would archive {archived} read notifications')
+        elif path:
+            self.stdout.write(self.style.SUCCESS(f'✓ Archived {archived} read notifications to {path}'))
+        else:
+            self.stdout.write('  Nothing to archive')
+
+        purged = purge_notifications(
+            now - timedelta(days=options['purge_days']),
+            options['batch_size'],
+            dry_run
+        )
+        if dry_run:
+            self.stdout.write(f'  Would purge {purged} expired notifications')
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✓ Purged {purged} expired notifications'))
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Complete! ({elapsed:.1f}s)'))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import CharField, Max, Min, Value
+from django.db.models.functions import Cast, Concat, Greatest, Least
+from notifications.models import PartnerMessage
+
+
+class Command(BaseCommand):
+    help = 'Fill PartnerMessage.conversation_key for messages stored before the field existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Id range updated per query (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        pending = PartnerMessage.objects.filter(conversation_key='')
+        bounds = pending.aggregate(first=Min('id'), last=Max('id'))
+        if bounds['first'] is None:
+            self.stdout.write(self.style.SUCCESS('✓ Backfilled 0 messages'))
+            return
+
+        # One short UPDATE per id range, so locks and WAL stay small on a large table.
+        # The key is "<lower user id>:<higher user id>" like make_conversation_key()
+        updated = 0
+        for start in range(bounds['first'], bounds['last'] + 1, batch_size):
+            updated += pending.filter(id__gte=start, id__lt=start + batch_size).update(
+                conversation_key=Concat(
+                    Cast(Least('sender_id', 'receiver_id'), CharField()),
+                    Value(':'),
+                    Cast(Greatest('sender_id', 'receiver_id'), CharField()),
+                    output_field=CharField()
+                )
+            )
+        self.stdout.write(self.style.SUCCESS(f'✓ Backfilled {updated} messages'))
@@ -1,9 +1,11 @@
-from django.core.management.base import BaseCommand
+import time
+from collections import Counter
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
-from cycle_tracker.models import Period
-from notifications.models import Notification, NotificationPreference
-from datetime import datetime, timedelta
-from django.utils import timezone
+from notifications.engine import (
+    DEFAULT_CHUNK_SIZE, due_users, generate_for_users, generate_wellness_reminders,
+    parse_shard, user_id_chunks
+)
 
 
 class Command(BaseCommand):
@@ -31,12 +33,39 @@ class Command(BaseCommand):
             action='store_true',
             help='Force create notifications even if they exist today',
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help=f'Users evaluated per batch of queries (default: {DEFAULT_CHUNK_SIZE})',
+        )
+        parser.add_argument(
+            '--shard',
+            help='Only process users with id %% n == i, given as i/n (e.g. 0/4). '
+                 'Run one process per shard to split the user base.',
+        )
+        parser.add_argument(
+            '--scheduled',
+            action='store_true',
+            help='Only run the cycle rules for users whose next event is due '
+                 '(see NotificationSchedule); everyone else just gets the wellness reminder',
+        )
 
     def handle(self, *args, **options):
         user_id = options.get('user_id')
-        days_ahead = options.get('days_ahead')
         self.verbose = options.get('verbose', False)
-        self.force = options.get('force', False)
+        force = options.get('force', False)
+        chunk_size = options['chunk_size']
+
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        shard = None
+        if options.get('shard'):
+            try:
+                shard = parse_shard(options['shard'])
+            except ValueError as e:
+                raise CommandError(str(e))
 
         if user_id:
             users = User.objects.filter(id=user_id)
@@ -46,240 +75,51 @@ class Command(BaseCommand):
         else:
             users = User.objects.all()
 
+        started = time.monotonic()
         total_notifications = 0
         users_processed = 0
 
-        for user in users:
+        if options.get('scheduled'):
+            due = due_users(users)
+            reminders = 0
+            for user_ids in user_id_chunks(users.exclude(id__in=due.values('id')), chunk_size, shard):
+                reminders += len(generate_wellness_reminders(user_ids, force=force))
+            total_notifications += reminders
+            self.stdout.write(f'  {reminders} wellness reminders for users not due')
+            users = due
+
+        for user_ids in user_id_chunks(users, chunk_size, shard):
             try:
-                count = self.generate_user_notifications(user, days_ahead)
-                total_notifications += count
-                users_processed += 1
-                
-                if count > 0:
-                    self.stdout.write(
-                        self.style.SUCCESS(
-                            f'✓ Generated {count} notifications for {user.username}'
-                        )
-                    )
-                elif self.verbose:
-                    self.stdout.write(
-                        self.style.WARNING(
-                            f'○ No notifications for {user.username}'
-                        )
-                    )
+                # Each user's rules run for their own local date
+                created = generate_for_users(user_ids, force=force)
             except Exception as e:
                 self.stdout.write(
                     self.style.ERROR(
-                        f'✗ Error for {user.username}: {str(e)}'
+                        f'✗ Error for users {user_ids[0]}-{user_ids[-1]}: {str(e)}'
                     )
                 )
+                continue
 
-        self.stdout.write(
-            self.style.SUCCESS(
-                f'\n✓ Complete! Generated {total_notifications} notifications for {users_processed} users'
-            )
-        )
+            total_notifications += len(created)
+            users_processed += len(user_ids)
 
-    def generate_user_notifications(self, user, days_ahead):
-        """Generate notifications for a single user."""
-        notifications_created = 0
-        
-        # Get or create preferences
-        preferences, _ = NotificationPreference.objects.get_or_create(user=user)
-        
-        # Get user's gender
-        try:
-            gender = user.userprofile.sex or 'none'
-        except:
-            gender = 'none'
-        
-        today = timezone.now().date()
-        future_date = today + timedelta(days=days_ahead)
-        
-        if self.verbose:
-            self.stdout.write(f'\n--- {user.username} (gender: {gender}) ---')
-        
-        # For female users
-        if gender == 'female':
-            periods = Period.objects.filter(user=user).order_by('-start_date')
-            
             if self.verbose:
-                self.stdout.write(f'  Periods found: {periods.count()}')
-            
-            if periods.exists():
-                latest_period = periods.first()
-                next_period_date = latest_period.next_period_start_date or latest_period.calculate_next_period()
-                
-                if self.verbose:
-                    self.stdout.write(f'  Latest period: {latest_period.start_date}')
-                    self.stdout.write(f'  Next period: {next_period_date}')
-                    self.stdout.write(f'  Today: {today}, Future date: {future_date}')
-                
-                if next_period_date:
-                    days_until_period = (next_period_date - today).days
-                    
-                    if self.verbose:
-                        self.stdout.write(f'  Days until period: {days_until_period}')
-                    
-                    # Period reminder notification (if within reminder window)
-                    reminder_days = preferences.reminder_days_before
-                    if self.verbose:
-                        self.stdout.write(f'  Reminder days setting: {reminder_days}')
-                    
-                    if 0 < days_until_period <= reminder_days:
-                        if self.verbose:
-                            self.stdout.write(f'  Creating period reminder...')
-                        if self.create_notification(
-                            user, 'period_reminder', 
-                            'Period Coming Soon',
-                            f'Your period is expected in {days_until_period} days on {next_period_date.strftime("%B %d")}.',
-                            related_id=latest_period.id,
-                            related_type='period'
-                        ):
-                            notifications_created += 1
-                            if self.verbose:
-                                self.stdout.write(f'  ✓ Period reminder created')
-                        elif self.verbose:
-                            self.stdout.write(f'  ✗ Period reminder already exists')
-                    
-                    # Period approaching (1 day before)
-                    if days_until_period == 1:
-                        if self.create_notification(
-                            user, 'period_approaching',
-                            'Period Tomorrow',
-                            'Your period is expected to start tomorrow. Be prepared!',
-                            related_id=latest_period.id,
-                            related_type='period'
-                        ):
-                            notifications_created += 1
-                    
-                    # PMS warning (3-4 days before)
-                    if 3 <= days_until_period <= 4:
-                        if self.create_notification(
-                            user, 'pms_warning',
-                            'PMS Phase',
-                            'You may experience PMS symptoms. Practice self-care and stress management.',
-                            related_id=latest_period.id,
-                            related_type='period'
-                        ):
-                            notifications_created += 1
-                    
-                    # Ovulation notification
-                    cycle_length = latest_period.cycle_length or 28
-                    cycle_day = (today - latest_period.start_date).days
-                    ovulation_day = cycle_length // 2
-                    
-                    if self.verbose:
-                        self.stdout.write(f'  Cycle day: {cycle_day}, Ovulation day: {ovulation_day}')
-                    
-                    # Ovulation window (day 12-16 of cycle)
-                    if 12 <= cycle_day <= 16:
-                        if self.create_notification(
-                            user, 'ovulation',
-                            'Ovulation Window',
-                            f'You are in your ovulation window (Day {cycle_day} of your cycle).',
-                            related_id=latest_period.id,
-                            related_type='period'
-                        ):
-                            notifications_created += 1
-                    
-                    # Fertile window (day 10-17 of cycle)
-                    if 10 <= cycle_day <= 17:
-                        if self.create_notification(
-                            user, 'fertile_window',
-                            'Fertile Window',
-                            'You are in your fertile window. Track your symptoms.',
-                            related_id=latest_period.id,
-                            related_type='period'
-                        ):
-                            notifications_created += 1
-        
-        # For male users with partners
-        elif gender == 'male':
-            try:
-                user_profile = user.userprofile
-                partners = user_profile.partners.all()
-                
-                if partners.exists():
-                    partner = partners.first()
-                    partner_user = partner.user
-                    partner_periods = Period.objects.filter(user=partner_user).order_by('-start_date')
-                    
-                    if partner_periods.exists():
-                        latest_partner_period = partner_periods.first()
-                        next_period_date = latest_partner_period.next_period_start_date or latest_partner_period.calculate_next_period()
-                        
-                        if next_period_date:
-                            partner_name = f"{partner_user.first_name} {partner_user.last_name}".strip() or partner_user.username
-                            days_until_partner_period = (next_period_date - today).days
-                            
-                            if self.verbose:
-                                self.stdout.write(f'  Partner period in: {days_until_partner_period} days')
-                            
-                            # Partner period notification (1-2 days before)
-                            if 1 <= days_until_partner_period <= 2:
-                                if self.verbose:
-                                    self.stdout.write(f'  Creating partner period notification...')
-                                if self.create_notification(
-                                    user, 'partner_message',
-                                    "Partner's Period Coming",
-                                    f"{partner_name}'s period starts in {days_until_partner_period} day(s). Be supportive!",
-                                    related_id=partner_user.id,
-                                    related_type='partner'
-                                ):
-                                    notifications_created += 1
-                                    if self.verbose:
-                                        self.stdout.write(f'  ✓ Partner notification created')
-                                elif self.verbose:
-                                    self.stdout.write(f'  ✗ Partner notification already exists')
-                            
-                            # Partner PMS notification (3-4 days before)
-                            if 3 <= days_until_partner_period <= 4:
-                                if self.create_notification(
-                                    user, 'partner_message',
-                                    "Partner's PMS Phase",
-                                    f"{partner_name} may be experiencing PMS symptoms. Extra care and understanding appreciated!",
-                                    related_id=partner_user.id,
-                                    related_type='partner'
-                                ):
-                                    notifications_created += 1
-            except Exception as e:
-                pass
-        
-        # Wellness reminder (all users) - only if they haven't logged today
-        from cycle_tracker.models import WellnessLog
-        today_log = WellnessLog.objects.filter(user=user, date=today).exists()
-        
-        if not today_log:
-            if self.create_notification(
-                user, 'wellness_reminder',
-                'Log Your Wellness',
-                'Take a moment to log your wellness metrics for today.',
-            ):
-                notifications_created += 1
-        
-        return notifications_created
+                per_user = Counter(n.user_id for n in created)
+                usernames = dict(User.objects.filter(id__in=per_user).values_list('id', 'username'))
+                for uid, count in sorted(per_user.items()):
+                    self.stdout.write(
+                        self.style.SUCCESS(f'✓ Generated {count} notifications for {usernames.get(uid, uid)}')
+                    )
+
+            elapsed = time.monotonic() - started
+            rate = users_processed / elapsed if elapsed else 0
+            self.stdout.write(
+                f'  {users_processed} users, {total_notifications} notifications ({rate:.0f} users/sec)'
+            )
 
-    def create_notification(self, user, notif_type, title, message, related_id=None, related_type=None):
-        """Create a notification if it doesn't already exist."""
-        today = timezone.now().date()
-        
-        # Check if similar notification already exists today (unless force mode)
-        if not self.force:
-            if Notification.objects.filter(
-                user=user,
-                notification_type=notif_type,
-                title=title,
-                created_at__date=today
-            ).exists():
-                return False
-        
-        Notification.objects.create(
-            user=user,
-            notification_type=notif_type,
-            title=title,
-            message=message,
-            related_id=related_id,
-            related_type=related_type
+        shard_note = f' (shard {shard[0]}/{shard[1]})' if shard else ''
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'\n✓ Complete! Generated {total_notifications} notifications for {users_processed} users{shard_note}'
+            )
         )
-        return True
@@ -0,0 +1,106 @@
+import heapq
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+from notifications.scheduler import (
+    MAX_SLEEP_SECONDS, SCHEDULE_SOURCES, SCHEDULER_BATCH_SIZE, backfill_fire_times
+)
+
+
+# Heap key for sources with nothing pending
+NEVER = datetime.max.replace(tzinfo=dt_timezone.utc)
+
+# How long medication reminders that cannot fire are left out of the backfill
+UNSCHEDULABLE_RETRY_SECONDS = 60 * 60
+
+
+class Command(BaseCommand):
+    help = 'Deliver reminders at their reminder_time (user timezone aware); runs until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=SCHEDULER_BATCH_SIZE,
+            help=f'Due rows claimed per transaction (default: {SCHEDULER_BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--max-sleep',
+            type=float,
+            default=MAX_SLEEP_SECONDS,
+            help=f'Longest sleep between wake-ups in seconds (default: {MAX_SLEEP_SECONDS})',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Deliver everything that is due now and exit (for cron or testing)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        max_sleep = options['max_sleep']
+        once = options['once']
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Scheduler started (sources: {", ".join(SCHEDULE_SOURCES)})'
+        ))
+
+        # Medication reminders backfill_fire_times() found will not fire again
+        unschedulable = set()
+        unschedulable_since = time.monotonic()
+
+        try:
+            while True:
+                close_old_connections()
+                now = timezone.now()
+                # Saving a reminder reschedules it, but a later timezone change can clear it again
+                if time.monotonic() - unschedulable_since > UNSCHEDULABLE_RETRY_SECONDS:
+                    unschedulable.clear()
+                    unschedulable_since = time.monotonic()
+                backfill_fire_times(now, batch_size, unschedulable)
+
+                # Earliest pending time of each source; the top of the heap is the next wake-up
+                heap = [(peek() or NEVER, name) for name, (peek, _) in SCHEDULE_SOURCES.items()]
+                heapq.heapify(heap)
+
+                delivered = 0
+                while heap and heap[0][0] <= now:
+                    _, name = heapq.heappop(heap)
+                    peek, deliver = SCHEDULE_SOURCES[name]
+                    delivered += self.drain(name, deliver, now, batch_size)
+                    # Anything still <= now is locked by another scheduler; leave it to them
+                    next_at = peek() or NEVER
+                    if next_at > now:
+                        heapq.heappush(heap, (next_at, name))
+
+                if once:
+                    self.stdout.write(self.style.SUCCESS(f'\n✓ Complete! Handled {delivered} due items'))
+                    return
+
+                if heap and heap[0][0] != NEVER:
+                    wait = (heap[0][0] - timezone.now()).total_seconds()
+                else:
+                    wait = max_sleep
+                time.sleep(min(max(wait, 0), max_sleep))
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\n○ Scheduler stopped'))
+
+    def drain(self, name, deliver, now, batch_size):
+        """Deliver batches until everything due at `now` for this source is handled."""
+        started = time.monotonic()
+        handled = created = 0
+        while True:
+            rows, notifications = deliver(now, batch_size)
+            handled += rows
+            created += notifications
+            if rows < batch_size:
+                break
+
+        if handled:
+            elapsed = time.monotonic() - started
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ {name}: {handled} due, {created} notifications ({elapsed:.2f}s)'
+            ))
+        return handled
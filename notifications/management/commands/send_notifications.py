@@ -0,0 +1,141 @@
+import threading
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from notifications.outbox import DELIVERY_CHANNELS, MAX_ATTEMPTS, OUTBOX_BATCH_SIZE, deliver_batch
+from notifications.providers import get_provider
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued email/push notifications from the outbox with a pool of worker threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--channel',
+            action='append',
+            choices=DELIVERY_CHANNELS,
+            help='Only deliver this channel (can be repeated; default: all)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2,
+            help='Worker threads per channel, each with its own provider connection (default: 2)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=OUTBOX_BATCH_SIZE,
+            help=f'Outbox rows claimed per batch (default: {OUTBOX_BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=MAX_ATTEMPTS,
+            help=f'Give up on a delivery after this many attempts (default: {MAX_ATTEMPTS})',
+        )
+        parser.add_argument(
+            '--provider',
+            help='Provider name for every channel, e.g. "stub" (default: settings.NOTIFICATION_PROVIDERS)',
+        )
+        parser.add_argument(
+            '--stub-latency',
+            type=float,
+            default=0.0,
+            help='Stub provider: seconds per batch, to simulate a remote service',
+        )
+        parser.add_argument(
+            '--stub-failure-rate',
+            type=float,
+            default=0.0,
+            help='Stub provider: fraction of messages that fail (0-1)',
+        )
+        parser.add_argument(
+            '--idle-sleep',
+            type=float,
+            default=2.0,
+            help='Seconds a worker waits when the outbox is empty (default: 2)',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit when nothing is left to deliver instead of waiting for more',
+        )
+
+    def handle(self, *args, **options):
+        channels = options['channel'] or list(DELIVERY_CHANNELS)
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+
+        # Fail fast on provider misconfiguration instead of inside every thread
+        for channel in channels:
+            try:
+                get_provider(channel, options['provider']).close()
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        self.options = options
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.totals = {'sent': 0, 'retried': 0, 'failed': 0, 'skipped': 0, 'dead_tokens': 0}
+
+        threads = [
+            threading.Thread(target=self.work, args=(channel,), name=f'{channel}-{i}', daemon=True)
+            for channel in channels
+            for i in range(options['workers'])
+        ]
+
+        started = time.monotonic()
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Started {len(threads)} workers ({", ".join(channels)})'
+        ))
+        for thread in threads:
+            thread.start()
+
+        try:
+            while any(thread.is_alive() for thread in threads):
+                time.sleep(0.2)
+        except KeyboardInterrupt:
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+
+        elapsed = time.monotonic() - started
+        rate = self.totals['sent'] / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\n✓ Complete! Sent {self.totals['sent']}, retrying {self.totals['retried']}, "
+                f"failed {self.totals['failed']}, skipped {self.totals['skipped']}, "
+                f"deactivated {self.totals['dead_tokens']} tokens ({rate:.0f} msgs/sec)"
+            )
+        )
+
+    def work(self, channel):
+        """One worker: one provider connection, batches until stopped (or empty with --once)."""
+        options = self.options
+        provider = get_provider(
+            channel,
+            options['provider'],
+            latency=options['stub_latency'],
+            failure_rate=options['stub_failure_rate']
+        )
+        try:
+            while not self.stop.is_set():
+                try:
+                    stats = deliver_batch(provider, options['batch_size'], options['max_attempts'])
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f'✗ {threading.current_thread().name}: {str(e)}'))
+                    self.stop.wait(options['idle_sleep'])
+                    continue
+
+                with self.lock:
+                    for key in self.totals:
+                        self.totals[key] += stats[key]
+
+                if not stats['claimed']:
+                    if options['once']:
+                        break
+                    self.stop.wait(options['idle_sleep'])
+        finally:
+            provider.close()
+            connection.close()
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from .timing import DEFAULT_TIMEZONE, as_time, next_local_time
 
 
 class Notification(models.Model):
@@ -13,6 +14,10 @@ class Notification(models.Model):
         ('pms_warning', 'PMS Warning'),
         ('wellness_reminder', 'Wellness Log Reminder'),
         ('partner_message', 'Partner Message'),
+        ('medication_reminder', 'Medication Reminder'),
+        ('medication_interaction', 'Medication Interaction'),
+        ('reminder', 'Reminder'),
+        ('digest', 'Daily Digest'),
         ('system', 'System Notification'),
     ]
     
@@ -27,6 +32,14 @@ class Notification(models.Model):
     # Optional: Link to related objects
     related_id = models.IntegerField(null=True, blank=True, help_text="ID of related object (period, message, etc)")
     related_type = models.CharField(max_length=50, null=True, blank=True, help_text="Type of related object")
+
+    # One notification per (user, type, related object, day); NULL for forced/manual ones
+    dedup_key = models.CharField(
+        max_length=191, null=True, blank=True, unique=True,
+        help_text="user:type:related_type:related_id:date, see make_dedup_key()"
+    )
+    # For a digest: dedup keys of the notifications it stands in for, so later runs skip them
+    digest_keys = models.JSONField(default=list, blank=True)
     
     class Meta:
         ordering = ['-created_at']
@@ -34,17 +47,27 @@ class Notification(models.Model):
             models.Index(fields=['user', 'is_read']),
             models.Index(fields=['user', 'notification_type']),
             models.Index(fields=['created_at']),
+            # Retention scans: read rows older than a cutoff (archive_notifications)
+            models.Index(fields=['is_read', 'created_at']),
         ]
     
     def __str__(self):
         return f"{self.notification_type} for {self.user.username}: {self.title}"
+
+    @staticmethod
+    def make_dedup_key(user_id, notification_type, related_type=None, related_id=None, day=None):
+        """Key backing the unique index that makes generation idempotent."""
+        day = day or timezone.now().date()
+        return f"{user_id}:{notification_type}:{related_type or '-'}:{related_id or '-'}:{day.isoformat()}"
     
     def mark_as_read(self):
         """Mark notification as read"""
+        from .counters import adjust_unread_count
         if not self.is_read:
             self.is_read = True
             self.read_at = timezone.now()
             self.save(update_fields=['is_read', 'read_at'])
+            adjust_unread_count('notifications', self.user_id, -1)
 
 
 class PartnerMessage(models.Model):
@@ -56,22 +79,39 @@ class PartnerMessage(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     read_at = models.DateTimeField(null=True, blank=True)
     
+    # Same value for both directions of a pair, see make_conversation_key()
+    conversation_key = models.CharField(max_length=50, blank=True, default='', editable=False)
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['sender', 'receiver']),
             models.Index(fields=['receiver', 'is_read']),
+            # Keyset pagination of one conversation, newest first
+            models.Index(fields=['conversation_key', '-created_at', '-id']),
         ]
     
     def __str__(self):
         return f"Message from {self.sender.username} to {self.receiver.username}"
     
+    @staticmethod
+    def make_conversation_key(user_id, other_user_id):
+        low, high = sorted([int(user_id), int(other_user_id)])
+        return f"{low}:{high}"
+    
+    def save(self, *args, **kwargs):
+        if not self.conversation_key:
+            self.conversation_key = self.make_conversation_key(self.sender_id, self.receiver_id)
+        super().save(*args, **kwargs)
+    
     def mark_as_read(self):
         """Mark message as read"""
+        from .counters import adjust_unread_count
         if not self.is_read:
             self.is_read = True
             self.read_at = timezone.now()
             self.save(update_fields=['is_read', 'read_at'])
+            adjust_unread_count('messages', self.receiver_id, -1)
 
 
 class PushNotificationToken(models.Model):
@@ -101,8 +141,16 @@ class PushNotificationToken(models.Model):
 
 class NotificationPreference(models.Model):
     """User preferences for notifications"""
+    DELIVERY_MODES = [
+        ('instant', 'Instant'),
+        ('digest', 'Daily Digest'),
+    ]
+    
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='notification_preferences')
     
+    # digest: a generator run's notifications for the day become one row and one push
+    delivery_mode = models.CharField(max_length=10, choices=DELIVERY_MODES, default='instant')
+    
     # Email notifications
     email_period_reminder = models.BooleanField(default=True)
     email_ovulation = models.BooleanField(default=True)
@@ -124,9 +172,95 @@ class NotificationPreference(models.Model):
     # Timing preferences
     reminder_days_before = models.IntegerField(default=2, help_text="Days before period to send reminder")
     reminder_time = models.TimeField(default='09:00:00', help_text="Preferred time for reminders")
+    timezone = models.CharField(max_length=64, default=DEFAULT_TIMEZONE, help_text="IANA timezone, e.g. Europe/Berlin")
+    
+    # Next reminder_time in the user's timezone, picked up by run_scheduler
+    next_fire_at = models.DateTimeField(null=True, blank=True, db_index=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return f"Notification preferences for {self.user.username}"
+    
+    def compute_next_fire_at(self, after=None):
+        return next_local_time(after or timezone.now(), self.reminder_time, self.timezone)
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What next_fire_at was computed from, so save() can tell whether it is still valid
+        instance._loaded_timing = (instance.__dict__.get('reminder_time'), instance.__dict__.get('timezone'))
+        return instance
+    
+    def save(self, *args, **kwargs):
+        # Only reschedule when the time or timezone changed: recomputing on
+        # every save would push a due but not yet delivered run to tomorrow
+        loaded = getattr(self, '_loaded_timing', None)
+        timing = (as_time(self.reminder_time), self.timezone)
+        update_fields = kwargs.get('update_fields')
+        changed = {
+            name for name, old, new in zip(('reminder_time', 'timezone'), loaded or (None, None), timing)
+            if loaded is None or old != new
+        }
+        if update_fields is not None:
+            changed &= set(update_fields)
+        # Read by the post_save signal, which reschedules medication reminders on a timezone change
+        self.timezone_changed = 'timezone' in changed
+        if changed or (self.next_fire_at is None and update_fields is None):
+            self.next_fire_at = self.compute_next_fire_at()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'next_fire_at'}
+        super().save(*args, **kwargs)
+        self._loaded_timing = timing
+
+
+class NotificationSchedule(models.Model):
+    """
+    Next day the notification rules fire for a user, so scheduled runs of
+    generate_notifications only evaluate users that are due. Rows are
+    deleted (making the user due again) when periods, partners or
+    preferences change; see notifications/signals.py.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='notification_schedule')
+    next_event_date = models.DateField(db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Next notification event for {self.user.username}: {self.next_event_date}"
+
+
+class NotificationOutbox(models.Model):
+    """
+    Email/push deliveries waiting to be sent. Rows are written in the same
+    transaction as their Notification and drained by send_notifications.
+    """
+    CHANNELS = [
+        ('email', 'Email'),
+        ('push', 'Push'),
+    ]
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+        ('skipped', 'Skipped'),
+    ]
+
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='outbox')
+    channel = models.CharField(max_length=10, choices=CHANNELS)
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ['notification', 'channel']
+        indexes = [
+            # What workers poll: pending rows of one channel that are ready
+            models.Index(fields=['status', 'channel', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.channel} delivery of notification {self.notification_id} ({self.status})"
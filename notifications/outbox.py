@@ -0,0 +1,211 @@
+"""
+Transactional outbox for email and push delivery.
+
+enqueue() is called in the same transaction that inserts Notification rows
+and adds one NotificationOutbox row per channel the user has enabled.
+deliver_batch() is what a send_notifications worker runs in a loop: lease
+ready rows with SKIP LOCKED and commit, send them through one provider call
+outside any transaction, then record results, schedule retries with
+exponential backoff and deactivate the push tokens the provider reported
+as dead, all in bulk.
+"""
+import random
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from .models import NotificationOutbox, NotificationPreference, PushNotificationToken
+
+
+# Rows claimed per worker iteration
+OUTBOX_BATCH_SIZE = 200
+
+MAX_ATTEMPTS = 5
+
+# A claimed row is left to its worker this long before others may retry it
+CLAIM_LEASE_SECONDS = 5 * 60
+
+# Retry n waits RETRY_BASE_SECONDS * 2**(n-1), capped, with +-20% jitter
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 6 * 60 * 60
+
+# notification_type -> suffix of the email_* / push_* preference flags.
+# Types not listed are in-app only.
+PREFERENCE_CATEGORIES = {
+    'period_reminder': 'period_reminder',
+    'period_approaching': 'period_reminder',
+    'pms_warning': 'period_reminder',
+    'ovulation': 'ovulation',
+    'fertile_window': 'ovulation',
+    'partner_message': 'partner_message',
+    'wellness_reminder': 'wellness_reminder',
+}
+
+DELIVERY_CHANNELS = ('email', 'push')
+
+
+def preference_categories(notification):
+    """Preference categories a notification falls under; a digest covers those of its parts."""
+    parts = getattr(notification, 'digest_of', None) or [notification]
+    return {
+        PREFERENCE_CATEGORIES[n.notification_type]
+        for n in parts
+        if n.notification_type in PREFERENCE_CATEGORIES
+    }
+
+
+def enqueue(notifications):
+    """
+    Add outbox rows for saved notifications (they must have ids) according
+    to each user's email_*/push_* preferences. A digest is sent on a channel
+    if any of the notifications it replaces would have been. Call inside the transaction
+    that created the notifications. Returns the number of rows queued.
+    """
+    notifications = [n for n in notifications if n.pk and preference_categories(n)]
+    if not notifications:
+        return 0
+
+    preferences = {
+        pref.user_id: pref
+        for pref in NotificationPreference.objects.filter(
+            user_id__in={n.user_id for n in notifications}
+        )
+    }
+
+    # Users without a preference row get the model defaults
+    defaults = NotificationPreference()
+
+    rows = []
+    for notification in notifications:
+        pref = preferences.get(notification.user_id, defaults)
+        categories = preference_categories(notification)
+        for channel in DELIVERY_CHANNELS:
+            if any(getattr(pref, f'{channel}_{category}') for category in categories):
+                rows.append(NotificationOutbox(notification_id=notification.pk, channel=channel))
+
+    # (notification, channel) is unique, so queuing twice is harmless
+    NotificationOutbox.objects.bulk_create(rows, ignore_conflicts=True)
+    return len(rows)
+
+
+def retry_delay(attempts):
+    delay = min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def build_messages(channel, rows):
+    """
+    Provider payloads for claimed rows. Returns (messages, sendable rows,
+    rows with nowhere to send to). Push tokens are loaded in one query.
+    """
+    tokens = {}
+    if channel == 'push':
+        for user_id, token in PushNotificationToken.objects.filter(
+            user_id__in={row.notification.user_id for row in rows},
+            is_active=True
+        ).values_list('user_id', 'token'):
+            tokens.setdefault(user_id, []).append(token)
+
+    messages, sendable, unreachable = [], [], []
+    for row in rows:
+        notification = row.notification
+        message = {
+            'title': notification.title,
+            'body': notification.message,
+            'data': {
+                'notification_id': notification.id,
+                'type': notification.notification_type,
+                'related_id': notification.related_id,
+                'related_type': notification.related_type,
+            },
+        }
+        if channel == 'email':
+            if not notification.user.email:
+                unreachable.append(row)
+                continue
+            message['email'] = notification.user.email
+        else:
+            if notification.user_id not in tokens:
+                unreachable.append(row)
+                continue
+            message['tokens'] = tokens[notification.user_id]
+        messages.append(message)
+        sendable.append(row)
+    return messages, sendable, unreachable
+
+
+def claim_batch(channel, now, batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Lease ready rows of `channel` to this worker in a short transaction:
+    their attempt is counted and next_attempt_at moves CLAIM_LEASE_SECONDS
+    ahead, so other workers skip them while they are being sent and they
+    become ready again if this worker dies mid-batch.
+    """
+    with transaction.atomic():
+        rows = list(
+            NotificationOutbox.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('notification__user')
+            .filter(status='pending', channel=channel, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        for row in rows:
+            row.attempts += 1
+            row.next_attempt_at = now + timedelta(seconds=CLAIM_LEASE_SECONDS)
+        NotificationOutbox.objects.bulk_update(rows, ['attempts', 'next_attempt_at'])
+    return rows
+
+
+def deliver_batch(provider, batch_size=OUTBOX_BATCH_SIZE, max_attempts=MAX_ATTEMPTS):
+    """
+    Claim and send one batch for provider.channel. Rows are claimed and
+    results recorded in two short transactions; the provider call runs
+    between them, holding no locks. A provider error for the whole batch
+    counts as a failed attempt for every row.
+    Returns a dict of counts: claimed, sent, retried, failed, skipped, dead_tokens.
+    """
+    channel = provider.channel
+    stats = {'claimed': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'skipped': 0, 'dead_tokens': 0}
+
+    rows = claim_batch(channel, timezone.now(), batch_size)
+    stats['claimed'] = len(rows)
+    if not rows:
+        return stats
+
+    messages, sendable, unreachable = build_messages(channel, rows)
+    for row in unreachable:
+        row.status = 'skipped'
+        row.last_error = 'No email address' if channel == 'email' else 'No active push tokens'
+    stats['skipped'] = len(unreachable)
+
+    try:
+        results = provider.send_batch(messages) if messages else []
+    except Exception as e:
+        results = [{'ok': False, 'error': str(e), 'dead_tokens': []} for _ in messages]
+
+    now = timezone.now()
+    dead_tokens = set()
+    for row, result in zip(sendable, results):
+        dead_tokens.update(result['dead_tokens'])
+        if result['ok']:
+            row.status = 'sent'
+            row.sent_at = now
+            row.last_error = ''
+            stats['sent'] += 1
+        elif row.attempts >= max_attempts:
+            row.status = 'failed'
+            row.last_error = result['error']
+            stats['failed'] += 1
+        else:
+            row.next_attempt_at = now + retry_delay(row.attempts)
+            row.last_error = result['error']
+            stats['retried'] += 1
+
+    with transaction.atomic():
+        NotificationOutbox.objects.bulk_update(
+            rows, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+        )
+        if dead_tokens:
+            stats['dead_tokens'] = PushNotificationToken.objects.filter(
+                token__in=dead_tokens, is_active=True
+            ).update(is_active=False)
+
+    return stats
@@ -0,0 +1,147 @@
+"""
+Delivery providers used by the send_notifications workers.
+
+Each worker thread builds one provider per channel and keeps it for its
+whole life, so the SMTP connection / HTTP keep-alive session is reused
+across batches. send_batch() takes a list of message dicts and returns one
+result dict per message: {'ok': bool, 'error': str, 'dead_tokens': [...]}.
+"""
+import random
+import time
+import requests
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+
+
+# Seconds before an HTTP push request is abandoned
+PUSH_TIMEOUT = 10
+
+
+class SMTPEmailProvider:
+    """Sends through Django's email backend on a single reused connection."""
+    channel = 'email'
+
+    def __init__(self):
+        self.connection = get_connection(fail_silently=False)
+
+    def send_batch(self, messages):
+        self.connection.open()
+        results = []
+        for message in messages:
+            email = EmailMessage(
+                subject=message['title'],
+                body=message['body'],
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[message['email']],
+                connection=self.connection,
+            )
+            try:
+                email.send()
+                results.append({'ok': True, 'error': '', 'dead_tokens': []})
+            except Exception as e:
+                # The server may have dropped us; reconnect for the next message
+                self.close()
+                try:
+                    self.connection.open()
+                except Exception:
+                    pass
+                results.append({'ok': False, 'error': str(e), 'dead_tokens': []})
+        return results
+
+    def close(self):
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+
+
+class HTTPPushProvider:
+    """
+    Posts one request per batch to a push gateway (PUSH_GATEWAY_URL) over a
+    keep-alive requests.Session. The gateway receives
+    {"messages": [{"tokens", "title", "body", "data"}]} and answers with
+    {"results": [{"ok", "error", "invalid_tokens"}]} in the same order.
+    """
+    channel = 'push'
+
+    def __init__(self):
+        if not settings.PUSH_GATEWAY_URL:
+            raise ValueError("PUSH_GATEWAY_URL is not configured")
+        self.session = requests.Session()
+        if settings.PUSH_GATEWAY_API_KEY:
+            self.session.headers['Authorization'] = f'Bearer {settings.PUSH_GATEWAY_API_KEY}'
+
+    def send_batch(self, messages):
+        try:
+            response = self.session.post(
+                settings.PUSH_GATEWAY_URL,
+                json={'messages': [
+                    {
+                        'tokens': m['tokens'],
+                        'title': m['title'],
+                        'body': m['body'],
+                        'data': m['data'],
+                    }
+                    for m in messages
+                ]},
+                timeout=PUSH_TIMEOUT
+            )
+            response.raise_for_status()
+            answers = response.json()['results']
+            if len(answers) != len(messages):
+                raise ValueError(f"Gateway returned {len(answers)} results for {len(messages)} messages")
+        except Exception as e:
+            return [{'ok': False, 'error': str(e), 'dead_tokens': []} for _ in messages]
+
+        results = []
+        for answer in answers:
+            results.append({
+                'ok': bool(answer.get('ok')),
+                'error': answer.get('error') or '',
+                'dead_tokens': answer.get('invalid_tokens') or [],
+            })
+        return results
+
+    def close(self):
+        self.session.close()
+
+
+class StubProvider:
+    """
+    Local provider for offline benchmarking: sleeps `latency` seconds per
+    batch, fails `failure_rate` of messages and reports tokens starting
+    with 'dead' as invalid. Nothing leaves the machine.
+    """
+    def __init__(self, channel, latency=0.0, failure_rate=0.0):
+        self.channel = channel
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent = 0
+
+    def send_batch(self, messages):
+        if self.latency:
+            time.sleep(self.latency)
+        results = []
+        for message in messages:
+            dead = [t for t in message.get('tokens', []) if t.startswith('dead')]
+            if random.random() < self.failure_rate:
+                results.append({'ok': False, 'error': 'stub failure', 'dead_tokens': dead})
+            else:
+                self.sent += 1
+                results.append({'ok': True, 'error': '', 'dead_tokens': dead})
+        return results
+
+    def close(self):
+        pass
+
+
+def get_provider(channel, name=None, **stub_options):
+    """Provider for a channel, by name or from settings.NOTIFICATION_PROVIDERS."""
+    name = name or settings.NOTIFICATION_PROVIDERS.get(channel, 'stub')
+    if name == 'stub':
+        return StubProvider(channel, **stub_options)
+    if channel == 'email' and name == 'smtp':
+        return SMTPEmailProvider()
+    if channel == 'push' and name == 'http':
+        return HTTPPushProvider()
+    raise ValueError(f"Unknown {channel} provider '{name}'")
@@ -0,0 +1,144 @@
+"""
+Real-time delivery of new notifications and partner messages.
+
+Writers publish to a per-user Redis channel after their transaction
+commits (publish_notifications / publish_partner_message). Every ASGI
+worker that holds an open stream for that user is subscribed to the
+channel and forwards the event as server-sent events, so it does not
+matter which process handled the write.
+
+Browser EventSource cannot send an Authorization header, so clients first
+POST for a stream ticket: a random single-use key in the cache that maps to
+the user for STREAM_TICKET_SECONDS, passed as ?ticket= instead of putting
+the long-lived access token in the URL (and in proxy logs).
+"""
+import json
+import logging
+import secrets
+import time
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+
+logger = logging.getLogger(__name__)
+
+# Comment line sent when nothing happened, so proxies keep the connection open
+HEARTBEAT_SECONDS = 25
+
+# Client reconnect delay advertised to EventSource (milliseconds)
+RECONNECT_MS = 5000
+
+
+# How long a stream ticket can be redeemed
+STREAM_TICKET_SECONDS = 60
+
+
+def user_channel(user_id):
+    return f'rithmo:stream:user:{user_id}'
+
+
+def ticket_key(ticket):
+    return f'rithmo:stream:ticket:{ticket}'
+
+
+def issue_stream_ticket(user_id):
+    ticket = secrets.token_urlsafe(32)
+    cache.set(ticket_key(ticket), user_id, STREAM_TICKET_SECONDS)
+    return ticket
+
+
+async def redeem_stream_ticket(ticket):
+    """User id the ticket was issued to, or None when unknown or expired. Tickets work once."""
+    if not ticket:
+        return None
+    key = ticket_key(ticket)
+    user_id = await cache.aget(key)
+    # delete() is true only for the caller that removed the key, so of two
+    # concurrent redeems that both read it, exactly one succeeds
+    if user_id is None or not await cache.adelete(key):
+        return None
+    return user_id
+
+
+def _publish(events):
+    """events: list of (user_id, event name, payload dict); one pipeline round trip."""
+    if not events:
+        return
+    try:
+        from django_redis import get_redis_connection
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        for user_id, event, payload in events:
+            pipe.publish(
+                user_channel(user_id),
+                json.dumps({'event': event, 'data': payload}, cls=DjangoJSONEncoder)
+            )
+        pipe.execute()
+    except Exception as e:
+        # Streams are best effort; clients still see everything through the API
+        logger.warning(f"Realtime publish failed: {e}")
+
+
+def publish_notifications(notifications):
+    """Queue a 'notification' event per row, sent once the current transaction commits."""
+    from .serializers import NotificationSerializer
+    events = [
+        (n.user_id, 'notification', NotificationSerializer(n).data)
+        for n in notifications if n.pk
+    ]
+    if events:
+        transaction.on_commit(lambda: _publish(events))
+
+
+def publish_partner_message(message):
+    """Queue a 'message' event for the receiver, sent once the current transaction commits."""
+    from .serializers import PartnerMessageSerializer
+    events = [(message.receiver_id, 'message', PartnerMessageSerializer(message).data)]
+    transaction.on_commit(lambda: _publish(events))
+
+
+def format_event(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, cls=DjangoJSONEncoder)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+async def event_stream(user_id):
+    """
+    Async generator of SSE chunks for one user. Subscribes to the user's
+    channel on a dedicated async Redis connection and yields until the
+    client goes away.
+    """
+    client = aioredis.from_url(settings.REALTIME_REDIS_URL, password=settings.REALTIME_REDIS_PASSWORD)
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    await pubsub.subscribe(user_channel(user_id))
+
+    try:
+        yield f'retry: {RECONNECT_MS}\n' + format_event('ready', {'user_id': user_id})
+        last_sent = time.monotonic()
+        while True:
+            message = await pubsub.get_message(timeout=HEARTBEAT_SECONDS)
+            if message is None:
+                # Also returned early for ignored subscribe confirmations
+                if time.monotonic() - last_sent >= HEARTBEAT_SECONDS:
+                    yield ': keepalive\n\n'
+                    last_sent = time.monotonic()
+                continue
+            try:
+                body = json.loads(message['data'])
+            except (TypeError, ValueError):
+                continue
+            data = body.get('data') or {}
+            event_id = f"{body.get('event')}-{data['id']}" if 'id' in data else None
+            yield format_event(body.get('event', 'message'), data, event_id)
+            last_sent = time.monotonic()
+    finally:
+        # Client disconnected (the generator is closed or cancelled)
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+        await client.aclose()
@@ -0,0 +1,102 @@
+"""
+Retention for the Notification table.
+
+Read notifications past the archive age are copied to gzipped NDJSON files
+(cold storage) and then deleted from the hot table. Anything past the purge
+age is deleted, read or not. Both steps walk the table in id-ordered
+batches, so every statement and transaction stays small however large the
+backlog is.
+"""
+import gzip
+import json
+import os
+import zlib
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from .counters import reset_unread_counts
+from .models import Notification
+
+
+# Rows selected, written and deleted per step
+RETENTION_BATCH_SIZE = 5000
+
+ARCHIVE_AFTER_DAYS = 90
+PURGE_AFTER_DAYS = 365
+
+
+def archive_columns():
+    return [f.attname for f in Notification._meta.concrete_fields]
+
+
+def archive_path(archive_dir, now=None):
+    now = now or timezone.now()
+    return os.path.join(archive_dir, f"notifications-{now:%Y%m%d-%H%M%S}.ndjson.gz")
+
+
+def iter_batches(queryset, batch_size):
+    """Yield lists of rows (dicts) from `queryset` by ascending id, one batch per query."""
+    columns = archive_columns()
+    last_id = 0
+    while True:
+        rows = list(
+            queryset.filter(id__gt=last_id).order_by('id').values(*columns)[:batch_size]
+        )
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1]['id']
+
+
+def delete_batch(ids):
+    with transaction.atomic():
+        return Notification.objects.filter(id__in=ids).delete()[1].get('notifications.Notification', 0)
+
+
+def archive_read_notifications(cutoff, archive_dir, batch_size=RETENTION_BATCH_SIZE, dry_run=False):
+    """
+    Move read notifications created before `cutoff` into a new gzip file in
+    `archive_dir`. Each batch is flushed to disk before its rows are
+    deleted, so an interrupted run never loses data.
+    Returns (rows archived, file path or None).
+    """
+    queryset = Notification.objects.filter(is_read=True, created_at__lt=cutoff)
+    if dry_run:
+        return queryset.count(), None
+
+    os.makedirs(archive_dir, exist_ok=True)
+    path = archive_path(archive_dir)
+    archived = 0
+
+    with open(path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+            for rows in iter_batches(queryset, batch_size):
+                for row in rows:
+                    archive.write((json.dumps(row, cls=DjangoJSONEncoder) + '\n').encode('utf-8'))
+                archive.flush(zlib.Z_SYNC_FLUSH)
+                raw.flush()
+                os.fsync(raw.fileno())
+
+                delete_batch([row['id'] for row in rows])
+                archived += len(rows)
+
+    if not archived:
+        os.remove(path)
+        return 0, None
+    return archived, path
+
+
+def purge_notifications(cutoff, batch_size=RETENTION_BATCH_SIZE, dry_run=False):
+    """Delete every notification created before `cutoff`, read or not. Returns rows deleted."""
+    queryset = Notification.objects.filter(created_at__lt=cutoff)
+    if dry_run:
+        return queryset.count()
+
+    purged = 0
+    while True:
+        batch = list(queryset.order_by('id').values_list('id', 'user_id', 'is_read')[:batch_size])
+        if not batch:
+            return purged
+        purged += delete_batch([row[0] for row in batch])
+        # Unread rows were counted in the badge counters
+        reset_unread_counts('notifications', {row[1] for row in batch if not row[2]})
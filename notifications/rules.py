@@ -0,0 +1,310 @@
+"""
+Notification rules shared by the generate_notifications command and
+NotificationGeneratorView.
+
+load_contexts() prefetches what the rules need for many users in a few
+queries; build_candidates() turns one context into unsaved Notification
+objects without touching the database; next_event_date() runs the same
+rules forward to find the next day anything fires for a user.
+"""
+import hashlib
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from cycle_tracker.models import Period, WellnessLog
+from user_profile.models import UserProfile
+from .models import Notification, NotificationPreference
+
+
+# How far ahead next_event_date() looks; users are re-evaluated at least this often
+SCHEDULE_HORIZON_DAYS = 45
+
+# Notification type -> NotificationPreference flag that turns it off in-app
+INAPP_PREFERENCES = {
+    'period_reminder': 'inapp_period_reminder',
+    'period_approaching': 'inapp_period_reminder',
+    'pms_warning': 'inapp_period_reminder',
+    'ovulation': 'inapp_ovulation',
+    'fertile_window': 'inapp_ovulation',
+    'partner_message': 'inapp_partner_message',
+    'wellness_reminder': 'inapp_wellness_reminder',
+}
+
+
+def inapp_enabled(preferences, notif_type):
+    flag = INAPP_PREFERENCES.get(notif_type)
+    return flag is None or getattr(preferences, flag)
+
+
+def display_name(user):
+    return f"{user.first_name} {user.last_name}".strip() or user.username
+
+
+def latest_periods(user_ids):
+    """Latest period per user for all `user_ids` in one query (ROW_NUMBER window)."""
+    periods = Period.objects.filter(user_id__in=user_ids).annotate(
+        row=Window(
+            expression=RowNumber(),
+            partition_by=[F('user_id')],
+            order_by=[F('start_date').desc(), F('id').desc()],
+        )
+    ).filter(row=1)
+    return {period.user_id: period for period in periods}
+
+
+def load_contexts(user_ids, today):
+    """
+    Prefetch everything the rules need for a chunk of users in a handful of
+    queries: users, preferences, profiles + first partner, latest periods
+    of users and partners, and who already logged wellness today.
+    Returns {user_id: context dict}.
+    """
+    users = User.objects.in_bulk(user_ids)
+
+    preferences = {
+        pref.user_id: pref
+        for pref in NotificationPreference.objects.filter(user_id__in=user_ids)
+    }
+    missing = [uid for uid in user_ids if uid not in preferences]
+    if missing:
+        created = [NotificationPreference(user_id=uid) for uid in missing]
+        # bulk_create() skips save(), so schedule them here rather than leave it to the backfill
+        for pref in created:
+            pref.next_fire_at = pref.compute_next_fire_at()
+        NotificationPreference.objects.bulk_create(created, ignore_conflicts=True)
+        for pref in NotificationPreference.objects.filter(user_id__in=missing):
+            preferences[pref.user_id] = pref
+
+    profiles = {
+        profile.user_id: profile
+        for profile in UserProfile.objects.filter(user_id__in=user_ids)
+    }
+
+    # First partner (lowest profile id, like partners.first()) of each profile
+    Partners = UserProfile.partners.through
+    partner_profile_ids = {}
+    for from_id, to_id in (
+        Partners.objects.filter(from_userprofile_id__in=[p.id for p in profiles.values()])
+        .order_by('from_userprofile_id', 'to_userprofile_id')
+        .values_list('from_userprofile_id', 'to_userprofile_id')
+    ):
+        partner_profile_ids.setdefault(from_id, to_id)
+
+    partner_users = {
+        profile.id: profile.user
+        for profile in UserProfile.objects.filter(
+            id__in=set(partner_profile_ids.values())
+        ).select_related('user')
+    }
+
+    partner_user_ids = [u.id for u in partner_users.values()]
+    periods = latest_periods(list(user_ids) + partner_user_ids)
+
+    logged_today = set(
+        WellnessLog.objects.filter(user_id__in=user_ids, date=today)
+        .values_list('user_id', flat=True)
+    )
+
+    contexts = {}
+    for user_id in user_ids:
+        user = users.get(user_id)
+        if user is None:
+            continue
+        profile = profiles.get(user_id)
+        partner = None
+        if profile and profile.id in partner_profile_ids:
+            partner = partner_users.get(partner_profile_ids[profile.id])
+
+        contexts[user_id] = {
+            'user': user,
+            'preferences': preferences[user_id],
+            'gender': (profile.sex if profile else None) or 'none',
+            'latest_period': periods.get(user_id),
+            'partner': partner,
+            'partner_latest_period': periods.get(partner.id) if partner else None,
+            'logged_today': user_id in logged_today,
+        }
+    return contexts
+
+
+def candidate(user_id, notif_type, title, message, related_id=None, related_type=None, day=None):
+    return Notification(
+        user_id=user_id,
+        notification_type=notif_type,
+        title=title,
+        message=message,
+        related_id=related_id,
+        related_type=related_type,
+        dedup_key=Notification.make_dedup_key(user_id, notif_type, related_type, related_id, day)
+    )
+
+
+def wellness_reminder(user_id, today, preferences=None):
+    """The daily wellness reminder, or None if the user's preferences turn it off."""
+    if preferences is not None and not inapp_enabled(preferences, 'wellness_reminder'):
+        return None
+    return candidate(
+        user_id, 'wellness_reminder',
+        'Log Your Wellness',
+        'Take a moment to log your wellness metrics for today.',
+        day=today
+    )
+
+
+def build_digest(user_id, candidates, today):
+    """
+    Coalesce one user's candidates for the day into a single digest
+    notification. The digest is keyed on its parts, so a later run that
+    finds new candidates sends a second digest with just those.
+    """
+    digest_keys = sorted(n.dedup_key for n in candidates)
+    digest = candidate(
+        user_id, 'digest',
+        'Your Daily Summary',
+        '\n'.join(f'• {n.title}: {n.message}' for n in candidates),
+        related_type='digest',
+        day=today
+    )
+    parts = hashlib.sha1('|'.join(digest_keys).encode('utf-8')).hexdigest()[:12]
+    digest.dedup_key = Notification.make_dedup_key(user_id, 'digest', 'digest', parts, today)
+    digest.digest_keys = digest_keys
+    # Kept on the instance so outbox.enqueue can apply the per-type channel preferences
+    digest.digest_of = candidates
+    return digest
+
+
+def apply_delivery_mode(context, candidates, today):
+    """
+    Digest users get one notification instead of several; everyone else is
+    unchanged. Pass only candidates that have not been stored yet.
+    """
+    if context['preferences'].delivery_mode == 'digest' and len(candidates) > 1:
+        return [build_digest(context['user'].id, candidates, today)]
+    return candidates
+
+
+def build_candidates(context, today):
+    """Work out which notifications a user should get today, without touching the DB."""
+    user = context['user']
+    preferences = context['preferences']
+    candidates = []
+
+    # For female users
+    if context['gender'] == 'female' and context['latest_period']:
+        latest_period = context['latest_period']
+        next_period_date = latest_period.next_period_start_date or latest_period.calculate_next_period()
+
+        if next_period_date:
+            days_until_period = (next_period_date - today).days
+
+            # Period reminder notification (if within reminder window)
+            if 0 < days_until_period <= preferences.reminder_days_before:
+                candidates.append(candidate(
+                    user.id, 'period_reminder',
+                    'Period Coming Soon',
+                    f'Your period is expected in {days_until_period} days on {next_period_date.strftime("%B %d")}.',
+                    related_id=latest_period.id,
+                    related_type='period',
+                    day=today
+                ))
+
+            # Period approaching (1 day before)
+            if days_until_period == 1:
+                candidates.append(candidate(
+                    user.id, 'period_approaching',
+                    'Period Tomorrow',
+                    'Your period is expected to start tomorrow. Be prepared!',
+                    related_id=latest_period.id,
+                    related_type='period',
+                    day=today
+                ))
+
+            # PMS warning (3-4 days before)
+            if 3 <= days_until_period <= 4:
+                candidates.append(candidate(
+                    user.id, 'pms_warning',
+                    'PMS Phase',
+                    'You may experience PMS symptoms. Practice self-care and stress management.',
+                    related_id=latest_period.id,
+                    related_type='period',
+                    day=today
+                ))
+
+            cycle_day = (today - latest_period.start_date).days
+
+            # Ovulation window (day 12-16 of cycle)
+            if 12 <= cycle_day <= 16:
+                candidates.append(candidate(
+                    user.id, 'ovulation',
+                    'Ovulation Window',
+                    f'You are in your ovulation window (Day {cycle_day} of your cycle).',
+                    related_id=latest_period.id,
+                    related_type='period',
+                    day=today
+                ))
+
+            # Fertile window (day 10-17 of cycle)
+            if 10 <= cycle_day <= 17:
+                candidates.append(candidate(
+                    user.id, 'fertile_window',
+                    'Fertile Window',
+                    'You are in your fertile window. Track your symptoms.',
+                    related_id=latest_period.id,
+                    related_type='period',
+                    day=today
+                ))
+
+    # For male users with partners
+    elif context['gender'] == 'male' and context['partner_latest_period']:
+        partner_user = context['partner']
+        latest_partner_period = context['partner_latest_period']
+        next_period_date = latest_partner_period.next_period_start_date or latest_partner_period.calculate_next_period()
+
+        if next_period_date:
+            partner_name = display_name(partner_user)
+            days_until_partner_period = (next_period_date - today).days
+
+            # Partner period notification (1-2 days before)
+            if 1 <= days_until_partner_period <= 2:
+                candidates.append(candidate(
+                    user.id, 'partner_message',
+                    "Partner's Period Coming",
+                    f"{partner_name}'s period starts in {days_until_partner_period} day(s). Be supportive!",
+                    related_id=partner_user.id,
+                    related_type='partner',
+                    day=today
+                ))
+
+            # Partner PMS notification (3-4 days before)
+            if 3 <= days_until_partner_period <= 4:
+                candidates.append(candidate(
+                    user.id, 'partner_message',
+                    "Partner's PMS Phase",
+                    f"{partner_name} may be experiencing PMS symptoms. Extra care and understanding appreciated!",
+                    related_id=partner_user.id,
+                    related_type='partner',
+                    day=today
+                ))
+
+    # Wellness reminder (all users) - only if they haven't logged today
+    if not context['logged_today']:
+        candidates.append(wellness_reminder(user.id, today))
+
+    # Types the user switched off in-app are never generated
+    return [n for n in candidates if inapp_enabled(preferences, n.notification_type)]
+
+
+def next_event_date(context, start):
+    """
+    First day on or after `start` on which the cycle/partner rules produce a
+    notification. The daily wellness reminder is left out; it is handled for
+    everyone in one pass. Returns start + SCHEDULE_HORIZON_DAYS when nothing
+    fires before then, so the user is looked at again at the horizon.
+    """
+    probe = dict(context, logged_today=True)
+    for offset in range(SCHEDULE_HORIZON_DAYS):
+        day = start + timedelta(days=offset)
+        if build_candidates(probe, day):
+            return day
+    return start + timedelta(days=SCHEDULE_HORIZON_DAYS)
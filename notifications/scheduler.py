@@ -0,0 +1,230 @@
+"""
+Time-based delivery for reminders that fire at a wall-clock time:
+
+- NotificationPreference.reminder_time: the daily rules run for that user
+- MedicationReminder.reminder_time / days_of_week
+- cycle_tracker Reminder.reminder_time (one-shot)
+
+Each source keeps its next firing time in an indexed column, so finding
+what is due is an index range scan and the cost of a wake-up grows with
+the number of due items, not with the number of users. run_scheduler
+keeps a heap of the earliest time per source and sleeps until the top.
+"""
+from collections import defaultdict
+from django.db import transaction
+from cycle_tracker.models import Reminder
+from medications.models import MedicationReminder
+from .engine import generate_for_users, save_notifications
+from .models import NotificationPreference
+from .rules import candidate
+from .timing import DEFAULT_TIMEZONE, get_zone
+
+
+# Rows claimed per transaction
+SCHEDULER_BATCH_SIZE = 500
+
+# Upper bound on one sleep, so rows added by other processes are noticed
+MAX_SLEEP_SECONDS = 60
+
+# cycle_tracker Reminder.reminder_type -> Notification.notification_type
+REMINDER_NOTIFICATION_TYPES = {
+    'PERIOD_START': 'period_reminder',
+    'OVULATION': 'ovulation',
+    'MEDICATION': 'medication_reminder',
+    'CUSTOM': 'reminder',
+}
+
+
+def user_timezones(user_ids):
+    return dict(
+        NotificationPreference.objects.filter(user_id__in=user_ids)
+        .values_list('user_id', 'timezone')
+    )
+
+
+# --- NotificationPreference.reminder_time -------------------------------------
+
+def peek_preferences():
+    return (
+        NotificationPreference.objects.filter(next_fire_at__isnull=False)
+        .order_by('next_fire_at')
+        .values_list('next_fire_at', flat=True)
+        .first()
+    )
+
+
+def deliver_preferences(now, batch_size=SCHEDULER_BATCH_SIZE):
+    """
+    Run the notification rules for users whose reminder_time has come,
+    using their local date as "today". Returns (rows handled, notifications).
+    """
+    with transaction.atomic():
+        prefs = list(
+            NotificationPreference.objects.select_for_update(skip_locked=True)
+            .filter(next_fire_at__lte=now)
+            .order_by('next_fire_at')[:batch_size]
+        )
+        users_by_day = defaultdict(list)
+        for pref in prefs:
+            local_day = pref.next_fire_at.astimezone(get_zone(pref.timezone)).date()
+            users_by_day[local_day].append(pref.user_id)
+            pref.next_fire_at = pref.compute_next_fire_at(now)
+
+        created = []
+        for day, user_ids in users_by_day.items():
+            created.extend(generate_for_users(user_ids, today=day))
+
+        NotificationPreference.objects.bulk_update(prefs, ['next_fire_at'])
+    return len(prefs), len(created)
+
+
+# --- MedicationReminder ------------------------------------------------------
+
+def peek_medication_reminders():
+    return (
+        MedicationReminder.objects.filter(is_active=True, next_fire_at__isnull=False)
+        .order_by('next_fire_at')
+        .values_list('next_fire_at', flat=True)
+        .first()
+    )
+
+
+def deliver_medication_reminders(now, batch_size=SCHEDULER_BATCH_SIZE):
+    with transaction.atomic():
+        reminders = list(
+            MedicationReminder.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('user_medication__medication')
+            .filter(is_active=True, next_fire_at__lte=now)
+            .order_by('next_fire_at')[:batch_size]
+        )
+        timezones = user_timezones({r.user_id for r in reminders})
+
+        candidates = []
+        for reminder in reminders:
+            tz_name = timezones.get(reminder.user_id, DEFAULT_TIMEZONE)
+            user_medication = reminder.user_medication
+            local_day = reminder.next_fire_at.astimezone(get_zone(tz_name)).date()
+            reminder.next_fire_at = reminder.compute_next_fire_at(now, tz_name)
+            # Medication deactivated or ended by a bulk update since this was scheduled;
+            # compute_next_fire_at() has already cleared it
+            if not user_medication.is_active or (user_medication.end_date and user_medication.end_date < local_day):
+                continue
+            candidates.append(candidate(
+                reminder.user_id, 'medication_reminder',
+                'Medication Reminder',
+                f'Time to take {user_medication.medication_name} ({user_medication.dosage}).',
+                related_id=reminder.id,
+                related_type='medication_reminder',
+                day=local_day
+            ))
+
+        created = save_notifications(candidates)
+        MedicationReminder.objects.bulk_update(reminders, ['next_fire_at'])
+    return len(reminders), len(created)
+
+
+# --- cycle_tracker Reminder --------------------------------------------------
+
+def peek_reminders():
+    return (
+        Reminder.objects.filter(notified=False, is_completed=False)
+        .order_by('reminder_time')
+        .values_list('reminder_time', flat=True)
+        .first()
+    )
+
+
+def deliver_reminders(now, batch_size=SCHEDULER_BATCH_SIZE):
+    with transaction.atomic():
+        reminders = list(
+            Reminder.objects.select_for_update(skip_locked=True)
+            .filter(notified=False, is_completed=False, reminder_time__lte=now)
+            .order_by('reminder_time')[:batch_size]
+        )
+        timezones = user_timezones({r.user_id for r in reminders})
+        candidates = [
+            candidate(
+                reminder.user_id,
+                REMINDER_NOTIFICATION_TYPES.get(reminder.reminder_type, 'reminder'),
+                reminder.get_reminder_type_display(),
+                f'Reminder: {reminder.get_reminder_type_display()}',
+                related_id=reminder.id,
+                related_type='reminder',
+                # The user's local day, like the other sources
+                day=reminder.reminder_time.astimezone(
+                    get_zone(timezones.get(reminder.user_id, DEFAULT_TIMEZONE))
+                ).date()
+            )
+            for reminder in reminders
+        ]
+        created = save_notifications(candidates)
+        Reminder.objects.filter(id__in=[r.id for r in reminders]).update(notified=True)
+    return len(reminders), len(created)
+
+
+# source name -> (earliest pending fire time, deliver one batch)
+SCHEDULE_SOURCES = {
+    'preferences': (peek_preferences, deliver_preferences),
+    'medication_reminders': (peek_medication_reminders, deliver_medication_reminders),
+    'reminders': (peek_reminders, deliver_reminders),
+}
+
+
+def backfill_fire_times(now, batch_size=SCHEDULER_BATCH_SIZE, unschedulable=None):
+    """
+    Rows written with bulk_create()/update() skip save() and have no
+    next_fire_at yet (preference timezone changes also clear it on
+    medication reminders). Fill those in, in id-ordered batches until none
+    are left. Returns the number of rows fixed.
+
+    Medication reminders that will not fire again (say the medication ends
+    before the next allowed weekday) stay NULL until they or their medication
+    are saved. Their ids are added to `unschedulable`; pass the same set on
+    the next call so they are not selected again on every wake-up.
+    """
+    if unschedulable is None:
+        unschedulable = set()
+    fixed = 0
+
+    last_id = 0
+    while True:
+        prefs = list(
+            NotificationPreference.objects.filter(next_fire_at__isnull=True, id__gt=last_id)
+            .order_by('id')[:batch_size]
+        )
+        if not prefs:
+            break
+        for pref in prefs:
+            pref.next_fire_at = pref.compute_next_fire_at(now)
+        NotificationPreference.objects.bulk_update(prefs, ['next_fire_at'])
+        fixed += len(prefs)
+        last_id = prefs[-1].id
+
+    # Reminders of inactive or ended medications stay NULL until the medication changes
+    pending = (
+        MedicationReminder.objects.filter(
+            is_active=True, next_fire_at__isnull=True, user_medication__is_active=True
+        )
+        .exclude(user_medication__end_date__lt=now.date())
+        .exclude(id__in=unschedulable)
+        .select_related('user_medication')
+        .order_by('id')
+    )
+    last_id = 0
+    while True:
+        reminders = list(pending.filter(id__gt=last_id)[:batch_size])
+        if not reminders:
+            break
+        timezones = user_timezones({r.user_id for r in reminders})
+        for reminder in reminders:
+            reminder.next_fire_at = reminder.compute_next_fire_at(
+                now, timezones.get(reminder.user_id, DEFAULT_TIMEZONE)
+            )
+            if reminder.next_fire_at is None:
+                unschedulable.add(reminder.id)
+        scheduled = [r for r in reminders if r.next_fire_at is not None]
+        MedicationReminder.objects.bulk_update(scheduled, ['next_fire_at'])
+        fixed += len(scheduled)
+        last_id = reminders[-1].id
+
+    return fixed
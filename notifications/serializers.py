@@ -1,3 +1,4 @@
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from rest_framework import serializers
 from .models import Notification, PartnerMessage, PushNotificationToken, NotificationPreference
 from django.contrib.auth.models import User
@@ -79,4 +80,13 @@ class NotificationPreferenceSerializer(serializers.ModelSerializer):
             'inapp_wellness_reminder',
             'reminder_days_before',
             'reminder_time',
+            'timezone',
+            'delivery_mode',
         ]
+
+    def validate_timezone(self, value):
+        try:
+            ZoneInfo(value)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise serializers.ValidationError(f"Unknown timezone '{value}'")
+        return value
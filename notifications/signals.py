@@ -0,0 +1,45 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from cycle_tracker.models import Period
+from medications.models import MedicationReminder
+from user_profile.models import UserProfile
+from .models import NotificationPreference, NotificationSchedule
+
+
+def invalidate_schedule(user_id):
+    """Make a user, and everyone who has them as partner, due for evaluation again."""
+    partner_of = UserProfile.objects.filter(partners__user_id=user_id).values('user_id')
+    NotificationSchedule.objects.filter(user_id=user_id).delete()
+    NotificationSchedule.objects.filter(user_id__in=partner_of).delete()
+
+
+@receiver(post_save, sender=Period)
+@receiver(post_delete, sender=Period)
+def period_changed(sender, instance, **kwargs):
+    invalidate_schedule(instance.user_id)
+
+
+@receiver(post_save, sender=UserProfile)
+def profile_changed(sender, instance, **kwargs):
+    # Also covers Period.recalculate_chain, which ends by saving the profile
+    invalidate_schedule(instance.user_id)
+
+
+@receiver(m2m_changed, sender=UserProfile.partners.through)
+def partners_changed(sender, instance, action, pk_set=None, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    # Both ends of the link, whichever side the change was made from
+    user_ids = [instance.user_id]
+    if pk_set:
+        user_ids += UserProfile.objects.filter(id__in=pk_set).values_list('user_id', flat=True)
+    NotificationSchedule.objects.filter(user_id__in=user_ids).delete()
+
+
+@receiver(post_save, sender=NotificationPreference)
+def preferences_changed(sender, instance, created, **kwargs):
+    if not created:
+        NotificationSchedule.objects.filter(user_id=instance.user_id).delete()
+        if getattr(instance, 'timezone_changed', True):
+            # run_scheduler recomputes cleared fire times in the new timezone
+            MedicationReminder.objects.filter(user_id=instance.user_id, is_active=True).update(next_fire_at=None)
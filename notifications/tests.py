@@ -0,0 +1,662 @@
+import asyncio
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import zlib
+from datetime import date, datetime, timedelta
+from unittest import mock
+from zoneinfo import ZoneInfo
+from asgiref.sync import async_to_sync
+from io import StringIO
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import AsyncClient, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from cycle_tracker.models import Period, Reminder, WellnessLog
+from user_profile.models import UserProfile
+from medications.models import Medication, MedicationReminder, MedicationType, UserMedication
+from .counters import adjust_unread_count, counter_key, get_unread_count
+from .engine import (
+    due_users, generate_for_users, generate_wellness_reminders, latest_local_date, parse_shard,
+    save_notifications, user_id_chunks
+)
+from .models import (
+    Notification, NotificationOutbox, NotificationPreference, NotificationSchedule, PartnerMessage
+)
+from .outbox import CLAIM_LEASE_SECONDS, RETRY_BASE_SECONDS, deliver_batch
+from .realtime import redeem_stream_ticket
+from .retention import archive_read_notifications, delete_batch, purge_notifications
+from .rules import build_candidates, candidate, load_contexts, wellness_reminder
+from .scheduler import backfill_fire_times, deliver_reminders
+
+
+class InAppPreferenceTests(TestCase):
+    """Each inapp_* flag suppresses the notification types it covers."""
+
+    today = date(2026, 3, 10)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='prefs', password='secret', email='prefs@example.com')
+        self.partner = User.objects.create_user(username='partner', password='secret', email='partner@example.com')
+
+    def context(self, gender, days_until_period, **flags):
+        period = Period(
+            user=self.partner if gender == 'male' else self.user,
+            start_date=self.today - timedelta(days=14),
+            next_period_start_date=self.today + timedelta(days=days_until_period),
+        )
+        return {
+            'user': self.user,
+            'preferences': NotificationPreference(user=self.user, **flags),
+            'gender': gender,
+            'latest_period': period if gender == 'female' else None,
+            'partner': self.partner if gender == 'male' else None,
+            'partner_latest_period': period if gender == 'male' else None,
+            'logged_today': False,
+        }
+
+    def types(self, context):
+        return {n.notification_type for n in build_candidates(context, self.today)}
+
+    def test_all_enabled(self):
+        self.assertEqual(
+            self.types(self.context('female', 1)),
+            {'period_reminder', 'period_approaching', 'ovulation', 'fertile_window', 'wellness_reminder'},
+        )
+        self.assertIn('pms_warning', self.types(self.context('female', 3)))
+        self.assertEqual(self.types(self.context('male', 1)), {'partner_message', 'wellness_reminder'})
+
+    def test_period_reminder_flag(self):
+        for days in (1, 3):
+            types = self.types(self.context('female', days, inapp_period_reminder=False))
+            self.assertFalse(types & {'period_reminder', 'period_approaching', 'pms_warning'})
+        self.assertIn('ovulation', types)
+
+    def test_ovulation_flag(self):
+        types = self.types(self.context('female', 1, inapp_ovulation=False))
+        self.assertFalse(types & {'ovulation', 'fertile_window'})
+        self.assertIn('period_approaching', types)
+
+    def test_partner_message_flag(self):
+        self.assertEqual(
+            self.types(self.context('male', 1, inapp_partner_message=False)), {'wellness_reminder'}
+        )
+
+    def test_wellness_reminder_flag(self):
+        types = self.types(self.context('female', 1, inapp_wellness_reminder=False))
+        self.assertNotIn('wellness_reminder', types)
+        self.assertIn('period_approaching', types)
+
+    def test_wellness_reminder_batch_respects_flag(self):
+        NotificationPreference.objects.update_or_create(user=self.user, defaults={'inapp_wellness_reminder': False})
+        created = generate_wellness_reminders([self.user.id, self.partner.id], today=self.today)
+        self.assertEqual([n.user_id for n in created], [self.partner.id])
+        self.assertFalse(Notification.objects.filter(user=self.user).exists())
+
+
+class RecordingProvider:
+    """Email provider that checks the rows are leased while it runs, then answers `result` or raises it."""
+    channel = 'email'
+
+    def __init__(self, test, result):
+        self.test = test
+        self.result = result
+
+    def send_batch(self, messages):
+        for row in NotificationOutbox.objects.all():
+            self.test.assertGreater(row.next_attempt_at, timezone.now())
+        if isinstance(self.result, Exception):
+            raise self.result
+        return [dict(self.result) for _ in messages]
+
+
+class OutboxDeliveryTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user(username='outbox', password='secret', email='outbox@example.com')
+        notification = Notification.objects.create(
+            user=user, notification_type='period_reminder', title='Soon', message='Period soon'
+        )
+        self.row = NotificationOutbox.objects.create(
+            notification=notification, channel='email', next_attempt_at=timezone.now() - timedelta(seconds=1)
+        )
+
+    def deliver(self, result, max_attempts=5):
+        stats = deliver_batch(RecordingProvider(self, result), max_attempts=max_attempts)
+        self.row.refresh_from_db()
+        return stats
+
+    def test_sent(self):
+        stats = self.deliver({'ok': True, 'error': '', 'dead_tokens': []})
+        self.assertEqual(stats['sent'], 1)
+        self.assertEqual((self.row.status, self.row.attempts), ('sent', 1))
+        self.assertIsNotNone(self.row.sent_at)
+
+    def test_message_failure_backs_off(self):
+        before = timezone.now()
+        stats = self.deliver({'ok': False, 'error': 'mailbox full', 'dead_tokens': []})
+        self.assertEqual(stats['retried'], 1)
+        self.assertEqual((self.row.status, self.row.attempts, self.row.last_error), ('pending', 1, 'mailbox full'))
+        self.assertGreaterEqual(self.row.next_attempt_at, before + timedelta(seconds=RETRY_BASE_SECONDS * 0.8))
+        self.assertLess(self.row.next_attempt_at, before + timedelta(seconds=CLAIM_LEASE_SECONDS))
+
+    def test_batch_exception_counts_as_failed_attempt(self):
+        stats = self.deliver(ConnectionRefusedError('SMTP server unreachable'))
+        self.assertEqual(stats['retried'], 1)
+        self.assertEqual(self.row.attempts, 1)
+        self.assertIn('SMTP server unreachable', self.row.last_error)
+        self.assertGreater(self.row.next_attempt_at, timezone.now())
+        # Not ready again, so the worker does not spin on it
+        self.assertEqual(self.deliver(ConnectionRefusedError('again'))['claimed'], 0)
+
+    def test_gives_up_after_max_attempts(self):
+        NotificationOutbox.objects.filter(id=self.row.id).update(attempts=2)
+        stats = self.deliver(ConnectionRefusedError('down'), max_attempts=3)
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual((self.row.status, self.row.attempts), ('failed', 3))
+
+
+class ReminderLocalDayTests(TestCase):
+    """One-shot reminders are deduplicated by the user's local day, not the UTC date."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='tokyo', password='secret', email='tokyo@example.com')
+        NotificationPreference.objects.update_or_create(user=self.user, defaults={'timezone': 'Asia/Tokyo'})
+
+    def test_dedup_key_uses_local_date(self):
+        # 08:30 on March 11th in Tokyo is still March 10th in UTC
+        fire_at = datetime(2026, 3, 11, 8, 30, tzinfo=ZoneInfo('Asia/Tokyo'))
+        reminder = Reminder.objects.create(user=self.user, reminder_type='CUSTOM', reminder_time=fire_at)
+        handled, created = deliver_reminders(fire_at + timedelta(minutes=1))
+        self.assertEqual((handled, created), (1, 1))
+        notification = Notification.objects.get(user=self.user)
+        self.assertEqual(
+            notification.dedup_key,
+            Notification.make_dedup_key(self.user.id, 'reminder', 'reminder', reminder.id, date(2026, 3, 11)),
+        )
+
+
+class GenerateLocalDayTests(TestCase):
+    """Without an explicit day, generation uses each user's local date like the scheduler."""
+
+    # 20:00 UTC on March 10th is already March 11th in Auckland (UTC+13)
+    now = datetime(2026, 3, 10, 20, tzinfo=ZoneInfo('UTC'))
+
+    def setUp(self):
+        self.auckland = User.objects.create_user(username='auckland', password='secret', email='akl@example.com')
+        self.london = User.objects.create_user(username='london', password='secret', email='lon@example.com')
+        NotificationPreference.objects.update_or_create(user=self.auckland, defaults={'timezone': 'Pacific/Auckland'})
+        NotificationPreference.objects.update_or_create(user=self.london, defaults={'timezone': 'Europe/London'})
+        patcher = mock.patch('django.utils.timezone.now', return_value=self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def wellness_keys(self):
+        return dict(
+            Notification.objects.filter(notification_type='wellness_reminder').values_list('user_id', 'dedup_key')
+        )
+
+    def test_wellness_reminders_use_local_date(self):
+        self.assertEqual(len(generate_wellness_reminders([self.auckland.id, self.london.id])), 2)
+        self.assertEqual(self.wellness_keys(), {
+            self.auckland.id: wellness_reminder(self.auckland.id, date(2026, 3, 11)).dedup_key,
+            self.london.id: wellness_reminder(self.london.id, date(2026, 3, 10)).dedup_key,
+        })
+        # The scheduler's run for the same local day finds nothing new
+        self.assertEqual(generate_for_users([self.auckland.id], today=date(2026, 3, 11)), [])
+
+    def test_cron_uses_local_date(self):
+        call_command('generate_notifications', stdout=StringIO())
+        self.assertEqual(
+            self.wellness_keys()[self.auckland.id],
+            wellness_reminder(self.auckland.id, date(2026, 3, 11)).dedup_key
+        )
+        call_command('generate_notifications', scheduled=True, stdout=StringIO())
+        self.assertEqual(Notification.objects.filter(notification_type='wellness_reminder').count(), 2)
+
+    def test_due_users_default_to_latest_date(self):
+        self.assertEqual(latest_local_date(), date(2026, 3, 11))
+        NotificationSchedule.objects.create(user=self.london, next_event_date=date(2026, 3, 11))
+        NotificationSchedule.objects.create(user=self.auckland, next_event_date=date(2026, 3, 12))
+        self.assertEqual(list(due_users(User.objects.all())), [self.london])
+
+
+class PreferenceRescheduleTests(TestCase):
+    """Saving preferences only moves next_fire_at when the reminder time or timezone changes."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='saver', password='secret', email='saver@example.com')
+        self.pref, _ = NotificationPreference.objects.get_or_create(user=self.user)
+        # A run that is due but not yet delivered
+        self.due = timezone.now() - timedelta(minutes=5)
+        NotificationPreference.objects.filter(id=self.pref.id).update(next_fire_at=self.due)
+        self.pref.refresh_from_db()
+
+    def reload(self):
+        return NotificationPreference.objects.get(id=self.pref.id)
+
+    def test_unrelated_save_keeps_fire_time(self):
+        pref = self.reload()
+        pref.email_ovulation = False
+        pref.save()
+        self.assertEqual(self.reload().next_fire_at, self.due)
+        pref.push_ovulation = False
+        pref.save(update_fields=['push_ovulation'])
+        self.assertEqual(self.reload().next_fire_at, self.due)
+
+    def test_timing_change_reschedules(self):
+        pref = self.reload()
+        pref.timezone = 'Asia/Tokyo'
+        pref.save(update_fields=['timezone'])
+        saved = self.reload()
+        self.assertGreater(saved.next_fire_at, timezone.now())
+        self.assertEqual(saved.next_fire_at, saved.compute_next_fire_at())
+
+    def test_update_fields_without_timing_fields(self):
+        pref = self.reload()
+        pref.reminder_time = '21:00'
+        pref.save(update_fields=['email_ovulation'])
+        self.assertEqual(self.reload().next_fire_at, self.due)
+
+
+class BackfillFireTimesTests(TestCase):
+    """backfill_fire_times() fills in every NULL fire time, not just one batch."""
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'backfill{i}', password='secret', email=f'backfill{i}@example.com')
+            for i in range(5)
+        ]
+        for user in self.users:
+            NotificationPreference.objects.get_or_create(user=user)
+        NotificationPreference.objects.update(next_fire_at=None)
+
+    def add_reminder(self, days_of_week):
+        user_medication = UserMedication.objects.create(
+            user=self.users[0], dosage='10 mg', start_date=date.today() - timedelta(days=1),
+            medication=Medication.objects.create(
+                name='Drug', medication_type=MedicationType.objects.get_or_create(name='Type')[0]
+            ),
+        )
+        reminder = MedicationReminder.objects.create(
+            user=self.users[0], user_medication=user_medication, reminder_time='08:00', days_of_week=days_of_week
+        )
+        MedicationReminder.objects.filter(id=reminder.id).update(next_fire_at=None)
+        return reminder
+
+    def test_fills_all_batches(self):
+        self.add_reminder([0, 3])
+        self.assertEqual(backfill_fire_times(timezone.now(), batch_size=2), 6)
+        self.assertFalse(NotificationPreference.objects.filter(next_fire_at__isnull=True).exists())
+        self.assertFalse(MedicationReminder.objects.filter(next_fire_at__isnull=True).exists())
+
+    def test_unschedulable_reminders_are_not_reselected(self):
+        # No valid weekday, so there is no next fire time
+        reminder = self.add_reminder([9])
+        unschedulable = set()
+        self.assertEqual(backfill_fire_times(timezone.now(), 2, unschedulable), 5)
+        self.assertEqual(unschedulable, {reminder.id})
+        with self.assertNumQueries(2):
+            self.assertEqual(backfill_fire_times(timezone.now(), 2, unschedulable), 0)
+
+    def test_preferences_created_for_rules_are_scheduled(self):
+        user = User.objects.create_user(username='fresh', password='secret', email='fresh@example.com')
+        NotificationPreference.objects.filter(user=user).delete()
+        contexts = load_contexts([user.id], date.today())
+        self.assertIsNotNone(contexts[user.id]['preferences'].next_fire_at)
+
+
+class StreamTicketTests(TestCase):
+    """The notification stream is opened with a single-use ticket, not the access token."""
+
+    url = '/api/notifications/stream/'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='streamer', password='secret', email='streamer@example.com')
+        api = APIClient()
+        api.force_authenticate(self.user)
+        response = api.post('/api/notifications/notifications/stream_ticket/')
+        self.assertEqual(response.status_code, 201)
+        self.ticket = response.json()['ticket']
+
+    async def test_ticket_is_single_use(self):
+        self.assertEqual(await redeem_stream_ticket(self.ticket), self.user.id)
+        response = await AsyncClient().get(self.url, {'ticket': self.ticket})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_concurrent_redeems_succeed_once(self):
+        # Both callers read the ticket before either deletes it
+        with mock.patch.object(cache, 'aget', mock.AsyncMock(return_value=self.user.id)):
+            results = await asyncio.gather(*(redeem_stream_ticket(self.ticket) for _ in range(3)))
+        self.assertCountEqual(results, [None, None, self.user.id])
+        self.assertIsNone(await redeem_stream_ticket(self.ticket))
+
+    async def test_access_token_in_url_is_not_accepted(self):
+        response = await AsyncClient().get(self.url, {'token': str(AccessToken.for_user(self.user))})
+        self.assertEqual(response.status_code, 401)
+
+    def test_not_served_under_wsgi(self):
+        response = self.client.get(self.url, {'ticket': self.ticket})
+        self.assertEqual(response.status_code, 501)
+        # The ticket was not spent
+        self.assertEqual(async_to_sync(redeem_stream_ticket)(self.ticket), self.user.id)
+
+
+class DigestTests(TestCase):
+    """A digest only covers notifications the user has not already received today."""
+
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.user = User.objects.create_user(username='digest', password='secret', email='digest@example.com')
+        UserProfile.objects.update_or_create(user=self.user, defaults={'sex': 'female'})
+        NotificationPreference.objects.update_or_create(user=self.user, defaults={'delivery_mode': 'digest'})
+        self.user.refresh_from_db()
+        self.period = Period.objects.create(user=self.user, start_date=self.today - timedelta(days=14))
+        Period.objects.filter(id=self.period.id).update(next_period_start_date=self.today + timedelta(days=1))
+
+    def test_digest_skips_already_sent(self):
+        # Sent on its own earlier today, before the user switched to digests
+        Notification.objects.create(
+            user=self.user, notification_type='period_reminder', title='Period Coming Soon', message='...',
+            related_id=self.period.id, related_type='period',
+            dedup_key=Notification.make_dedup_key(self.user.id, 'period_reminder', 'period', self.period.id, self.today),
+        )
+        created = generate_for_users([self.user.id], today=self.today)
+        self.assertEqual([n.notification_type for n in created], ['digest'])
+        self.assertNotIn('Period Coming Soon', created[0].message)
+        self.assertIn('Period Tomorrow', created[0].message)
+
+    def test_second_run_sends_only_new_candidates(self):
+        # First run: two days out and already logged today
+        Period.objects.filter(id=self.period.id).update(next_period_start_date=self.today + timedelta(days=2))
+        log = WellnessLog.objects.create(user=self.user, date=self.today, steps=1000)
+        first, = generate_for_users([self.user.id], today=self.today)
+        self.assertIn('Period Coming Soon', first.message)
+        self.assertEqual(len(first.digest_keys), 3)
+
+        # Later the same day: the period moved to tomorrow and the log was deleted
+        Period.objects.filter(id=self.period.id).update(next_period_start_date=self.today + timedelta(days=1))
+        log.delete()
+        second, = generate_for_users([self.user.id], today=self.today)
+        self.assertNotEqual(second.dedup_key, first.dedup_key)
+        self.assertEqual(
+            [line.split(':')[0] for line in second.message.splitlines()],
+            ['• Period Tomorrow', '• Log Your Wellness']
+        )
+
+        self.assertEqual(generate_for_users([self.user.id], today=self.today), [])
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 2)
+
+
+class BackfillConversationKeysTests(TestCase):
+
+    def test_batches(self):
+        alice = User.objects.create_user(username='alice', password='secret', email='alice@example.com')
+        bob = User.objects.create_user(username='bob', password='secret', email='bob@example.com')
+        for sender, receiver in [(alice, bob), (bob, alice)] * 3:
+            PartnerMessage.objects.create(sender=sender, receiver=receiver, message='hi')
+        PartnerMessage.objects.update(conversation_key='')
+
+        out = StringIO()
+        call_command('backfill_conversation_keys', batch_size=4, stdout=out)
+        self.assertIn('Backfilled 6 messages', out.getvalue())
+        self.assertEqual(
+            set(PartnerMessage.objects.values_list('conversation_key', flat=True)),
+            {PartnerMessage.make_conversation_key(alice.id, bob.id)}
+        )
+
+
+class UnreadCounterTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='badge', password='secret', email='badge@example.com')
+        Notification.objects.create(user=self.user, notification_type='reminder', title='t', message='m')
+        cache.delete(counter_key('notifications', self.user.id))
+        self.assertEqual(get_unread_count('notifications', self.user.id), 1)
+
+    def test_adjusted_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            adjust_unread_count('notifications', self.user.id, 2)
+            # Not visible until the transaction commits
+            self.assertEqual(get_unread_count('notifications', self.user.id), 1)
+        self.assertEqual(get_unread_count('notifications', self.user.id), 3)
+
+    def test_rolled_back_change_is_not_counted(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            adjust_unread_count('notifications', self.user.id, 2)
+        # The transaction rolled back: its callbacks never run
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(get_unread_count('notifications', self.user.id), 1)
+
+
+class ConversationPaginationTests(TestCase):
+
+    url = '/api/notifications/messages/conversation/'
+
+    def setUp(self):
+        self.me = User.objects.create_user(username='me', password='secret', email='me@example.com')
+        self.partner = User.objects.create_user(username='them', password='secret', email='them@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+        base = timezone.now() - timedelta(hours=1)
+        self.messages = []
+        for i in range(7):
+            sender, receiver = (self.partner, self.me) if i % 2 else (self.me, self.partner)
+            message = PartnerMessage.objects.create(sender=sender, receiver=receiver, message=f'message {i}')
+            # Pairs share a timestamp, so page boundaries fall inside ties
+            PartnerMessage.objects.filter(id=message.id).update(created_at=base + timedelta(minutes=i // 2))
+            self.messages.append(message)
+
+    def get(self, **params):
+        return self.client.get(self.url, {'partner_id': self.partner.id, **params})
+
+    def test_pages_walk_back_through_history(self):
+        for limit in (1, 2, 3, 7):
+            pages, cursor = [], None
+            while True:
+                data = self.get(limit=limit, **({'cursor': cursor} if cursor else {})).json()
+                ids = [m['id'] for m in data['messages']]
+                # Chronological within a page
+                self.assertEqual(ids, sorted(ids))
+                pages.append(ids)
+                if not data['has_more']:
+                    self.assertIsNone(data['next_cursor'])
+                    break
+                cursor = data['next_cursor']
+            walked = [message_id for page in reversed(pages) for message_id in page]
+            self.assertEqual(walked, [m.id for m in self.messages], f'limit={limit}')
+
+    def test_reading_a_page_marks_received_messages_up_to_it(self):
+        self.get(limit=2)
+        later = PartnerMessage.objects.create(sender=self.partner, receiver=self.me, message='after the fetch')
+        # Everything received up to the newest message shown is read (a watermark) ...
+        self.assertFalse(
+            PartnerMessage.objects.filter(receiver=self.me, is_read=False, id__lt=later.id).exists()
+        )
+        # ... but not what arrived afterwards, nor the partner's copy of what I sent
+        self.assertFalse(PartnerMessage.objects.get(id=later.id).is_read)
+        self.assertFalse(PartnerMessage.objects.filter(receiver=self.partner, is_read=True).exists())
+
+    def test_invalid_params(self):
+        self.assertEqual(self.get(cursor='garbage').status_code, 400)
+        self.assertEqual(self.get(limit='ten').status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+
+
+class RetentionTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='retained', password='secret', email='retained@example.com')
+        self.now = timezone.now()
+        self.cutoff = self.now - timedelta(days=90)
+        self.archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archive_dir)
+
+    def notification(self, days_old, is_read):
+        notification = Notification.objects.create(
+            user=self.user, notification_type='reminder', title='t', message='m', is_read=is_read
+        )
+        Notification.objects.filter(id=notification.id).update(created_at=self.now - timedelta(days=days_old))
+        return notification.id
+
+    def archived_ids(self, path):
+        # Z_SYNC_FLUSH leaves a decodable prefix even before the gzip trailer is written
+        with open(path, 'rb') as f:
+            text = zlib.decompressobj(wbits=31).decompress(f.read()).decode('utf-8')
+        return [json.loads(line)['id'] for line in text.splitlines()]
+
+    def test_archives_only_old_read_rows(self):
+        old_read = [self.notification(100 + i, True) for i in range(5)]
+        kept = [self.notification(100, False), self.notification(10, True), self.notification(10, False)]
+
+        archived, path = archive_read_notifications(self.cutoff, self.archive_dir, batch_size=2)
+        self.assertEqual(archived, 5)
+        self.assertEqual(self.archived_ids(path), sorted(old_read))
+        with gzip.open(path, 'rt') as f:
+            self.assertEqual(len(f.readlines()), 5)
+        self.assertEqual(sorted(Notification.objects.values_list('id', flat=True)), sorted(kept))
+
+    def test_rows_are_on_disk_before_delete(self):
+        ids = [self.notification(100, True) for _ in range(4)]
+        batches = []
+
+        def checked_delete(batch_ids):
+            path, = [os.path.join(self.archive_dir, name) for name in os.listdir(self.archive_dir)]
+            self.assertTrue(set(batch_ids) <= set(self.archived_ids(path)))
+            batches.append(batch_ids)
+            return delete_batch(batch_ids)
+
+        with mock.patch('notifications.retention.delete_batch', checked_delete):
+            archived, _ = archive_read_notifications(self.cutoff, self.archive_dir, batch_size=2)
+        # An exact multiple of the batch size ends on the next, empty select
+        self.assertEqual(archived, 4)
+        self.assertEqual(batches, [ids[:2], ids[2:]])
+
+    def test_nothing_to_archive_leaves_no_file(self):
+        self.notification(10, True)
+        self.assertEqual(archive_read_notifications(self.cutoff, self.archive_dir), (0, None))
+        self.assertEqual(os.listdir(self.archive_dir), [])
+
+    def test_purge_resets_unread_counters(self):
+        for days_old in (400, 400, 10):
+            self.notification(days_old, False)
+        self.notification(400, True)
+        self.assertEqual(get_unread_count('notifications', self.user.id), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            purged = purge_notifications(self.now - timedelta(days=365), batch_size=3)
+        self.assertEqual(purged, 3)
+        self.assertEqual(Notification.objects.count(), 1)
+        self.assertEqual(get_unread_count('notifications', self.user.id), 1)
+
+    def test_dry_run_deletes_nothing(self):
+        self.notification(100, True)
+        self.notification(400, False)
+        out = StringIO()
+        call_command('archive_notifications', dry_run=True, archive_dir=self.archive_dir, stdout=out)
+        self.assertIn('Would archive 1 read notifications', out.getvalue())
+        self.assertIn('Would purge 1 expired notifications', out.getvalue())
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(os.listdir(self.archive_dir), [])
+
+    def test_command(self):
+        self.notification(100, True)
+        self.notification(400, False)
+        self.notification(10, False)
+        out = StringIO()
+        call_command('archive_notifications', archive_dir=self.archive_dir, batch_size=1, stdout=out)
+        self.assertIn('✓ Archived 1 read notifications', out.getvalue())
+        self.assertIn('✓ Purged 1 expired notifications', out.getvalue())
+        self.assertEqual(Notification.objects.count(), 1)
+
+
+class ShardTests(TestCase):
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard('2/8'), (2, 8))
+        self.assertEqual(parse_shard('0/1'), (0, 1))
+        for value in ('3/3', '-1/3', 'x/2', '0/0', '1', '1/2/3', None):
+            with self.assertRaises(ValueError, msg=value):
+                parse_shard(value)
+
+    def test_invalid_shard_option(self):
+        with self.assertRaises(CommandError):
+            call_command('generate_notifications', shard='3/3', stdout=StringIO())
+
+    def test_shards_cover_every_user_once(self):
+        for i in range(11):
+            User.objects.create_user(username=f'sharded{i}', password='secret', email=f'sharded{i}@example.com')
+        users = User.objects.all()
+        everyone = list(users.order_by('id').values_list('id', flat=True))
+
+        for count in (1, 3, 4):
+            seen = []
+            for index in range(count):
+                shard_ids = [i for chunk in user_id_chunks(users, 2, (index, count)) for i in chunk]
+                self.assertTrue(all(user_id % count == index for user_id in shard_ids))
+                seen += shard_ids
+            self.assertEqual(sorted(seen), everyone)
+
+    def test_chunk_sizes(self):
+        for i in range(7):
+            User.objects.create_user(username=f'chunked{i}', password='secret', email=f'chunked{i}@example.com')
+        users = User.objects.all()
+        ids = list(users.order_by('id').values_list('id', flat=True))
+        self.assertEqual([len(chunk) for chunk in user_id_chunks(users, 3)], [3, 3, 1])
+        self.assertEqual([i for chunk in user_id_chunks(users, 3) for i in chunk], ids)
+        self.assertEqual(list(user_id_chunks(users, 7)), [ids])
+        self.assertEqual(list(user_id_chunks(users.none(), 3)), [])
+
+
+class SaveNotificationsTests(TestCase):
+
+    today = date(2026, 3, 10)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='saved', password='secret', email='saved@example.com')
+        NotificationPreference.objects.get_or_create(user=self.user)
+
+    def candidates(self):
+        return [
+            candidate(self.user.id, 'period_reminder', 'Soon', 'Period soon', day=self.today),
+            candidate(self.user.id, 'period_reminder', 'Soon', 'Period soon', day=self.today),
+            candidate(self.user.id, 'ovulation', 'Ovulation', 'Fertile window', day=self.today),
+        ]
+
+    def test_second_run_creates_nothing(self):
+        created = save_notifications(self.candidates())
+        self.assertEqual(len(created), 2)
+        self.assertTrue(all(n.id for n in created))
+        outbox = NotificationOutbox.objects.count()
+        self.assertGreater(outbox, 0)
+
+        self.assertEqual(save_notifications(self.candidates()), [])
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(NotificationOutbox.objects.count(), outbox)
+
+    def test_force_inserts_again(self):
+        save_notifications(self.candidates())
+        created = save_notifications(self.candidates(), force=True)
+        self.assertEqual(len(created), 3)
+        self.assertTrue(all(n.id and n.dedup_key is None for n in created))
+        self.assertEqual(Notification.objects.count(), 5)
+        self.assertEqual(
+            NotificationOutbox.objects.filter(notification__in=created).values('notification').distinct().count(), 3
+        )
+
+    def test_recipients_are_locked_before_the_prefilter(self):
+        with CaptureQueriesContext(connection) as queries:
+            save_notifications(self.candidates())
+        sql = [query['sql'] for query in queries]
+        lock = next(i for i, query in enumerate(sql) if 'FROM "auth_user"' in query)
+        prefilter = next(i for i, query in enumerate(sql) if 'FROM "notifications_notification"' in query)
+        self.assertLess(lock, prefilter)
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', sql[lock])
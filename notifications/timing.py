@@ -0,0 +1,42 @@
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+
+DEFAULT_TIMEZONE = 'UTC'
+
+
+def get_zone(name):
+    """ZoneInfo for an IANA name, falling back to UTC for unknown/empty names."""
+    try:
+        return ZoneInfo(name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def as_time(value):
+    """TimeField values are strings until the instance is reloaded ('09:00:00')."""
+    if isinstance(value, str):
+        return time.fromisoformat(value)
+    return value
+
+
+def next_local_time(after, local_time, tz_name, weekdays=None):
+    """
+    Next aware datetime strictly after `after` at which the wall clock in
+    `tz_name` reads `local_time`, optionally only on `weekdays`
+    (0=Monday ... 6=Sunday; empty means every day). DST gaps and overlaps
+    are resolved by zoneinfo. Returns None if no weekday is allowed.
+    """
+    tz = get_zone(tz_name)
+    local_time = as_time(local_time)
+    weekdays = {int(d) for d in weekdays or []}
+    start = after.astimezone(tz).date()
+
+    for offset in range(8):
+        day = start + timedelta(days=offset)
+        if weekdays and day.weekday() not in weekdays:
+            continue
+        fire_at = datetime.combine(day, local_time, tzinfo=tz)
+        if fire_at > after:
+            return fire_at
+    return None
@@ -4,7 +4,8 @@ from .views import (
     NotificationViewSet,
     PartnerMessageViewSet,
     PushTokenViewSet,
-    NotificationPreferenceViewSet
+    NotificationPreferenceViewSet,
+    notification_stream
 )
 
 router = DefaultRouter()
@@ -14,5 +15,6 @@ router.register(r'push-tokens', PushTokenViewSet, basename='push-token')
 router.register(r'preferences', NotificationPreferenceViewSet, basename='notification-preference')
 
 urlpatterns = [
+    path('stream/', notification_stream, name='notification-stream'),
     path('', include(router.urls)),
 ]
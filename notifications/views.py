@@ -1,9 +1,23 @@
+import base64
+import binascii
+from datetime import datetime
 from rest_framework import viewsets, status, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIRequest
 from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from .counters import adjust_unread_count, get_unread_count, reset_unread_counts, set_unread_count
+from .engine import save_notifications
+from .realtime import (
+    STREAM_TICKET_SECONDS, event_stream, issue_stream_ticket, publish_partner_message, redeem_stream_ticket
+)
 from .models import Notification, PartnerMessage, PushNotificationToken, NotificationPreference
 from .serializers import (
     NotificationSerializer,
@@ -13,6 +27,26 @@ from .serializers import (
 )
 
 
+# Conversation page sizes
+CONVERSATION_PAGE_SIZE = 50
+CONVERSATION_MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(message):
+    """Opaque keyset cursor pointing at (created_at, id) of a message."""
+    raw = f"{message.created_at.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, message_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(message_id)
+    except (UnicodeError, binascii.Error, TypeError):
+        raise ValueError("Invalid cursor")
+
+
 class NotificationViewSet(viewsets.ModelViewSet):
     """ViewSet for managing notifications"""
     serializer_class = NotificationSerializer
@@ -21,6 +55,17 @@ class NotificationViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return Notification.objects.filter(user=self.request.user)
     
+    def perform_update(self, serializer):
+        serializer.save()
+        # is_read may have been changed through the regular update endpoints
+        reset_unread_counts('notifications', [self.request.user.id])
+    
+    def perform_destroy(self, instance):
+        was_unread = not instance.is_read
+        instance.delete()
+        if was_unread:
+            adjust_unread_count('notifications', self.request.user.id, -1)
+    
     @action(detail=False, methods=['get'])
     def unread(self, request):
         """Get unread notifications"""
@@ -31,6 +76,21 @@ class NotificationViewSet(viewsets.ModelViewSet):
             'notifications': serializer.data
         })
     
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        """Unread badge count, answered from the cached counter"""
+        return Response({
+            'count': get_unread_count('notifications', request.user.id)
+        })
+    
+    @action(detail=False, methods=['post'])
+    def stream_ticket(self, request):
+        """Short-lived, single-use ticket for opening the notification stream"""
+        return Response({
+            'ticket': issue_stream_ticket(request.user.id),
+            'expires_in': STREAM_TICKET_SECONDS
+        }, status=status.HTTP_201_CREATED)
+    
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
         """Mark all notifications as read"""
@@ -38,6 +98,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
             is_read=True,
             read_at=timezone.now()
         )
+        set_unread_count('notifications', request.user.id, 0)
         return Response({
             'status': 'success',
             'marked_read': updated
@@ -64,7 +125,18 @@ class PartnerMessageViewSet(viewsets.ModelViewSet):
         user = self.request.user
         return PartnerMessage.objects.filter(
             Q(sender=user) | Q(receiver=user)
-        )
+        ).select_related('sender', 'receiver')
+    
+    def perform_update(self, serializer):
+        message = serializer.save()
+        reset_unread_counts('messages', [message.receiver_id])
+    
+    def perform_destroy(self, instance):
+        was_unread = not instance.is_read
+        receiver_id = instance.receiver_id
+        instance.delete()
+        if was_unread:
+            adjust_unread_count('messages', receiver_id, -1)
     
     def perform_create(self, serializer):
         """Send a message to partner"""
@@ -81,23 +153,47 @@ class PartnerMessageViewSet(viewsets.ModelViewSet):
             
             # Save message
             message = serializer.save(sender=user)
+            adjust_unread_count('messages', message.receiver_id, 1)
+            publish_partner_message(message)
             
-            # Create notification for receiver
-            Notification.objects.create(
+            # Create notification for receiver (and queue its email/push delivery)
+            save_notifications([Notification(
                 user_id=receiver_id,
                 notification_type='partner_message',
                 title='New message from partner',
                 message=f"{user.username} sent you a message",
                 related_id=message.id,
-                related_type='partner_message'
-            )
+                related_type='partner_message',
+                dedup_key=Notification.make_dedup_key(receiver_id, 'partner_message', 'partner_message', message.id)
+            )])
             
         except Exception as e:
             raise serializers.ValidationError(str(e))
     
+    def mark_read_up_to(self, conversation_key, up_to_id):
+        """
+        Read-receipt watermark: everything the user received in this
+        conversation up to `up_to_id` is read. Only still-unread rows are
+        touched, found through the (receiver, is_read) index.
+        """
+        user = self.request.user
+        marked = PartnerMessage.objects.filter(
+            conversation_key=conversation_key,
+            receiver=user,
+            is_read=False,
+            id__lte=up_to_id
+        ).update(is_read=True, read_at=timezone.now())
+        adjust_unread_count('messages', user.id, -marked)
+        return marked
+    
     @action(detail=False, methods=['get'])
     def conversation(self, request):
-        """Get conversation with partner"""
+        """
+        Get conversation with partner, newest page first.
+        Query params: partner_id (required), limit (default 50, max 200),
+        cursor (next_cursor of the previous page, for older messages).
+        Messages in a page are in chronological order.
+        """
         partner_id = request.query_params.get('partner_id')
         
         if not partner_id:
@@ -106,23 +202,76 @@ class PartnerMessageViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        messages = self.get_queryset().filter(
-            Q(sender=request.user, receiver_id=partner_id) |
-            Q(sender_id=partner_id, receiver=request.user)
-        ).order_by('created_at')
+        try:
+            limit = int(request.query_params.get('limit', CONVERSATION_PAGE_SIZE))
+            limit = max(1, min(limit, CONVERSATION_MAX_PAGE_SIZE))
+            conversation_key = PartnerMessage.make_conversation_key(request.user.id, partner_id)
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'partner_id and limit must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Mark received messages as read
-        messages.filter(receiver=request.user, is_read=False).update(
-            is_read=True,
-            read_at=timezone.now()
-        )
+        messages = PartnerMessage.objects.filter(
+            conversation_key=conversation_key
+        ).select_related('sender', 'receiver').order_by('-created_at', '-id')
+        
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            try:
+                created_at, message_id = decode_cursor(cursor)
+            except ValueError:
+                return Response(
+                    {'error': 'Invalid cursor'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            messages = messages.filter(
+                Q(created_at__lt=created_at) |
+                Q(created_at=created_at, id__lt=message_id)
+            )
+        
+        page = list(messages[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
         
-        serializer = self.get_serializer(messages, many=True)
+        # Mark received messages as read, up to the newest one on this page
+        if page:
+            marked = self.mark_read_up_to(conversation_key, max(m.id for m in page))
+            if marked:
+                for message in page:
+                    if message.receiver_id == request.user.id and not message.is_read:
+                        message.is_read = True
+                        message.read_at = timezone.now()
+        
+        page.reverse()
+        serializer = self.get_serializer(page, many=True)
         return Response({
-            'count': messages.count(),
+            'count': len(page),
+            'has_more': has_more,
+            'next_cursor': encode_cursor(page[0]) if has_more else None,
             'messages': serializer.data
         })
     
+    @action(detail=False, methods=['post'])
+    def mark_conversation_read(self, request):
+        """Mark messages from partner as read up to message id `up_to_id`"""
+        partner_id = request.data.get('partner_id')
+        up_to_id = request.data.get('up_to_id')
+        
+        try:
+            conversation_key = PartnerMessage.make_conversation_key(request.user.id, partner_id)
+            up_to_id = int(up_to_id)
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'partner_id and up_to_id are required integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        return Response({
+            'status': 'success',
+            'marked_read': self.mark_read_up_to(conversation_key, up_to_id)
+        })
+    
     @action(detail=False, methods=['get'])
     def unread(self, request):
         """Get unread messages"""
@@ -135,6 +284,13 @@ class PartnerMessageViewSet(viewsets.ModelViewSet):
             'count': unread.count(),
             'messages': serializer.data
         })
+    
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        """Unread message badge count, answered from the cached counter"""
+        return Response({
+            'count': get_unread_count('messages', request.user.id)
+        })
 
 
 class PushTokenViewSet(viewsets.ModelViewSet):
@@ -187,3 +343,42 @@ class NotificationPreferenceViewSet(viewsets.ViewSet):
             return Response(serializer.data)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _header_user_id(request):
+    """User id from a Bearer access token in the Authorization header, or None."""
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        return None
+    try:
+        return AccessToken(header[len('Bearer '):])[jwt_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return None
+
+
+async def notification_stream(request):
+    """
+    Server-sent events with new notifications ('notification') and partner
+    messages ('message') for the authenticated user. Browsers pass a ticket
+    from POST notifications/stream_ticket/ as ?ticket=; other clients may
+    send their access token in the Authorization header.
+
+    Only served under ASGI (`uvicorn period_tracker.asgi:application`, the
+    Dockerfile default): under WSGI each open stream would hold a worker
+    thread for as long as the client stays connected.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'The notification stream requires an ASGI server'}, status=501)
+
+    if 'ticket' in request.GET:
+        user_id = await redeem_stream_ticket(request.GET['ticket'])
+    else:
+        user_id = _header_user_id(request)
+    if user_id is None or not await User.objects.filter(id=user_id, is_active=True).aexists():
+        return JsonResponse({'error': 'Authentication credentials were not provided or are invalid.'}, status=401)
+
+    response = StreamingHttpResponse(event_stream(user_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -3,6 +3,12 @@ ASGI config for period_tracker project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server to get the real-time notification stream
+(/api/notifications/stream/), which holds connections open without a
+thread each:
+
+    uvicorn period_tracker.asgi:application --host 0.0.0.0 --port 8000 --workers 4
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -31,6 +31,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "corsheaders",
     "djoser",
@@ -109,6 +110,10 @@ CACHES = {
     }
 }
 
+# Pub/sub for the real-time notification stream (notifications/realtime.py)
+REALTIME_REDIS_URL = os.getenv("REALTIME_REDIS_URL", CACHES["default"]["LOCATION"])
+REALTIME_REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", None)
+
 # Use Redis for session storage (optional but recommended)
 SESSION_ENGINE = "django.contrib.sessions.backends.cache"
 SESSION_CACHE_ALIAS = "default"
@@ -191,6 +196,35 @@ CORS_ALLOW_HEADERS = [
     "x-requested-with",
 ]
 
+# --- Notification delivery (notifications/providers.py) ---
+# "smtp" / "http" for real delivery, "stub" to benchmark workers offline
+NOTIFICATION_PROVIDERS = {
+    "email": os.getenv("NOTIFICATION_EMAIL_PROVIDER", "smtp"),
+    "push": os.getenv("NOTIFICATION_PUSH_PROVIDER", "http"),
+}
+PUSH_GATEWAY_URL = os.getenv("PUSH_GATEWAY_URL", "")
+PUSH_GATEWAY_API_KEY = os.getenv("PUSH_GATEWAY_API_KEY", "")
+
+# Cold storage for archive_notifications (gzipped NDJSON files)
+NOTIFICATION_ARCHIVE_DIR = os.getenv("NOTIFICATION_ARCHIVE_DIR", os.path.join(BASE_DIR, "archive", "notifications"))
+
+# OpenFDA drug label search (medications.openfda)
+OPENFDA_URL = os.getenv("OPENFDA_URL", "https://api.fda.gov/drug/label.json")
+OPENFDA_TIMEOUT = float(os.getenv("OPENFDA_TIMEOUT", "5"))
+OPENFDA_CACHE_TTL = int(os.getenv("OPENFDA_CACHE_TTL", str(7 * 24 * 60 * 60)))
+OPENFDA_NEGATIVE_CACHE_TTL = int(os.getenv("OPENFDA_NEGATIVE_CACHE_TTL", str(24 * 60 * 60)))
+# Search only the local index built by build_openfda_index, never the API
+OPENFDA_OFFLINE = os.getenv("OPENFDA_OFFLINE", "False") == "True"
+# Pooled connections per event loop for the async client
+OPENFDA_MAX_CONNECTIONS = int(os.getenv("OPENFDA_MAX_CONNECTIONS", "20"))
+# Circuit breaker: open after this many consecutive failed or slow calls,
+# answer locally while open, then retry one call after the reset period
+OPENFDA_BREAKER_FAILURES = int(os.getenv("OPENFDA_BREAKER_FAILURES", "5"))
+OPENFDA_BREAKER_SLOW_SECONDS = float(os.getenv("OPENFDA_BREAKER_SLOW_SECONDS", "2"))
+OPENFDA_BREAKER_RESET_SECONDS = float(os.getenv("OPENFDA_BREAKER_RESET_SECONDS", "30"))
+# Write OpenFDA search results to the catalog on a background thread (search answers 202)
+MEDICATION_INGEST_IN_BACKGROUND = os.getenv("MEDICATION_INGEST_IN_BACKGROUND", "False") == "True"
+
 # Logging Configuration
 LOGGING = {
     "version": 1,
@@ -241,6 +275,10 @@ LOGGING = {
             "level": "INFO",
             "propagate": False,
         },
+        # One INFO line per request from the async OpenFDA client otherwise
+        "httpx": {
+            "level": "WARNING",
+        },
     },
 }
 
@@ -0,0 +1,180 @@
+import csv
+import io
+import itertools
+import json
+import zipfile
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from cycle_tracker.models import Period, WellnessLog, Reminder
+from medications.models import UserMedication, MedicationLog, MedicationReminder
+from ml_suggestions.models import AISuggestion
+from notifications.models import Notification, PartnerMessage, NotificationPreference
+
+
+# Rows fetched per database round trip while streaming
+EXPORT_CHUNK_SIZE = 2000
+
+# Rows written between two yields of the ZIP stream
+ZIP_FLUSH_ROWS = 500
+
+# Stream items pulled per sync_to_async hop when serving under ASGI
+ASYNC_STREAM_BATCH = 200
+
+EXPORT_FORMATS = ('ndjson', 'csv', 'zip')
+
+
+def _user_filter(user):
+    return Q(user=user)
+
+
+def _partner_message_filter(user):
+    return Q(sender=user) | Q(receiver=user)
+
+
+# table name -> (model, filter builder, extra related fields)
+EXPORT_TABLES = {
+    'periods': (Period, _user_filter, []),
+    'wellness_logs': (WellnessLog, _user_filter, []),
+    'reminders': (Reminder, _user_filter, []),
+    'medications': (UserMedication, _user_filter, ['medication__name', 'medication__generic_name']),
+    'medication_logs': (MedicationLog, _user_filter, []),
+    'medication_reminders': (MedicationReminder, _user_filter, []),
+    'notifications': (Notification, _user_filter, []),
+    'notification_preferences': (NotificationPreference, _user_filter, []),
+    'partner_messages': (PartnerMessage, _partner_message_filter, []),
+    'ai_suggestions': (AISuggestion, _user_filter, []),
+}
+
+
+def export_columns(model, extra_fields):
+    """Every concrete column except the owning user, plus any related fields."""
+    return [
+        f.attname for f in model._meta.concrete_fields
+        if f.name != 'user'
+    ] + extra_fields
+
+
+def table_columns(table):
+    model, _, extra_fields = EXPORT_TABLES[table]
+    return export_columns(model, extra_fields)
+
+
+def iter_table_rows(user, table, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield (columns, row_tuple) for one table without loading it into memory."""
+    model, build_filter, extra_fields = EXPORT_TABLES[table]
+    columns = export_columns(model, extra_fields)
+    rows = (
+        model.objects.filter(build_filter(user))
+        .order_by('pk')
+        .values_list(*columns)
+        .iterator(chunk_size=chunk_size)
+    )
+    for row in rows:
+        yield columns, row
+
+
+def iter_ndjson(user, tables=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """One JSON object per line: {"table": ..., "data": {...}}."""
+    for table in tables or EXPORT_TABLES:
+        for columns, row in iter_table_rows(user, table, chunk_size):
+            yield json.dumps(
+                {'table': table, 'data': dict(zip(columns, row))},
+                cls=DjangoJSONEncoder
+            ) + '\n'
+
+
+class Echo:
+    """File-like object whose write() just returns the value, for streaming csv.writer."""
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls=DjangoJSONEncoder)
+    return value
+
+
+def iter_csv(user, table, chunk_size=EXPORT_CHUNK_SIZE):
+    """A single table as CSV, header first."""
+    writer = csv.writer(Echo())
+    header_written = False
+
+    for columns, row in iter_table_rows(user, table, chunk_size):
+        if not header_written:
+            yield writer.writerow(columns)
+            header_written = True
+        yield writer.writerow([_csv_value(v) for v in row])
+
+    if not header_written:
+        yield writer.writerow(table_columns(table))
+
+
+class _StreamBuffer:
+    """Write-only sink for ZipFile; the generator drains it between rows."""
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_zip(user, tables=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Deflate-compressed ZIP with one CSV per table, produced as a byte stream.
+    The buffer is drained every ZIP_FLUSH_ROWS rows so memory stays bounded.
+    """
+    buffer = _StreamBuffer()
+
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for table in tables or EXPORT_TABLES:
+            with archive.open(f'{table}.csv', 'w', force_zip64=True) as entry:
+                text = io.TextIOWrapper(entry, encoding='utf-8', newline='')
+                for i, line in enumerate(iter_csv(user, table, chunk_size)):
+                    text.write(line)
+                    if i % ZIP_FLUSH_ROWS == 0:
+                        text.flush()
+                        yield buffer.drain()
+                text.flush()
+                text.detach()
+            yield buffer.drain()
+
+    yield buffer.drain()
+
+
+async def aiter_export(iterator, batch_size=None):
+    """
+    Drive one of the generators above from an ASGI response.
+
+    Django buffers a sync streaming iterator under ASGI with sync_to_async(list),
+    which would build the whole export in memory. This pulls batch_size items
+    per hop instead; every hop runs on the same thread, so the open cursor stays valid.
+    """
+    batch_size = batch_size or ASYNC_STREAM_BATCH
+    next_batch = sync_to_async(lambda: list(itertools.islice(iterator, batch_size)))
+    try:
+        while batch := await next_batch():
+            for item in batch:
+                yield item
+    finally:
+        await sync_to_async(iterator.close)()
+
+
+def export_filename(user, export_format, table=None, today=None):
+    name = f"rithmo-export-{user.username}"
+    if table:
+        name += f"-{table}"
+    if today:
+        name += f"-{today:%Y%m%d}"
+    return f"{name}.{export_format}"
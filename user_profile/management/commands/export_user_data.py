@@ -0,0 +1,77 @@
+import gzip
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.utils import timezone
+from user_profile.export import EXPORT_TABLES, export_filename, iter_ndjson, iter_zip
+
+
+class Command(BaseCommand):
+    help = 'Export all data of one account to a compressed file on disk (ZIP of CSVs or gzipped NDJSON)'
+
+    def add_arguments(self, parser):
+        user_group = parser.add_mutually_exclusive_group(required=True)
+        user_group.add_argument(
+            '--user-id',
+            type=int,
+            help='ID of the user to export',
+        )
+        user_group.add_argument(
+            '--username',
+            help='Username of the user to export',
+        )
+        parser.add_argument(
+            '--format',
+            choices=['zip', 'ndjson'],
+            default='zip',
+            help='zip: one CSV per table (default), ndjson: gzipped JSON lines',
+        )
+        parser.add_argument(
+            '--output',
+            help='Output file path (default: rithmo-export-<username>-<date>.<ext> in the current directory)',
+        )
+        parser.add_argument(
+            '--table',
+            action='append',
+            choices=list(EXPORT_TABLES),
+            help='Only export this table (can be repeated)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            if options['user_id']:
+                user = User.objects.get(id=options['user_id'])
+            else:
+                user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError('User not found')
+
+        export_format = options['format']
+        tables = options['table']
+        output = options['output']
+        if not output:
+            output = export_filename(user, export_format, today=timezone.localdate())
+            if export_format == 'ndjson':
+                output += '.gz'
+
+        started = time.monotonic()
+        written = 0
+
+        if export_format == 'zip':
+            with open(output, 'wb') as f:
+                for chunk in iter_zip(user, tables):
+                    f.write(chunk)
+                    written += len(chunk)
+        else:
+            with gzip.open(output, 'wt', encoding='utf-8') as f:
+                for line in iter_ndjson(user, tables):
+                    f.write(line)
+                    written += 1
+
+        elapsed = time.monotonic() - started
+        unit = 'bytes' if export_format == 'zip' else 'rows'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'✓ Exported {user.username} to {output} ({written} {unit}, {elapsed:.1f}s)'
+            )
+        )
@@ -1,3 +1,121 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import zipfile
+from datetime import date, timedelta
+from unittest import mock
+from django.contrib.auth.models import User
+from django.test import AsyncClient, TestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from cycle_tracker.models import WellnessLog
+from . import export, views
 
-# Create your tests here.
+
+class ExportStreamingTests(TestCase):
+    url = '/api/user/export/'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='streamed', password='secret', email='streamed@example.com')
+        for i in range(5):
+            WellnessLog.objects.create(user=self.user, date=date(2026, 1, 1) + timedelta(days=i), steps=1000 * i)
+        self.pulled = 0
+
+    def counting_ndjson(self, *args, **kwargs):
+        for line in export.iter_ndjson(*args, **kwargs):
+            self.pulled += 1
+            yield line
+
+    async def test_asgi_export_is_consumed_incrementally(self):
+        token = str(AccessToken.for_user(self.user))
+        with mock.patch.object(views, 'iter_ndjson', self.counting_ndjson), \
+                mock.patch.object(export, 'ASYNC_STREAM_BATCH', 2):
+            response = await AsyncClient().get(
+                self.url, {'table': 'wellness_logs'}, headers={'Authorization': f'Bearer {token}'}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.is_async)
+
+            content = aiter(response.streaming_content)
+            first = await anext(content)
+            self.assertIn(b'"wellness_logs"', first)
+            # Only the first batch has been pulled from the query
+            self.assertEqual(self.pulled, 2)
+
+            rest = [part async for part in content]
+        self.assertEqual(len(rest), 4)
+        self.assertEqual(self.pulled, 5)
+
+
+class UserDataExportViewTests(TestCase):
+    url = '/api/user/export/'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='exporter', password='secret', email='exporter@example.com')
+        self.other = User.objects.create_user(username='other', password='secret', email='other@example.com')
+        WellnessLog.objects.create(user=self.user, date=date(2026, 1, 1), steps=1234)
+        WellnessLog.objects.create(user=self.other, date=date(2026, 1, 1), steps=999)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_ndjson(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn('rithmo-export-exporter-', response['Content-Disposition'])
+        rows = [json.loads(line) for line in self.body(response).decode().splitlines()]
+        wellness = [row['data'] for row in rows if row['table'] == 'wellness_logs']
+        self.assertEqual([(row['date'], row['steps']) for row in wellness], [('2026-01-01', 1234)])
+        self.assertNotIn('user_id', wellness[0])
+
+    def test_csv(self):
+        response = self.client.get(self.url, {'export_format': 'csv', 'table': 'wellness_logs'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(self.body(response).decode())))
+        self.assertEqual([(row['date'], row['steps']) for row in rows], [('2026-01-01', '1234')])
+
+        # An empty table still has its header
+        response = self.client.get(self.url, {'export_format': 'csv', 'table': 'periods'})
+        self.assertEqual(self.body(response).decode().splitlines(), [','.join(export.table_columns('periods'))])
+
+    def test_zip(self):
+        response = self.client.get(self.url, {'export_format': 'zip'})
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(self.body(response))) as archive:
+            self.assertEqual(archive.namelist(), [f'{table}.csv' for table in export.EXPORT_TABLES])
+            rows = list(csv.DictReader(io.StringIO(archive.read('wellness_logs.csv').decode())))
+        self.assertEqual([row['steps'] for row in rows], ['1234'])
+
+    def test_invalid_parameters(self):
+        for params in (
+            {'export_format': 'xml'},
+            {'table': 'auth_user'},
+            {'export_format': 'csv'},
+        ):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('error', response.data)
+
+    def test_user_id_is_staff_only(self):
+        response = self.client.get(self.url, {'user_id': self.other.id})
+        self.assertEqual(response.status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(self.url, {'export_format': 'csv', 'table': 'wellness_logs', 'user_id': self.other.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('rithmo-export-other-wellness_logs', response['Content-Disposition'])
+        self.assertIn(',999,', self.body(response).decode())
+
+        for user_id in (0, 'abc'):
+            self.assertEqual(self.client.get(self.url, {'user_id': user_id}).status_code, 404)
+
+    def test_requires_authentication(self):
+        self.assertEqual(APIClient().get(self.url).status_code, 401)
+
+    def test_wsgi_export_streams_a_sync_iterator(self):
+        response = self.client.get(self.url)
+        self.assertFalse(response.is_async)
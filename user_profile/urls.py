@@ -1,8 +1,9 @@
 from django.urls import path
-from .views import UserProfileView, UserInvitationView, RemovePartherView
+from .views import UserProfileView, UserInvitationView, RemovePartherView, UserDataExportView
 
 urlpatterns = [
     path('profile/', UserProfileView.as_view(), name="user-profile"),
     path('invitation/', UserInvitationView.as_view(), name="user-invitation"),
-    path('partner/remove/',RemovePartherView.as_view(),name="remove-partner")
+    path('partner/remove/',RemovePartherView.as_view(),name="remove-partner"),
+    path('export/', UserDataExportView.as_view(), name="user-data-export"),
 ]
@@ -3,6 +3,11 @@ from rest_framework.response import Response
 from .models import UserProfile
 from .serializers import UserProfileSerializer , UserInvitationSerializer, RemovePartnerView
 from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from .export import EXPORT_FORMATS, EXPORT_TABLES, aiter_export, export_filename, iter_csv, iter_ndjson, iter_zip
 import random
 
 class UserProfileView(generics.RetrieveUpdateAPIView):
@@ -123,6 +128,69 @@ class UserInvitationView(generics.ListCreateAPIView):
                 }, status=status.HTTP_201_CREATED)
 
 
+class UserDataExportView(generics.GenericAPIView):
+    """
+    Stream a full export of the user's account data.
+
+    GET ?export_format=ndjson (default): every table, one JSON object per line
+    GET ?export_format=csv&table=<name>: a single table as CSV
+    GET ?export_format=zip: every table as CSV inside a compressed archive
+    Staff can pass ?user_id= to export another account (support requests).
+    Under ASGI the body is an async iterator so it is not buffered before sending.
+    (`format` itself is reserved by DRF for renderer selection.)
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    CONTENT_TYPES = {
+        'ndjson': 'application/x-ndjson',
+        'csv': 'text/csv',
+        'zip': 'application/zip',
+    }
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.query_params.get('export_format', 'ndjson')
+        table = request.query_params.get('table')
+
+        if export_format not in EXPORT_FORMATS:
+            return Response({
+                "error": f"export_format must be one of: {', '.join(EXPORT_FORMATS)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if table and table not in EXPORT_TABLES:
+            return Response({
+                "error": f"table must be one of: {', '.join(EXPORT_TABLES)}"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        if export_format == 'csv' and not table:
+            return Response({
+                "error": "table is required for CSV exports"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+        user_id = request.query_params.get('user_id')
+        if user_id:
+            if not request.user.is_staff:
+                return Response({"error": "Only staff can export other accounts"}, status=status.HTTP_403_FORBIDDEN)
+            try:
+                user = User.objects.get(id=user_id)
+            except (User.DoesNotExist, ValueError):
+                return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        tables = [table] if table else None
+        if export_format == 'csv':
+            content = iter_csv(user, table)
+        elif export_format == 'zip':
+            content = iter_zip(user, tables)
+        else:
+            content = iter_ndjson(user, tables)
+        if isinstance(request._request, ASGIRequest):
+            content = aiter_export(content)
+
+        response = StreamingHttpResponse(content, content_type=self.CONTENT_TYPES[export_format])
+        filename = export_filename(user, export_format, table, timezone.localdate())
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
 class RemovePartherView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = RemovePartnerView